@@ -11,11 +11,14 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'REHEARTEN.settings')
+# JSON API dùng view async + driver MongoDB async (đặt ASYNC_VIEWS=False để dùng view đồng bộ)
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 # Simple ASGI application without WebSocket
 application = get_asgi_application()
 
-# WebSocket support removed
+# WebSocket support removed - admin live updates use Server-Sent Events instead
+# (/api/events/, accounts/events.py)
 # from channels.routing import ProtocolTypeRouter, URLRouter
 # from channels.auth import AuthMiddlewareStack
 # import accounts.routing
@@ -3,7 +3,10 @@ import mongoengine
 import os
 from dotenv import load_dotenv
 import ssl
+import tempfile
 import certifi
+from accounts.monitoring import command_listener
+from accounts.pool import pool_options, pool_listener
 
 # Load environment variables from .env file
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -34,12 +37,11 @@ def connect_mongodb_atlas():
             serverSelectionTimeoutMS=30000,
             connectTimeoutMS=30000,
             socketTimeoutMS=30000,
-            maxPoolSize=10,
-            minPoolSize=1,
-            maxIdleTimeMS=30000,
+            **MONGODB_POOL_OPTIONS,
             retryWrites=True,
             retryReads=True,
-            authMechanism='SCRAM-SHA-1'
+            authMechanism='SCRAM-SHA-1',
+            event_listeners=[command_listener, pool_listener],
         )
         print("✅ Connected with full SSL verification!")
         return True
@@ -59,12 +61,11 @@ def connect_mongodb_atlas():
             serverSelectionTimeoutMS=30000,
             connectTimeoutMS=30000,
             socketTimeoutMS=30000,
-            maxPoolSize=10,
-            minPoolSize=1,
-            maxIdleTimeMS=30000,
+            **MONGODB_POOL_OPTIONS,
             retryWrites=True,
             retryReads=True,
-            authMechanism='SCRAM-SHA-1'
+            authMechanism='SCRAM-SHA-1',
+            event_listeners=[command_listener, pool_listener],
         )
         print("✅ Connected with relaxed SSL settings!")
         return True
@@ -81,11 +82,10 @@ def connect_mongodb_atlas():
             serverSelectionTimeoutMS=30000,
             connectTimeoutMS=30000,
             socketTimeoutMS=30000,
-            maxPoolSize=10,
-            minPoolSize=1,
-            maxIdleTimeMS=30000,
+            **MONGODB_POOL_OPTIONS,
             retryWrites=True,
-            retryReads=True
+            retryReads=True,
+            event_listeners=[command_listener, pool_listener],
         )
         print("✅ Connected with minimal SSL configuration!")
         return True
@@ -97,6 +97,64 @@ def connect_mongodb_atlas():
         return False
 
 
+def connect_mongodb_local():
+    """
+    Connect to a local mongod (benchmark / offline development), no TLS.
+    """
+    connection_string = os.getenv('MONGODB_LOCAL_URI', 'mongodb://localhost:27017')
+    db_name = os.getenv('MONGODB_LOCAL_DB', 'ReHearten_bench')
+    try:
+        print(f"🖥️ Connecting to local MongoDB at {connection_string}...")
+        mongoengine.connect(
+            db=db_name,
+            host=connection_string,
+            alias='default',
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=5000,
+            **MONGODB_POOL_OPTIONS,
+            event_listeners=[command_listener, pool_listener],
+        )
+        mongoengine.get_db().command('ping')
+        print("✅ Connected to local MongoDB!")
+        return True
+    except Exception as e:
+        print(f"❌ Local MongoDB connection failed: {e}")
+        return False
+
+
+def connect_mongodb_mock():
+    """
+    In-memory MongoDB stand-in (mongomock) - no server needed.
+
+    Data only lives in the current process and command monitoring events are
+    not emitted, so numbers measured against it exclude database round trips.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        print("❌ MONGODB_TARGET=mock requires mongomock: pip install mongomock")
+        return False
+
+    # mongomock không hỗ trợ capped collection (slow_queries, audit_log) - tạo collection thường
+    create_collection = mongomock.database.Database.create_collection
+
+    def create_uncapped_collection(self, name, **kwargs):
+        for option in ('capped', 'size', 'max'):
+            kwargs.pop(option, None)
+        return create_collection(self, name, **kwargs)
+
+    mongomock.database.Database.create_collection = create_uncapped_collection
+    db_name = os.getenv('MONGODB_LOCAL_DB', 'ReHearten_bench')
+    mongoengine.connect(
+        db=db_name,
+        host='mongodb://localhost',
+        alias='default',
+        mongo_client_class=mongomock.MongoClient,
+    )
+    print("🧪 Using in-memory MongoDB stand-in (mongomock)")
+    return True
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -125,11 +183,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'accounts.middleware.RequestIdMiddleware',  # Request id cho log JSON (X-Request-ID)
+    'accounts.middleware.RequestMetricsMiddleware',  # Histogram độ trễ theo view cho /api/system-status/
+    'accounts.middleware.MongoQueryStatsMiddleware',  # Đếm lệnh MongoDB mỗi request (Server-Timing)
+    'accounts.middleware.AnonymousPageCacheMiddleware',  # Trang công khai cho khách: trả từ cache, trước session
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'accounts.process_login_gg.SyncCustomSessionMiddleware',  # Đồng bộ session custom sau Google login
+    'accounts.middleware.SamplingProfilerMiddleware',  # Profile theo yêu cầu (PROFILER_ENABLED)
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.process_login_gg.SyncCustomSessionMiddleware',  # Đồng bộ session custom sau Google login (cần request.user)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -140,19 +203,88 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.context_processors.fragment_cache',
+            ],
+            # Template đã parse được giữ trong bộ nhớ (base.html ~2000 dòng).
+            # Khi DEBUG, runserver tự xóa cache này mỗi khi file template thay đổi
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
 ]
 
+# Cache fragment template (accounts/fragments.py), tách khỏi cache 'default'
+# đang giữ session để fragment không đẩy session ra ngoài
+# default (session) và fragments dùng chung giữa các worker trên cùng máy qua file
+# memory-mapped (accounts/shmcache.py); SHARED_CACHE=False (hoặc Windows) dùng LocMem của từng process
+SHARED_CACHE = os.getenv('SHARED_CACHE', 'True').lower() == 'true' and os.name == 'posix'
+SHARED_CACHE_DIR = os.getenv('SHARED_CACHE_DIR', '') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'rehearten-cache')
+
+
+def cache_backend(alias, max_entries, slot_size):
+    if not SHARED_CACHE:
+        return {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': alias,
+            'OPTIONS': {'MAX_ENTRIES': max_entries},
+        }
+    return {
+        'BACKEND': 'accounts.shmcache.SharedMemoryCache',
+        'LOCATION': os.path.join(SHARED_CACHE_DIR, alias),
+        'OPTIONS': {'MAX_ENTRIES': max_entries, 'SLOT_SIZE': slot_size},
+    }
+
+
+CACHES = {
+    # Mỗi file ~17 MB: MAX_ENTRIES x (SLOT_SIZE + 32 byte); fragment admin_dashboard ~11 KB
+    'default': cache_backend('default', int(os.getenv('SHARED_CACHE_MAX_ENTRIES', '16384')),
+                             int(os.getenv('SHARED_CACHE_SLOT_SIZE', '1024'))),
+    'fragments': cache_backend('fragments', int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', '1024')),
+                               int(os.getenv('FRAGMENT_CACHE_SLOT_SIZE', '16384'))),
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+        'OPTIONS': {'MAX_ENTRIES': 200},
+    },
+}
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', '60'))
+
+# Cache toàn trang cho khách chưa đăng nhập (AnonymousPageCacheMiddleware, tắt khi DEBUG).
+# Key có DEPLOY_VERSION (mặc định: git revision) nên deploy mới không dùng trang cũ
+ANON_PAGE_CACHE_PATHS = ('/',)
+ANON_PAGE_CACHE_TIMEOUT = int(os.getenv('ANON_PAGE_CACHE_TIMEOUT', '300'))
+DEPLOY_VERSION = os.getenv('DEPLOY_VERSION', '')
+
 WSGI_APPLICATION = 'REHEARTEN.wsgi.application'
 
+# JSON API async dùng driver MongoDB async (accounts/async_views.py); asgi.py bật mặc định.
+# Dưới WSGI giữ False: view async sẽ phải chạy event loop riêng cho từng request
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
+# Server-Sent Events cho admin (/api/events/, chỉ chạy với ASGI + ASYNC_VIEWS) - accounts/events.py
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', '500'))  # mỗi worker
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', '100'))  # sự kiện chờ gửi mỗi client; đầy thì ngắt client
+SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+SSE_IDLE_TIMEOUT_SECONDS = float(os.getenv('SSE_IDLE_TIMEOUT_SECONDS', '60'))
+SSE_MAX_AGE_SECONDS = float(os.getenv('SSE_MAX_AGE_SECONDS', '300'))
+SSE_POLL_SECONDS = float(os.getenv('SSE_POLL_SECONDS', '5'))  # chu kỳ phát session_count
+
+# Đồng bộ tăng dần /api/users/changes/?since=<token> (accounts/changes.py)
+USER_SYNC_PAGE_SIZE = int(os.getenv('USER_SYNC_PAGE_SIZE', '500'))
+USER_SYNC_MAX_PAGE_SIZE = int(os.getenv('USER_SYNC_MAX_PAGE_SIZE', '1000'))
+USER_SYNC_LAG_SECONDS = float(os.getenv('USER_SYNC_LAG_SECONDS', '2'))  # bỏ qua thay đổi mới hơn (ghi đang diễn ra)
+USER_TOMBSTONE_RETENTION_DAYS = int(os.getenv('USER_TOMBSTONE_RETENTION_DAYS', '30'))  # TTL index, token cũ hơn -> 410
+
 
 
 
@@ -194,23 +326,116 @@ MONGODB_ATLAS_SETTINGS = {
     'DB_NAME': os.getenv('MONGODB_ATLAS_DB', 'ReHearten_db'),
 }
 
-# Connect to MongoDB Atlas only
-print("🌐 Connecting to MongoDB Atlas...")
-if connect_mongodb_atlas():
+# Connection pool - mỗi worker process có pool riêng, kích thước theo số thread của worker
+# WEB_CONCURRENCY: số worker process, WEB_THREADS: số thread mỗi worker (gunicorn --threads)
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+WEB_THREADS = int(os.getenv('WEB_THREADS', os.getenv('GUNICORN_THREADS', '1')))
+MONGODB_POOL_OPTIONS = pool_options(
+    threads=WEB_THREADS,
+    workers=WEB_CONCURRENCY,
+    max_total_connections=int(os.getenv('MONGO_MAX_TOTAL_CONNECTIONS', '0')) or None,
+    max_pool_size=int(os.getenv('MONGO_MAX_POOL_SIZE', '0')) or None,
+    min_pool_size=int(os.getenv('MONGO_MIN_POOL_SIZE', '0')) or None,
+    max_idle_time_ms=int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '30000')),
+    wait_queue_timeout_ms=int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0')) or None,
+)
+# Client async (accounts/aio.py): một event loop phục vụ nhiều request cùng lúc nên pool riêng,
+# không tính theo WEB_THREADS; 0 = dùng MONGODB_POOL_OPTIONS như client đồng bộ
+ASYNC_MONGO_MAX_POOL_SIZE = int(os.getenv('ASYNC_MONGO_MAX_POOL_SIZE', '50'))
+# Cảnh báo khi một request phải chờ lấy connection lâu hơn ngưỡng này
+MONGO_POOL_WAIT_WARNING_MS = float(os.getenv('MONGO_POOL_WAIT_WARNING_MS', '50'))
+pool_listener.warn_wait_ms = MONGO_POOL_WAIT_WARNING_MS
+# Giới hạn (ms, gồm cả chọn server) cho lệnh đọc session/role trên đường request,
+# thay vì serverSelectionTimeoutMS 30 giây của client khi MongoDB mất kết nối
+MONGO_REQUEST_LOOKUP_TIMEOUT_MS = float(os.getenv('MONGO_REQUEST_LOOKUP_TIMEOUT_MS', '1000'))
+
+# MONGODB_TARGET: atlas (mặc định), local (mongod trên máy) hoặc mock (mongomock trong bộ nhớ)
+MONGODB_TARGET = os.getenv('MONGODB_TARGET', 'atlas').lower()
+
+if MONGODB_TARGET == 'local':
+    if not connect_mongodb_local():
+        raise Exception("Local MongoDB connection failed (MONGODB_LOCAL_URI)")
+    MONGODB_INFO = {
+        'TYPE': 'MongoDB (Local)',
+        'DATABASE': os.getenv('MONGODB_LOCAL_DB', 'ReHearten_bench'),
+        'CONNECTION': os.getenv('MONGODB_LOCAL_URI', 'mongodb://localhost:27017'),
+    }
+elif MONGODB_TARGET == 'mock':
+    if not connect_mongodb_mock():
+        raise Exception("In-memory MongoDB stand-in unavailable (pip install mongomock)")
     MONGODB_INFO = {
-        'TYPE': 'MongoDB Atlas (Cloud)',
-        'DATABASE': MONGODB_ATLAS_SETTINGS['DB_NAME'],
-        'CONNECTION': 'Atlas Cloud Cluster - ReHearten'
+        'TYPE': 'mongomock (In-memory)',
+        'DATABASE': os.getenv('MONGODB_LOCAL_DB', 'ReHearten_bench'),
+        'CONNECTION': 'In-process',
     }
-    print("✅ MongoDB Atlas connection established successfully!")
 else:
-    print("❌ MongoDB Atlas Connection Error: All connection strategies failed!")
-    print("🔥 Application cannot start without MongoDB Atlas connection!")
-    raise Exception("MongoDB Atlas connection failed: All connection strategies failed!")
-
-# Session Configuration - Use MongoDB sessions instead of Django's database sessions
-SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+    # Connect to MongoDB Atlas
+    print("🌐 Connecting to MongoDB Atlas...")
+    if connect_mongodb_atlas():
+        MONGODB_INFO = {
+            'TYPE': 'MongoDB Atlas (Cloud)',
+            'DATABASE': MONGODB_ATLAS_SETTINGS['DB_NAME'],
+            'CONNECTION': 'Atlas Cloud Cluster - ReHearten'
+        }
+        print("✅ MongoDB Atlas connection established successfully!")
+    else:
+        print("❌ MongoDB Atlas Connection Error: All connection strategies failed!")
+        print("🔥 Application cannot start without MongoDB Atlas connection!")
+        raise Exception("MongoDB Atlas connection failed: All connection strategies failed!")
+
+# Bus vô hiệu hóa cache giữa các worker (accounts/invalidation.py): auto = change stream
+# nếu là replica set, ngược lại polling; changestream | poll | off. mock chỉ có một tiến trình
+INVALIDATION_BUS = os.getenv('INVALIDATION_BUS', 'off' if MONGODB_TARGET == 'mock' else 'auto').lower()
+INVALIDATION_POLL_SECONDS = float(os.getenv('INVALIDATION_POLL_SECONDS', '2'))
+INVALIDATION_MAX_BACKOFF = float(os.getenv('INVALIDATION_MAX_BACKOFF', '30'))  # giây giữa các lần mở lại change stream
+
+# Định tuyến đọc (accounts/routing.py): đọc analytics của admin lên secondary của replica set,
+# đọc phục vụ xác thực luôn ở primary. mock không có replica set nên mặc định tắt
+MONGO_READ_ROUTING = os.getenv('MONGO_READ_ROUTING', 'False' if MONGODB_TARGET == 'mock' else 'True').lower() == 'true'
+MONGO_MAX_STALENESS_SECONDS = int(os.getenv('MONGO_MAX_STALENESS_SECONDS', '90'))  # tối thiểu 90
+MONGO_PRIMARY_PIN_SECONDS = float(os.getenv('MONGO_PRIMARY_PIN_SECONDS', '90'))  # đọc primary sau khi ghi
+
+# SSE (accounts/events.py): sự kiện user đi qua capped collection admin_events để tới client ở mọi worker;
+# mongomock không có tailable cursor nên mặc định chỉ phát trong worker
+SSE_EVENT_FEED = os.getenv('SSE_EVENT_FEED', 'False' if MONGODB_TARGET == 'mock' else 'True').lower() == 'true'
+
+# MongoDB command monitoring - hiển thị danh sách lệnh trên trang khi DEBUG
+MONGO_DEBUG_PANEL = os.getenv('MONGO_DEBUG_PANEL', 'False').lower() == 'true'
+# Đếm byte gửi/nhận của mỗi request (mã hóa lại BSON, tốn CPU); luôn bật cùng debug panel
+MONGO_MEASURE_BYTES = os.getenv('MONGO_MEASURE_BYTES', 'False').lower() == 'true'
+
+# Token cho công cụ giám sát gọi /api/system-status/ (Authorization: Bearer <token>)
+SYSTEM_STATUS_TOKEN = os.getenv('SYSTEM_STATUS_TOKEN', '')
+
+# Thư mục chứa file số liệu memory-mapped của từng worker (mặc định /dev/shm/rehearten-metrics)
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+
+# Sampling profiler - admin gửi header "X-Profile: 1" hoặc lấy mẫu ngẫu nhiên PROFILER_SAMPLE_RATE
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'False').lower() == 'true'
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', '0'))
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', '5'))
+PROFILER_MAX_PROFILES = int(os.getenv('PROFILER_MAX_PROFILES', '20'))
+
+# Slow query log - lệnh chậm hơn ngưỡng được lưu kèm explain plan vào collection slow_queries
+MONGO_SLOW_QUERY_ENABLED = os.getenv('MONGO_SLOW_QUERY_ENABLED', 'True').lower() == 'true'
+MONGO_SLOW_QUERY_MS = float(os.getenv('MONGO_SLOW_QUERY_MS', '100'))
+MONGO_SLOW_QUERY_SAMPLE_RATE = float(os.getenv('MONGO_SLOW_QUERY_SAMPLE_RATE', '1.0'))
+MONGO_SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv('MONGO_SLOW_QUERY_EXPLAIN_INTERVAL', '300'))  # giây / shape
+
+# Session Configuration - session đã đăng nhập nằm trong UserSession (accounts/sessions.py),
+# session khách trong cache SESSION_CACHE_ALIAS
+SESSION_ENGINE = 'accounts.sessions'
 SESSION_CACHE_ALIAS = 'default'
+SESSION_L1_TTL = float(os.getenv('SESSION_L1_TTL', '10'))  # giây; 0 = tắt L1 trong process
+SESSION_L1_MAX_ENTRIES = int(os.getenv('SESSION_L1_MAX_ENTRIES', '10000'))
+SESSION_ACTIVITY_INTERVAL = float(os.getenv('SESSION_ACTIVITY_INTERVAL', '60'))  # ghi last_activity tối đa mỗi ... giây
+
+# SyncCustomSessionMiddleware: đường dẫn không cần session custom (STATIC_URL được thêm tự động)
+SESSION_SYNC_SKIP_PREFIXES = ('/static/', '/media/', '/favicon.ico', '/robots.txt')
+GOOGLE_USER_CACHE_TTL = float(os.getenv('GOOGLE_USER_CACHE_TTL', '300'))  # giây, email -> User
+GOOGLE_USER_NEGATIVE_TTL = float(os.getenv('GOOGLE_USER_NEGATIVE_TTL', '30'))  # giây, email không có user
+# Role/is_active của user cho kiểm tra admin không tải User (endpoint giám sát, profiler)
+SESSION_ROLE_CACHE_TTL = float(os.getenv('SESSION_ROLE_CACHE_TTL', '30'))  # giây
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -254,6 +479,25 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic tạo tên file có hash + biến thể WebP/AVIF cho các ảnh dưới đây
+# (accounts/storage.py); template dùng {% picture %} / {% image_url %}
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'accounts.storage.ImageVariantManifestStorage'},
+}
+
+# Chiều rộng (px) cần tạo cho từng ảnh, gồm cả bản 2x cho màn hình retina
+STATIC_IMAGE_VARIANTS = {
+    'images/logo_rehearten.png': (48, 96, 200, 400),
+    'images/logoPTIT.png': (100, 200, 400),
+    'images/background.jpg': (640, 1280, 1920),
+}
+STATIC_IMAGE_FORMATS = ('avif', 'webp')
+
+# Django tự phục vụ STATIC_ROOT khi DEBUG=False (không có nginx/CDN phía trước);
+# file có hash được trả về với Cache-Control một năm, immutable
+SERVE_STATIC = os.getenv('SERVE_STATIC', 'False').lower() == 'true'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -282,6 +526,11 @@ SOCIAL_AUTH_PIPELINE = (
     'social_core.pipeline.user.user_details',
 )
 
+# Logging - request thread chỉ đưa record vào hàng đợi, thread nền định dạng JSON và ghi ra console
+# ACCOUNTS_LOG_LEVEL=DEBUG bật log debug; ACCOUNTS_DEBUG_SAMPLE_RATE giữ một phần request (0.0 - 1.0)
+ACCOUNTS_LOG_LEVEL = os.getenv('ACCOUNTS_LOG_LEVEL', 'INFO')
+ACCOUNTS_DEBUG_SAMPLE_RATE = float(os.getenv('ACCOUNTS_DEBUG_SAMPLE_RATE', '1.0'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -294,33 +543,43 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'accounts.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'request_id': {
+            '()': 'accounts.log.RequestIdFilter',
+        },
+        'debug_sampling': {
+            '()': 'accounts.log.DebugSamplingFilter',
+            'rate': ACCOUNTS_DEBUG_SAMPLE_RATE,
+        },
     },
     'handlers': {
         'console': {
-            'level': 'INFO',
+            'level': 'DEBUG',
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
-        'file': {  # Add the missing file handler
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'logs' / 'django.log',
-            'formatter': 'verbose',
+        'queue': {
+            'class': 'accounts.log.NonBlockingQueueHandler',
+            'handlers': ['console'],
+            'queue': {'()': 'queue.Queue', 'maxsize': 10000},
+            'filters': ['request_id', 'debug_sampling'],
         },
     },
     'loggers': {
         'django.request': {
-            'handlers': ['console'],
+            'handlers': ['queue'],
             'level': 'INFO',
-            'propagate': True,
+            'propagate': False,
         },
         'accounts': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'handlers': ['queue'],
+            'level': ACCOUNTS_LOG_LEVEL,
+            'propagate': False,
         },
-        
-
     },
 }
 
@@ -0,0 +1,32 @@
+"""
+Settings cho benchmark / load test - chạy với mongod trên máy hoặc mongomock.
+
+    MONGODB_TARGET=local DJANGO_SETTINGS_MODULE=REHEARTEN.settings_bench ...
+    MONGODB_TARGET=mock  DJANGO_SETTINGS_MODULE=REHEARTEN.settings_bench ...
+
+Mặc định MONGODB_TARGET=local; không bao giờ kết nối Atlas trừ khi đặt rõ
+MONGODB_TARGET=atlas.
+"""
+import os
+
+os.environ.setdefault('MONGODB_TARGET', 'local')
+
+from .settings import *  # noqa: E402,F401,F403
+
+# Đo như production: không debug panel, không profiler
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+MONGO_DEBUG_PANEL = False
+PROFILER_ENABLED = False
+
+# Server benchmark chạy HTTP thuần trên localhost
+SECURE_SSL_REDIRECT = False
+SESSION_COOKIE_SECURE = False
+CSRF_COOKIE_SECURE = False
+
+# Session khách và dữ liệu cache nằm trong 'default': đủ chỗ để không bị đẩy ra giữa
+# chừng khi chạy nhiều user đồng thời; file riêng, không lẫn với dev
+CACHES = {
+    **CACHES,  # noqa: F405
+    'default': cache_backend('bench-default', 65536, 1024),  # noqa: F405
+}
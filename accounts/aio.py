@@ -0,0 +1,147 @@
+"""
+Truy cập MongoDB bất đồng bộ cho các view async (ASGI, xem accounts/async_views.py).
+
+mongoengine chỉ có API đồng bộ: mỗi truy vấn giữ một thread trong suốt round
+trip tới MongoDB. Ở đây dùng ``AsyncMongoClient`` của pymongo với cùng tham số
+kết nối mà ``mongoengine.connect`` đã nhận (host, TLS, pool, event listeners),
+trả về dict BSON thô; chuyển sang Document bằng ``to_document`` khi cần dùng
+phương thức của model.
+
+Mỗi event loop có client riêng (client async gắn với loop tạo ra nó). Khi không
+có driver async (pymongo < 4.9) hoặc kết nối là mongomock, các lệnh chạy trên
+thread pool qua ``sync_to_async`` - chậm hơn nhưng cùng kết quả.
+"""
+import asyncio
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, _connection_settings, get_db
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:  # pymongo < 4.9
+    AsyncMongoClient = None
+
+logger = logging.getLogger(__name__)
+
+# Tham số của mongoengine.connect -> tên tham số MongoClient (như mongoengine.connection._connect)
+_OPTION_NAMES = {
+    'authentication_source': 'authSource',
+    'authentication_mechanism': 'authMechanism',
+    'authmechanismproperties': 'authMechanismProperties',
+}
+_MONGOENGINE_ONLY = frozenset({'name', 'mongo_client_class'})
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncMongoClient
+
+
+def client_options(alias=DEFAULT_CONNECTION_NAME):
+    """Tham số kết nối của ``mongoengine.connect(alias=...)`` cho AsyncMongoClient
+
+    Pool của mongoengine tính theo số thread của worker; event loop chạy nhiều
+    request đồng thời trên một thread nên dùng ``ASYNC_MONGO_MAX_POOL_SIZE``.
+    """
+    options = {}
+    for key, value in _connection_settings[alias].items():
+        if key in _MONGOENGINE_ONLY or value is None:
+            continue
+        options[_OPTION_NAMES.get(key, key)] = value
+    max_pool_size = getattr(settings, 'ASYNC_MONGO_MAX_POOL_SIZE', 0)
+    if max_pool_size:
+        options['maxPoolSize'] = max_pool_size
+        if 'minPoolSize' in options:
+            options['minPoolSize'] = min(options['minPoolSize'], max_pool_size)
+    return options
+
+
+def is_native(alias=DEFAULT_CONNECTION_NAME):
+    """True nếu truy vấn async đi qua driver async thật (không phải thread pool)"""
+    connection = _connection_settings.get(alias, {})
+    return AsyncMongoClient is not None and connection.get('mongo_client_class') is None
+
+
+def get_client(alias=DEFAULT_CONNECTION_NAME):
+    """AsyncMongoClient của event loop hiện tại (tạo lần đầu, kết nối lười)"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncMongoClient(**client_options(alias))
+        _clients[loop] = client
+    return client
+
+
+def get_collection(document, read_preference=None):
+    """Collection của một Document mongoengine: async thật hoặc bọc thread pool
+
+    ``read_preference`` (accounts/routing.py) cho lệnh đọc không cần primary.
+    """
+    alias = document._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
+    name = document._get_collection_name()
+    native = is_native(alias)
+    if native:
+        collection = get_client(alias)[_connection_settings[alias]['name']][name]
+    else:
+        collection = get_db(alias)[name]
+    if read_preference is not None:
+        collection = collection.with_options(read_preference=read_preference)
+    return NativeCollection(collection) if native else ThreadedCollection(collection)
+
+
+class NativeCollection:
+    """Lệnh trên AsyncCollection của pymongo"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, filter, projection=None):
+        return await self.collection.find_one(filter, projection)
+
+    async def find(self, filter, projection=None, sort=None, limit=0):
+        cursor = self.collection.find(filter, projection, sort=sort, limit=limit)
+        return await cursor.to_list()
+
+    async def find_one_and_update(self, filter, update, projection=None):
+        return await self.collection.find_one_and_update(filter, update, projection)
+
+    async def update_one(self, filter, update):
+        return (await self.collection.update_one(filter, update)).matched_count
+
+
+class ThreadedCollection:
+    """Cùng giao diện với NativeCollection, chạy lệnh đồng bộ trên thread pool"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def _run(self, func, *args, **kwargs):
+        return await sync_to_async(func, thread_sensitive=False)(*args, **kwargs)
+
+    async def find_one(self, filter, projection=None):
+        return await self._run(self.collection.find_one, filter, projection)
+
+    async def find(self, filter, projection=None, sort=None, limit=0):
+        return await self._run(
+            lambda: list(self.collection.find(filter, projection, sort=sort, limit=limit))
+        )
+
+    async def find_one_and_update(self, filter, update, projection=None):
+        return await self._run(self.collection.find_one_and_update, filter, update, projection)
+
+    async def update_one(self, filter, update):
+        return (await self._run(self.collection.update_one, filter, update)).matched_count
+
+
+def to_document(document, son):
+    """Dict BSON -> instance Document (không truy vấn thêm), None giữ nguyên"""
+    if son is None:
+        return None
+    return document._from_son(son)
+
+
+async def close_clients():
+    """Đóng client của event loop hiện tại (shutdown ASGI / cuối test)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
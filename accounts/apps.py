@@ -4,3 +4,30 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from django.conf import settings
+        from . import monitoring, slow_queries
+        from .events import broadcaster
+        from .fragments import users_invalidated
+        from .invalidation import invalidation_bus
+        from .process_login_gg import google_users
+        from .sessions import session_cache
+        from .utils import user_roles
+        from .log import start_queue_listeners
+        from .metrics import metrics
+        from .pool import pool_listener
+        metrics.cleanup_dead_workers()
+        monitoring.register_command_observer(metrics.record_mongo_command)
+        pool_listener.add_wait_observer(metrics.record_pool_wait)
+        slow_queries.install()
+        broadcaster.configure(settings)
+        invalidation_bus.configure(settings)
+        invalidation_bus.register('users', users_invalidated)
+        session_cache.configure(settings)
+        invalidation_bus.register('user_sessions', session_cache.invalidated)
+        google_users.configure(settings)
+        invalidation_bus.register('users', google_users.invalidated)
+        user_roles.configure(settings)
+        invalidation_bus.register('users', user_roles.invalidated)
+        start_queue_listeners()
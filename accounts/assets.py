@@ -0,0 +1,211 @@
+"""
+Bundle CSS/JS tách từ các khối inline trong template.
+
+Trong template, khối ``<style>``/``<script>`` được bọc bởi tag ``bundle``:
+
+    {% load assets %}
+    {% bundle 'home.css' %}
+    <style> ... </style>
+    {% endbundle %}
+
+``python manage.py build_assets`` đọc nguyên văn các khối này, minify và ghi ra
+``static/css/bundles/home.css`` / ``static/js/bundles/home.js``. Sau
+``collectstatic`` bundle có hash trong tên, kèm bản nén ``.gz``/``.br``
+(accounts/storage.py) và tag ``bundle`` thay khối inline bằng
+``<link>``/``<script src>``. Khi DEBUG hoặc bundle chưa được build, khối inline
+được render như cũ nên sửa CSS/JS vẫn chỉ cần sửa template.
+
+Khối bundle không được chứa template tag/biến: giá trị động (URL, username, ...)
+đi qua ``data-*`` attribute hoặc một khối inline nhỏ bên ngoài bundle.
+"""
+import gzip
+import os
+import re
+
+BUNDLE_RE = re.compile(
+    r"{%\s*bundle\s+['\"](?P<name>[\w.-]+)['\"]\s*%}(?P<body>.*?){%\s*endbundle\s*%}",
+    re.S,
+)
+BLOCK_RE = {
+    'css': re.compile(r'^\s*<style>(?P<source>.*)</style>\s*$', re.S),
+    'js': re.compile(r'^\s*<script>(?P<source>.*)</script>\s*$', re.S),
+}
+TEMPLATE_SYNTAX_RE = re.compile(r'{[%{#]')
+
+# Định dạng nén sẵn khi collectstatic; chỉ giữ bản nén nếu nhỏ hơn bản gốc đủ nhiều
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.xml')
+MIN_COMPRESS_SIZE = 256
+MIN_COMPRESS_RATIO = 0.95
+
+
+class BundleError(Exception):
+    pass
+
+
+class Bundle:
+    def __init__(self, name, template, line, source):
+        self.name = name
+        self.template = template
+        self.line = line
+        self.source = source
+
+    @property
+    def kind(self):
+        return bundle_kind(self.name)
+
+    @property
+    def path(self):
+        return bundle_path(self.name)
+
+    def minified(self):
+        return minify_css(self.source) if self.kind == 'css' else minify_js(self.source)
+
+
+def bundle_kind(name):
+    extension = os.path.splitext(name)[1].lstrip('.')
+    if extension not in BLOCK_RE:
+        raise BundleError(f'Bundle {name!r} must end with .css or .js')
+    return extension
+
+
+def bundle_path(name):
+    """'home.css' -> 'css/bundles/home.css' (tương đối so với thư mục static)"""
+    return f'{bundle_kind(name)}/bundles/{name}'
+
+
+def find_bundles(template_dirs):
+    """Mọi khối ``{% bundle %}`` trong các thư mục template, theo thứ tự file"""
+    bundles = {}
+    for directory in template_dirs:
+        for root, _, files in sorted(os.walk(directory)):
+            for filename in sorted(files):
+                if not filename.endswith('.html'):
+                    continue
+                path = os.path.join(root, filename)
+                with open(path, encoding='utf-8') as template:
+                    content = template.read()
+                for bundle in parse_bundles(content, path):
+                    if bundle.name in bundles:
+                        other = bundles[bundle.name]
+                        raise BundleError(
+                            f'{path}:{bundle.line}: bundle {bundle.name!r} already defined in '
+                            f'{other.template}:{other.line}'
+                        )
+                    bundles[bundle.name] = bundle
+    return list(bundles.values())
+
+
+def parse_bundles(content, template='<string>'):
+    bundles = []
+    for match in BUNDLE_RE.finditer(content):
+        name = match.group('name')
+        line = content.count('\n', 0, match.start()) + 1
+        block = BLOCK_RE[bundle_kind(name)].match(match.group('body'))
+        if block is None:
+            raise BundleError(
+                f'{template}:{line}: bundle {name!r} must contain exactly one '
+                f'<{"style" if name.endswith(".css") else "script"}> block'
+            )
+        source = block.group('source')
+        syntax = TEMPLATE_SYNTAX_RE.search(source)
+        if syntax:
+            syntax_line = line + match.group('body').count('\n', 0, block.start('source') + syntax.start())
+            raise BundleError(
+                f'{template}:{syntax_line}: bundle {name!r} contains template syntax; '
+                f'move dynamic values to data-* attributes outside the bundle'
+            )
+        bundles.append(Bundle(name, template, line, source))
+    return bundles
+
+
+# --- Minify -----------------------------------------------------------------
+# Dùng rcssmin / rjsmin nếu đã cài (pip install rcssmin rjsmin); nếu không thì
+# minify an toàn ở mức bỏ comment và khoảng trắng thừa.
+
+CSS_TOKEN_RE = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|(/\*.*?\*/)|(\s+)|([^"\'/\s]+|/)',
+    re.S,
+)
+CSS_TIGHT_CHARS = '{};,>'
+
+
+def minify_css(source):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(source).strip() + '\n'
+    except ImportError:
+        pass
+
+    output = []
+    pending_space = False
+    for string, comment, space, other in CSS_TOKEN_RE.findall(source):
+        if space or comment:
+            pending_space = True
+            continue
+        token = string or other
+        if pending_space and output:
+            previous = output[-1][-1]
+            if previous not in CSS_TIGHT_CHARS + ':' and token[0] not in CSS_TIGHT_CHARS:
+                output.append(' ')
+        pending_space = False
+        if token == '}' and output and output[-1] == ';':
+            output.pop()
+        output.append(token)
+    return ''.join(output) + '\n'
+
+
+def minify_js(source):
+    try:
+        import rjsmin
+        return rjsmin.jsmin(source).strip() + '\n'
+    except ImportError:
+        pass
+
+    # Theo dòng: giữ nguyên xuống dòng (không lo ASI) và nội dung template
+    # literal nhiều dòng; chỉ bỏ thụt lề, dòng trống và dòng comment
+    lines = []
+    in_template = False
+    in_comment = False
+    for line in source.splitlines():
+        if in_template:
+            lines.append(line)
+            in_template = _count_backticks(line) % 2 == 0
+            continue
+        stripped = line.strip()
+        if in_comment:
+            if '*/' not in stripped:
+                continue
+            in_comment = False
+            stripped = stripped.split('*/', 1)[1].strip()
+        if stripped.startswith('/*'):
+            if '*/' not in stripped:
+                in_comment = True
+                continue
+            stripped = stripped.split('*/', 1)[1].strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+        in_template = _count_backticks(stripped) % 2 == 1
+    return '\n'.join(lines) + '\n'
+
+
+def _count_backticks(line):
+    return len(re.findall(r'(?<!\\)`', line))
+
+
+# --- Nén sẵn ----------------------------------------------------------------
+
+def compressed_variants(content):
+    """{'.gz': bytes, '.br': bytes} cho nội dung đáng nén (brotli nếu đã cài)"""
+    if len(content) < MIN_COMPRESS_SIZE:
+        return {}
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        variants['.br'] = brotli.compress(content, quality=11)
+    except ImportError:
+        pass
+    return {
+        suffix: data for suffix, data in variants.items()
+        if len(data) <= len(content) * MIN_COMPRESS_RATIO
+    }
@@ -0,0 +1,342 @@
+"""
+Phiên bản async của các JSON API trong views.py, dùng khi ``ASYNC_VIEWS`` bật
+(mặc định khi chạy qua REHEARTEN/asgi.py).
+
+Truy vấn đi qua driver MongoDB async (accounts/aio.py) nên một worker ASGI
+phục vụ được nhiều request đang chờ mạng cùng lúc. Request, response và mã lỗi
+giữ nguyên như bản đồng bộ; ghi dùng ``$set`` chỉ các trường thay đổi thay vì
+``Document.save()``, nên phải tự đồng bộ is_staff/is_superuser và data version.
+"""
+import json
+import logging
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from mongoengine.errors import ValidationError
+from pymongo.errors import DuplicateKeyError
+
+from . import aio, audit, changes, events, routing
+from .decorators import admin_required, api_admin_required, csrf_exempt, login_required
+from .fragments import bump_data_version
+from .models import User
+from .utils import aget_current_user, field_errors
+
+logger = logging.getLogger(__name__)
+
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+
+async def update_user(user, **fields):
+    """``$set`` các trường lên document của ``user`` và cập nhật instance
+
+    Mỗi trường được kiểm tra bằng field của User như ``Document.save()``;
+    sai thì ném ``ValidationError`` trước khi ghi.
+    """
+    for name, value in fields.items():
+        User._fields[name].validate(value)
+    changed_fields = set(fields)
+    if 'role' in fields:
+        fields['is_staff'] = fields['is_superuser'] = fields['role'] == 'admin'
+    fields['updated_at'] = datetime.now()
+    await aio.get_collection(User).update_one({'_id': user.pk}, {'$set': fields})
+    for field, value in fields.items():
+        setattr(user, field, value)
+    bump_data_version()
+    events.user_saved(user, False, changed_fields)
+
+
+@csrf_exempt
+@admin_required
+async def api_change_user_role(request):
+    """API để thay đổi vai trò người dùng - chỉ admin"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        username = data.get('username')
+        new_role = data.get('role')
+
+        if not username or not new_role:
+            return JsonResponse({'error': 'Username và role là bắt buộc'}, status=400)
+
+        valid_roles = [role[0] for role in User.ROLES]
+        if new_role not in valid_roles:
+            return JsonResponse({'error': f'Vai trò không hợp lệ. Chỉ chấp nhận: {", ".join(valid_roles)}'}, status=400)
+
+        current_user = await aget_current_user(request)
+        if current_user.username == username:
+            return JsonResponse({'error': 'Bạn không thể thay đổi vai trò của chính mình!'}, status=403)
+
+        user = aio.to_document(User, await aio.get_collection(User).find_one({'username': username}))
+        if not user:
+            return JsonResponse({'error': 'Không tìm thấy người dùng'}, status=404)
+
+        if user.role == new_role:
+            return JsonResponse({'error': f'Người dùng {username} đã có vai trò {user.get_role_display()}'}, status=400)
+
+        old_role = user.get_role_display()
+        old_role_key = user.role
+        await update_user(user, role=new_role)
+        new_role_display = user.get_role_display()
+
+        audit.record(current_user.username, 'role_change', username, {'role': (old_role_key, user.role)}, request, source='api')
+        routing.pin_primary(request)
+
+        return JsonResponse({
+            'success': True,
+            'message': f'Đã thay đổi vai trò của {username} từ {old_role} thành {new_role_display}',
+            'user': {
+                'username': user.username,
+                'email': user.email,
+                'full_name': user.get_full_name(),
+                'old_role': old_role_key,
+                'old_role_display': old_role,
+                'new_role': user.role,
+                'new_role_display': new_role_display,
+                'is_active': user.is_active,
+                'date_joined': user.date_joined.strftime('%d/%m/%Y %H:%M') if user.date_joined else '',
+                'changed_by': current_user.username,
+                'changed_at': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            }
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Dữ liệu JSON không hợp lệ'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Có lỗi xảy ra: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@admin_required
+async def api_toggle_user_status(request):
+    """API để toggle trạng thái hoạt động của người dùng - chỉ admin"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        username = data.get('username')
+
+        if not username:
+            return JsonResponse({'error': 'Username là bắt buộc'}, status=400)
+
+        current_user = await aget_current_user(request)
+        if current_user.username == username:
+            return JsonResponse({'error': 'Bạn không thể thay đổi trạng thái hoạt động của chính mình!'}, status=403)
+
+        user = aio.to_document(User, await aio.get_collection(User).find_one({'username': username}))
+        if not user:
+            return JsonResponse({'error': 'Không tìm thấy người dùng'}, status=404)
+
+        old_status = "Hoạt động" if user.is_active else "Không hoạt động"
+        old_active = user.is_active
+        await update_user(user, is_active=not user.is_active)
+
+        new_status = "Hoạt động" if user.is_active else "Không hoạt động"
+        action = "kích hoạt" if user.is_active else "vô hiệu hóa"
+
+        audit.record(current_user.username, 'status_change', username, {'is_active': (old_active, user.is_active)}, request, source='api')
+        routing.pin_primary(request)
+
+        return JsonResponse({
+            'success': True,
+            'message': f'Đã {action} tài khoản {username} thành công',
+            'user': {
+                'username': user.username,
+                'email': user.email,
+                'full_name': user.get_full_name(),
+                'old_status': old_active,
+                'old_status_display': old_status,
+                'new_status': user.is_active,
+                'new_status_display': new_status,
+                'role': user.role,
+                'role_display': user.get_role_display(),
+                'date_joined': user.date_joined.strftime('%d/%m/%Y %H:%M') if user.date_joined else '',
+                'last_login': user.last_login.strftime('%d/%m/%Y %H:%M') if user.last_login else None,
+                'changed_by': current_user.username,
+                'changed_at': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+                'action': action
+            }
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Dữ liệu JSON không hợp lệ'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Có lỗi xảy ra: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@login_required
+async def api_profile_update(request):
+    if request.method != 'PATCH':
+        return JsonResponse({'error': 'Phương thức không được hỗ trợ'}, status=405)
+
+    logger.info("PATCH /api/profile/ - User: %s", request.session.get('username', 'Unknown'))
+
+    try:
+        data = json.loads(request.body)
+        logger.debug("PATCH Request Data: %s", data)
+
+        user = await aget_current_user(request)
+        if not user:
+            logger.error("PATCH Request Failed: User not authenticated")
+            return JsonResponse({'error': 'Người dùng không được xác thực'}, status=401)
+
+        changes = {}
+        if 'first_name' in data:
+            new_first_name = data['first_name'].strip()
+            if new_first_name != user.first_name:
+                if not new_first_name:
+                    return JsonResponse({'first_name': ['Tên không được để trống']}, status=400)
+                changes['first_name'] = new_first_name
+
+        if 'last_name' in data:
+            new_last_name = data['last_name'].strip()
+            if new_last_name != user.last_name:
+                if not new_last_name:
+                    return JsonResponse({'last_name': ['Họ không được để trống']}, status=400)
+                changes['last_name'] = new_last_name
+
+        if 'email' in data:
+            new_email = data['email'].strip().lower()
+            if new_email != user.email:
+                if not new_email:
+                    return JsonResponse({'email': ['Email không được để trống']}, status=400)
+                if not EMAIL_RE.match(new_email):
+                    return JsonResponse({'email': ['Email không hợp lệ']}, status=400)
+
+                existing_user = await aio.get_collection(User).find_one({'email': new_email}, {'_id': 1})
+                if existing_user and existing_user['_id'] != user.pk:
+                    return JsonResponse({'email': ['Email này đã được sử dụng']}, status=400)
+                changes['email'] = new_email
+
+        if not changes:
+            logger.warning("PATCH Request: No fields to update")
+            return JsonResponse({'message': 'Không có thông tin nào được thay đổi'}, status=200)
+        try:
+            await update_user(user, **changes)
+        except ValidationError as e:
+            return JsonResponse(field_errors(e), status=400)
+        except DuplicateKeyError:
+            # Email vừa bị user khác lấy giữa lúc kiểm tra và lúc ghi
+            return JsonResponse({'email': ['Email này đã được sử dụng']}, status=400)
+        updated_fields = list(changes)
+        logger.info("PATCH Request Successful: Updated fields %s for user %s", updated_fields, user.username)
+
+        return JsonResponse({
+            'message': 'Cập nhật thông tin thành công!',
+            'updated_fields': updated_fields,
+            'user': {
+                'id': str(user.id),
+                'username': user.username,
+                'email': user.email,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'full_name': user.get_full_name(),
+                'role': user.get_role_display(),
+                'is_active': user.is_active,
+                'updated_at': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            }
+        }, status=200)
+    except json.JSONDecodeError:
+        logger.error("PATCH Request Failed: Invalid JSON")
+        return JsonResponse({'error': 'Dữ liệu JSON không hợp lệ'}, status=400)
+    except Exception as e:
+        logger.error(f"PATCH Request Failed: {str(e)}")
+        return JsonResponse({'error': f'Có lỗi xảy ra: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@login_required
+async def api_user_list(request):
+    """API để lấy danh sách người dùng"""
+    user = await aget_current_user(request)
+
+    try:
+        if not user.is_admin():
+            return JsonResponse({'error': 'Chỉ admin mới có thể truy cập danh sách người dùng'}, status=403)
+
+        collection = aio.get_collection(User, routing.read_preference(request))
+        users = [aio.to_document(User, son) for son in await collection.find({})]
+
+        user_list = []
+        for u in users:
+            user_list.append({
+                'username': u.username,
+                'email': u.email,
+                'full_name': u.get_full_name(),
+                'role': u.get_role_display(),
+                'role_key': u.role,
+                'date_joined': u.date_joined.strftime('%d/%m/%Y %H:%M') if u.date_joined else '',
+                'last_login': u.last_login.strftime('%d/%m/%Y %H:%M') if u.last_login else 'Chưa đăng nhập',
+                'is_active': u.is_active,
+                'permissions': u.get_permissions_display()
+            })
+
+        return JsonResponse({
+            'users': user_list,
+            'total_count': len(user_list)
+        })
+
+    except Exception as e:
+        return JsonResponse({'error': f'Có lỗi xảy ra: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@login_required
+async def api_get_profile(request):
+    """
+    API endpoint để lấy thông tin cá nhân của người dùng đang đăng nhập.
+    Chỉ chấp nhận phương thức GET.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Phương thức không được hỗ trợ'}, status=405)
+
+    user = await aget_current_user(request)
+
+    if not user:
+        return JsonResponse({'error': 'Không tìm thấy người dùng hoặc phiên hết hạn.'}, status=401)
+
+    user_data = {
+        'id': str(user.id),
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'role': user.get_role_display(),
+        'is_active': user.is_active,
+        'date_joined': user.date_joined.strftime('%d/%m/%Y %H:%M:%S') if user.date_joined else None,
+        'last_login': user.last_login.strftime('%d/%m/%Y %H:%M:%S') if user.last_login else None
+    }
+
+    return JsonResponse(user_data, status=200)
+
+
+@api_admin_required
+async def api_user_changes(request):
+    """User thay đổi/bị xóa kể từ token ``since`` - đồng bộ tăng dần (accounts/changes.py)"""
+    try:
+        page = await changes.achanges_page(request.GET.get('since', ''), changes.page_limit(request.GET.get('limit')))
+    except changes.TokenError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except changes.ResyncRequired as e:
+        return JsonResponse({'error': str(e), 'resync': True}, status=410)
+    return JsonResponse(page)
+
+
+@api_admin_required
+async def api_events(request):
+    """Server-Sent Events cho admin: người dùng mới, đổi vai trò/trạng thái, số phiên"""
+    subscriber = events.broadcaster.subscribe()
+    if subscriber is None:
+        return JsonResponse({'error': 'Quá nhiều kết nối sự kiện, thử lại sau'}, status=503)
+    response = StreamingHttpResponse(
+        events.stream(subscriber, settings.SSE_KEEPALIVE_SECONDS, settings.SSE_MAX_AGE_SECONDS),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: không buffer stream
+    return response
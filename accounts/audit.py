@@ -0,0 +1,151 @@
+"""
+Nhật ký thao tác quản trị: ghi vào bộ đệm trong bộ nhớ, thread nền ghi theo lô.
+
+``record()`` chỉ thêm một dict vào deque nên request không phải chờ MongoDB.
+Thread nền ghi bằng ``insert_many`` mỗi ``flush_interval`` giây hoặc khi đủ
+``batch_size`` bản ghi vào capped collection ``audit_log``.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from . import monitoring
+from .log import get_request_id
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class AuditBuffer:
+    """In-memory buffer flushed to the audit collection in batches"""
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_buffered=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._records = deque(maxlen=max_buffered)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._exit_registered = False
+        self.dropped = 0
+        self.written = 0
+
+    def add(self, document):
+        if len(self._records) == self._records.maxlen:
+            self.dropped += 1  # deque discards the oldest record
+        self._records.append(document)
+        self._ensure_worker()
+        if len(self._records) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+                if not self._exit_registered:
+                    # Thread có thể được khởi động lại (sau fork); chỉ đăng ký một lần
+                    atexit.register(self.flush)
+                    self._exit_registered = True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning('Could not write audit records: %s', e)
+
+    def flush(self):
+        """Ghi toàn bộ bản ghi đang chờ (đồng bộ); trả về số bản ghi đã ghi"""
+        from .models import AuditLog
+
+        written = 0
+        with self._flush_lock, monitoring.suppress():
+            try:
+                while self._records:
+                    batch = []
+                    while self._records and len(batch) < self.batch_size:
+                        batch.append(self._records.popleft())
+                    try:
+                        AuditLog._get_collection().insert_many(batch, ordered=False)
+                    except BulkWriteError as e:
+                        errors = e.details.get('writeErrors', [])
+                        written += e.details.get('nInserted', 0)
+                        # Trùng _id: bản ghi đã được ghi ở lần thử trước (batch ghi dở rồi lỗi mạng).
+                        # Lỗi khác được đưa lại hàng đợi và thử ở lần flush sau.
+                        retry = [batch[error['index']] for error in errors if error.get('code') != DUPLICATE_KEY]
+                        logger.warning('Audit batch partially failed (%d to retry): %s', len(retry), errors[:1])
+                        if retry:
+                            self._records.extendleft(reversed(retry))
+                            break
+                        continue
+                    except Exception:
+                        # Put the batch back in order so it is retried on the next flush
+                        self._records.extendleft(reversed(batch))
+                        raise
+                    written += len(batch)
+            finally:
+                self.written += written
+        return written
+
+
+audit_buffer = AuditBuffer()
+
+
+def record(actor, action, target, changes, request=None, source='web'):
+    """Ghi nhận một thao tác quản trị
+
+    ``changes`` có dạng ``{field: (old, new)}``.
+    """
+    ip_address = None
+    if request is not None:
+        from .utils import get_client_ip
+        ip_address = get_client_ip(request)
+    document = {
+        'actor': actor,
+        'action': action,
+        'target': target,
+        'changes': {field: {'old': old, 'new': new} for field, (old, new) in changes.items()},
+        'source': source,
+        'ip_address': ip_address,
+        'request_id': get_request_id(),
+        'created_at': datetime.now(),
+    }
+    audit_buffer.add(document)
+    logger.info('[AUDIT] %s %s %s %s', actor, action, target, document['changes'])
+
+
+def query(actor=None, target=None, action=None, before=None, before_id=None, limit=50):
+    """Truy vấn nhật ký mới nhất trước, phân trang theo ``(created_at, _id)``
+
+    ``before``/``before_id`` là bản ghi cuối của trang trước; nhiều bản ghi cùng
+    ``created_at`` (ghi chung một lô) vẫn không bị bỏ sót. Chỉ có ``before`` thì
+    lấy các bản ghi cũ hơn mốc thời gian đó. Mỗi bộ lọc khớp với một index
+    ``(field, -created_at, -_id)`` của AuditLog.
+    """
+    from mongoengine.queryset.visitor import Q
+    from .models import AuditLog
+
+    filters = {}
+    if actor:
+        filters['actor'] = actor
+    if target:
+        filters['target'] = target
+    if action:
+        filters['action'] = action
+    queryset = AuditLog.objects(**filters)
+    if before and before_id:
+        queryset = queryset.filter(Q(created_at__lt=before) | Q(created_at=before, id__lt=before_id))
+    elif before:
+        queryset = queryset.filter(created_at__lt=before)
+    return list(queryset.order_by('-created_at', '-id').limit(limit))
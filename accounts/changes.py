@@ -0,0 +1,204 @@
+"""
+Đồng bộ tăng dần danh sách User: ``GET /api/users/changes/?since=<token>``.
+
+Thay đổi được sắp theo ``(updated_at, USERS, _id)`` của User và
+``(deleted_at, TOMBSTONES, _id)`` của UserTombstone, cả hai có index nên mỗi
+trang chỉ đọc đúng số document trả về. Token giữ cả loại collection: _id của
+hai collection không so sánh được với nhau khi trùng mốc thời gian. ``next`` là token của thay đổi cuối trong trang; gọi lại với token đó
+cho đến khi ``has_more`` là False. Bỏ ``since`` để tải toàn bộ lần đầu.
+
+Chỉ trả thay đổi cũ hơn ``USER_SYNC_LAG_SECONDS``: lần ghi đang diễn ra trên
+worker khác có thể mang ``updated_at`` sớm hơn chút so với lần ghi đã hiện ra,
+và nếu không chờ thì token sẽ vượt qua nó.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+
+from . import aio
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'role', 'permissions',
+               'is_active', 'is_verified', 'date_joined', 'last_login', 'updated_at')
+USER_PROJECTION = dict.fromkeys(USER_FIELDS, 1)
+TOMBSTONE_PROJECTION = {'user_id': 1, 'username': 1, 'deleted_at': 1}
+# Datetime naive như khi lưu; MongoDB giữ đến mili giây nên token dùng số nguyên ms
+EPOCH = datetime(1970, 1, 1)
+# Thứ tự giữa hai collection khi trùng mốc thời gian
+USERS = 0
+TOMBSTONES = 1
+
+
+class TokenError(ValueError):
+    """``since`` không phải token hợp lệ"""
+
+
+class ResyncRequired(Exception):
+    """Token cũ hơn thời hạn lưu tombstone - client phải tải lại toàn bộ"""
+
+
+def encode_token(timestamp, object_id, kind=USERS):
+    millis = (timestamp - EPOCH) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(f'{millis}:{kind}:{object_id}'.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """(datetime, loại collection, ObjectId) của token, None nếu rỗng"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        parts = raw.split(':')
+        if len(parts) == 2:
+            # Token cũ không có loại: coi như USERS, tombstone cùng mốc được gửi lại (xóa lặp vô hại)
+            parts.insert(1, USERS)
+        millis, kind, object_id = parts
+        kind = int(kind)
+        if kind not in (USERS, TOMBSTONES):
+            raise ValueError(kind)
+        return EPOCH + timedelta(milliseconds=int(millis)), kind, ObjectId(object_id)
+    except Exception:
+        raise TokenError('Token đồng bộ không hợp lệ')
+
+
+def latest_token():
+    """Token ở mốc hiện tại (trừ ``USER_SYNC_LAG_SECONDS``): chỉ nhận thay đổi từ nay về sau"""
+    lag = timedelta(seconds=getattr(settings, 'USER_SYNC_LAG_SECONDS', 2))
+    return encode_token(datetime.now() - lag, ObjectId('0' * 24))
+
+
+def window(field, kind, position, upper):
+    """Filter cho collection ``kind``: sau ``position`` (theo field, loại, _id), không mới hơn ``upper``"""
+    if position is None:
+        return {field: {'$lte': upper}}
+    timestamp, position_kind, object_id = position
+    if kind < position_kind:
+        return {field: {'$gt': timestamp, '$lte': upper}}
+    if kind > position_kind:
+        return {field: {'$gte': timestamp, '$lte': upper}}
+    return {
+        field: {'$gte': timestamp, '$lte': upper},
+        '$or': [{field: {'$gt': timestamp}}, {'_id': {'$gt': object_id}}],
+    }
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def user_change(document):
+    return {
+        'op': 'upsert',
+        'id': str(document['_id']),
+        'user': {
+            field: _isoformat(document.get(field)) if field in ('date_joined', 'last_login', 'updated_at')
+            else document.get(field)
+            for field in USER_FIELDS
+        },
+    }
+
+
+def tombstone_change(document):
+    return {
+        'op': 'delete',
+        'id': str(document['user_id']),
+        'user': {'username': document['username'], 'deleted_at': _isoformat(document['deleted_at'])},
+    }
+
+
+class ChangesQuery:
+    """Hai truy vấn của một trang và cách ghép kết quả"""
+
+    def __init__(self, since, limit):
+        self.since = since or ''
+        self.limit = limit
+        self.position = decode_token(since)
+        now = datetime.now()
+        retention = timedelta(days=getattr(settings, 'USER_TOMBSTONE_RETENTION_DAYS', 30))
+        if self.position is not None and self.position[0] < now - retention:
+            raise ResyncRequired('Token quá cũ, cần đồng bộ lại từ đầu (bỏ tham số since)')
+        self.upper = now - timedelta(seconds=getattr(settings, 'USER_SYNC_LAG_SECONDS', 2))
+        self.users_filter = window('updated_at', USERS, self.position, self.upper)
+        self.tombstones_filter = window('deleted_at', TOMBSTONES, self.position, self.upper)
+
+    def page(self, users, tombstones):
+        """Ghép hai danh sách đã sắp xếp (mỗi danh sách tối đa limit + 1)"""
+        entries = [(doc['updated_at'], USERS, doc['_id'], user_change, doc) for doc in users]
+        entries += [(doc['deleted_at'], TOMBSTONES, doc['_id'], tombstone_change, doc) for doc in tombstones]
+        entries.sort(key=lambda entry: entry[:3])
+        page = entries[:self.limit]
+        last = page[-1] if page else None
+        return {
+            'changes': [serialize(doc) for _, _, _, serialize, doc in page],
+            'next': encode_token(last[0], last[2], last[1]) if page else self.since,
+            'has_more': len(entries) > self.limit,
+        }
+
+
+def changes_page(since, limit):
+    """Một trang thay đổi (driver đồng bộ)"""
+    from .models import User, UserTombstone
+
+    query = ChangesQuery(since, limit)
+    users = list(User._get_collection().find(query.users_filter, USER_PROJECTION)
+                 .sort([('updated_at', 1), ('_id', 1)]).limit(limit + 1))
+    tombstones = list(UserTombstone._get_collection().find(query.tombstones_filter, TOMBSTONE_PROJECTION)
+                      .sort([('deleted_at', 1), ('_id', 1)]).limit(limit + 1))
+    return query.page(users, tombstones)
+
+
+async def achanges_page(since, limit):
+    """Một trang thay đổi (driver async, xem aio.py)"""
+    from .models import User, UserTombstone
+
+    query = ChangesQuery(since, limit)
+    users = await aio.get_collection(User).find(
+        query.users_filter, USER_PROJECTION, sort=[('updated_at', 1), ('_id', 1)], limit=limit + 1)
+    tombstones = await aio.get_collection(UserTombstone).find(
+        query.tombstones_filter, TOMBSTONE_PROJECTION, sort=[('deleted_at', 1), ('_id', 1)], limit=limit + 1)
+    return query.page(users, tombstones)
+
+
+def page_limit(value):
+    """``limit`` từ query string, giới hạn bởi USER_SYNC_MAX_PAGE_SIZE"""
+    maximum = getattr(settings, 'USER_SYNC_MAX_PAGE_SIZE', 1000)
+    if value in (None, ''):
+        return min(getattr(settings, 'USER_SYNC_PAGE_SIZE', 500), maximum)
+    try:
+        limit = int(value)
+    except ValueError:
+        raise TokenError('limit phải là số nguyên')
+    if limit < 1:
+        raise TokenError('limit phải lớn hơn 0')
+    return min(limit, maximum)
+
+
+def delete_users(filter, batch_size=5000):
+    """Xóa nhiều User theo filter, ghi tombstone cho từng người (QuerySet.delete bỏ qua User.delete)"""
+    from .fragments import bump_data_version
+    from .models import User, UserTombstone
+
+    users = User._get_collection()
+    tombstones = UserTombstone._get_collection()
+    deleted_at = datetime.now()
+    deleted = 0
+    batch = []
+    for document in users.find(filter, {'username': 1}):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            deleted += _delete_batch(users, tombstones, batch, deleted_at)
+            batch = []
+    if batch:
+        deleted += _delete_batch(users, tombstones, batch, deleted_at)
+    if deleted:
+        bump_data_version()  # như User.delete()
+    return deleted
+
+
+def _delete_batch(users, tombstones, batch, deleted_at):
+    tombstones.insert_many(
+        [{'user_id': doc['_id'], 'username': doc['username'], 'deleted_at': deleted_at} for doc in batch],
+        ordered=False,
+    )
+    return users.delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}}).deleted_count
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+from .fragments import data_version
+
+
+def fragment_cache(request):
+    """``fragment_timeout`` và ``data_version`` (tính lười) cho ``{% cache %}`` trong template"""
+    return {
+        'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'data_version': data_version,
+    }
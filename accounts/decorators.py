@@ -1,28 +1,64 @@
 from functools import wraps
+import hmac
+from asgiref.sync import iscoroutinefunction
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.http import JsonResponse
-from .utils import get_current_user
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt as django_csrf_exempt
+from .utils import aget_current_user, get_current_user, session_is_admin
 
 
-def login_required(view_func):
-    """Decorator to require user login"""
+def _guard(view_func, check):
+    """Wrap a sync or async view with ``check(request, user)``
+
+    ``check`` trả về response từ chối truy cập hoặc None. View async dùng
+    ``aget_current_user`` (driver MongoDB async) nên không giữ thread khi chờ DB.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            denied = check(request, await aget_current_user(request))
+            if denied is not None:
+                return denied
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        user = get_current_user(request)
+        denied = check(request, get_current_user(request))
+        if denied is not None:
+            return denied
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def csrf_exempt(view_func):
+    """csrf_exempt that keeps async views async (Django 4.2 wraps them in a sync function)"""
+    if not iscoroutinefunction(view_func):
+        return django_csrf_exempt(view_func)
+
+    @wraps(view_func)
+    async def wrapper_view(*args, **kwargs):
+        return await view_func(*args, **kwargs)
+
+    wrapper_view.csrf_exempt = True
+    return wrapper_view
+
+
+def login_required(view_func):
+    """Decorator to require user login"""
+    def check(request, user):
         if not user:
             messages.error(request, 'Vui lòng đăng nhập để truy cập trang này.')
             return redirect('login')
-        return view_func(request, *args, **kwargs)
-    return wrapper
+    return _guard(view_func, check)
 
 
 def role_required(*allowed_roles):
     """Decorator to require specific roles"""
     def decorator(view_func):
-        @wraps(view_func)
-        def wrapper(request, *args, **kwargs):
-            user = get_current_user(request)
+        def check(request, user):
             if not user:
                 messages.error(request, 'Vui lòng đăng nhập để truy cập trang này.')
                 return redirect('login')
@@ -30,17 +66,13 @@ def role_required(*allowed_roles):
             if user.role not in allowed_roles:
                 messages.error(request, f'Bạn không có quyền truy cập trang này. Cần vai trò: {", ".join(allowed_roles)}')
                 return redirect('dashboard')
-            
-            return view_func(request, *args, **kwargs)
-        return wrapper
+        return _guard(view_func, check)
     return decorator
 
 
 def admin_required(view_func):
     """Decorator to require admin role"""
-    @wraps(view_func)
-    def wrapper(request, *args, **kwargs):
-        user = get_current_user(request)
+    def check(request, user):
         if not user:
             messages.error(request, 'Vui lòng đăng nhập để truy cập trang này.')
             return redirect('login')
@@ -48,16 +80,12 @@ def admin_required(view_func):
         if not user.is_admin():
             messages.error(request, 'Chỉ quản trị viên mới có thể truy cập trang này.')
             return redirect('dashboard')
-        
-        return view_func(request, *args, **kwargs)
-    return wrapper
+    return _guard(view_func, check)
 
 
 def user_required(view_func):
     """Decorator to require user role (both admin and regular user can access)"""
-    @wraps(view_func)
-    def wrapper(request, *args, **kwargs):
-        user = get_current_user(request)
+    def check(request, user):
         if not user:
             messages.error(request, 'Vui lòng đăng nhập để truy cập trang này.')
             return redirect('login')
@@ -66,17 +94,13 @@ def user_required(view_func):
         if user.role not in ['admin', 'user']:
             messages.error(request, 'Bạn không có quyền truy cập trang này.')
             return redirect('dashboard')
-        
-        return view_func(request, *args, **kwargs)
-    return wrapper
+    return _guard(view_func, check)
 
 
 def permission_required(permission):
     """Decorator to require specific permission"""
     def decorator(view_func):
-        @wraps(view_func)
-        def wrapper(request, *args, **kwargs):
-            user = get_current_user(request)
+        def check(request, user):
             if not user:
                 messages.error(request, 'Vui lòng đăng nhập để truy cập trang này.')
                 return redirect('login')
@@ -84,28 +108,21 @@ def permission_required(permission):
             if not user.has_permission(permission):
                 messages.error(request, f'Bạn không có quyền "{permission}" để truy cập trang này.')
                 return redirect('dashboard')
-            
-            return view_func(request, *args, **kwargs)
-        return wrapper
+        return _guard(view_func, check)
     return decorator
 
 
 def api_login_required(view_func):
     """API decorator to require user login"""
-    @wraps(view_func)
-    def wrapper(request, *args, **kwargs):
-        user = get_current_user(request)
+    def check(request, user):
         if not user:
             return JsonResponse({'error': 'Authentication required'}, status=401)
-        return view_func(request, *args, **kwargs)
-    return wrapper
+    return _guard(view_func, check)
 
 
 def api_admin_required(view_func):
     """API decorator to require admin role"""
-    @wraps(view_func)
-    def wrapper(request, *args, **kwargs):
-        user = get_current_user(request)
+    def check(request, user):
         if not user:
             return JsonResponse({'error': 'Authentication required'}, status=401)
         
@@ -114,17 +131,13 @@ def api_admin_required(view_func):
                 'error': 'Admin privileges required',
                 'user_role': user.role
             }, status=403)
-        
-        return view_func(request, *args, **kwargs)
-    return wrapper
+    return _guard(view_func, check)
 
 
 def api_role_required(*allowed_roles):
     """API decorator to require specific roles"""
     def decorator(view_func):
-        @wraps(view_func)
-        def wrapper(request, *args, **kwargs):
-            user = get_current_user(request)
+        def check(request, user):
             if not user:
                 return JsonResponse({'error': 'Authentication required'}, status=401)
             
@@ -133,7 +146,28 @@ def api_role_required(*allowed_roles):
                     'error': f'Insufficient permissions. Required roles: {", ".join(allowed_roles)}',
                     'user_role': user.role
                 }, status=403)
-            
+        return _guard(view_func, check)
+    return decorator
+
+
+def api_session_admin_required(view_func):
+    """API decorator that checks the admin role without loading the full user.
+
+    Role lấy từ cache ngắn hạn trong process (``utils.session_is_admin``), dùng
+    cho endpoint giám sát cần phản hồi nhanh cả khi database gặp sự cố. Có thể
+    dùng header ``Authorization: Bearer <SYSTEM_STATUS_TOKEN>`` cho công cụ giám
+    sát bên ngoài.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        token = getattr(settings, 'SYSTEM_STATUS_TOKEN', '')
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and hmac.compare_digest(authorization, f'Bearer {token}'):
             return view_func(request, *args, **kwargs)
-        return wrapper
-    return decorator 
\ No newline at end of file
+
+        if not request.session.get('is_authenticated'):
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        if not session_is_admin(request):
+            return JsonResponse({'error': 'Admin privileges required'}, status=403)
+        return view_func(request, *args, **kwargs)
+    return wrapper
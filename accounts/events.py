@@ -0,0 +1,287 @@
+"""
+Sự kiện thời gian thực cho admin qua Server-Sent Events (``/api/events/``).
+
+Mỗi worker có một ``EventBroadcaster`` dùng chung: ``User.save`` (và API async)
+gọi ``user_saved`` để phát ``user_created`` / ``role_changed`` /
+``status_changed``; một task nền duy nhất đọc số liệu đã cache của
+``database_health`` và phát ``session_count`` khi thay đổi. Số client kết nối
+không làm tăng số truy vấn MongoDB.
+
+Mỗi client có hàng đợi giới hạn ``SSE_QUEUE_SIZE``: client đọc không kịp (hàng
+đợi đầy) bị ngắt kết nối thay vì giữ bộ nhớ vô hạn, client không lấy sự kiện
+hay keepalive nào trong ``SSE_IDLE_TIMEOUT_SECONDS`` bị loại. EventSource của
+trình duyệt tự kết nối lại và nhận ảnh chụp số liệu mới.
+
+Với ``SSE_EVENT_FEED`` bật, ``user_saved`` ghi sự kiện vào capped collection
+``admin_events`` thay vì phát trực tiếp; mỗi worker đang có client SSE đọc
+collection đó bằng một tailable cursor trên thread nền nên client ở mọi worker
+đều nhận sự kiện. Ghi feed lỗi (hoặc feed tắt, như với mongomock) thì chỉ phát
+cho client của worker hiện tại.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from pymongo import CursorType
+
+from . import monitoring
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = object()
+
+
+class Subscriber:
+    """One connected client: bounded queue on the event loop serving it"""
+
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        self.closed = False
+        self.reason = None
+
+    def offer(self, message):
+        """Runs on ``self.loop``; False if the queue is full"""
+        if self.closed:
+            return True
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self, reason):
+        """Runs on ``self.loop``: wake the stream so it ends"""
+        if self.closed:
+            return
+        self.closed = True
+        self.reason = reason
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+
+    async def next_message(self, timeout):
+        """Next SSE message, None on timeout, ``_CLOSED`` when evicted"""
+        try:
+            message = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            message = None
+        self.last_seen = time.monotonic()
+        return message
+
+
+def format_event(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+class EventBroadcaster:
+    """In-process fan-out of admin events to SSE subscribers"""
+
+    def __init__(self, max_clients=500, queue_size=100, idle_timeout=60.0, poll_interval=5.0):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pollers = {}  # event loop -> task
+        self._tail = None  # thread đọc admin_events
+        self.feed = False
+        self.counts = {}
+        self.published = 0
+        self.evicted_slow = 0
+        self.evicted_idle = 0
+        self.rejected = 0
+        self.feed_errors = 0
+
+    def configure(self, settings):
+        self.max_clients = getattr(settings, 'SSE_MAX_CLIENTS', self.max_clients)
+        self.queue_size = getattr(settings, 'SSE_QUEUE_SIZE', self.queue_size)
+        self.idle_timeout = getattr(settings, 'SSE_IDLE_TIMEOUT_SECONDS', self.idle_timeout)
+        self.poll_interval = getattr(settings, 'SSE_POLL_SECONDS', self.poll_interval)
+        self.feed = getattr(settings, 'SSE_EVENT_FEED', self.feed)
+
+    def subscribe(self):
+        """New subscriber on the running loop, or None when the worker is full"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                self.rejected += 1
+                return None
+            subscriber = Subscriber(loop, self.queue_size)
+            if self.counts:
+                # Ảnh chụp số liệu hiện tại (không truy vấn); sau đó chỉ nhận thay đổi
+                subscriber.offer(format_event(next(self._ids), 'session_count', dict(self.counts)))
+            self._subscribers.add(subscriber)
+            poller = self._pollers.get(loop)
+            if poller is None or poller.done():
+                self._pollers[loop] = loop.create_task(self._poll(loop))
+            if self.feed and (self._tail is None or not self._tail.is_alive()):
+                self._tail = threading.Thread(target=self._tail_feed, name='sse-feed', daemon=True)
+                self._tail.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def emit(self, event, data):
+        """Phát sự kiện tới client của mọi worker (qua ``admin_events`` khi feed bật)"""
+        if self.feed:
+            from .models import AdminEvent
+
+            try:
+                AdminEvent._get_collection().insert_one({'event': event, 'data': data, 'created_at': datetime.now()})
+                return
+            except Exception as e:
+                self.feed_errors += 1
+                logger.warning('Could not write admin event %s to the feed: %s', event, e)
+        self.publish(event, data)
+
+    def publish(self, event, data):
+        """Phát cho client của worker này. Thread-safe: gọi được từ thread lẫn event loop"""
+        with self._lock:
+            subscribers = tuple(self._subscribers)
+        if not subscribers:
+            return
+        message = format_event(next(self._ids), event, data)
+        self.published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(self._deliver, subscriber, message)
+            except RuntimeError:
+                self.unsubscribe(subscriber)  # loop already closed
+
+    def _has_subscribers(self):
+        with self._lock:
+            if self._subscribers:
+                return True
+            self._tail = None
+            return False
+
+    def _tail_feed(self):
+        """Thread nền: sự kiện mới trong ``admin_events`` -> ``publish``; dừng khi hết client"""
+        from .models import AdminEvent
+
+        last_id = None
+        while self._has_subscribers():
+            try:
+                with monitoring.suppress():
+                    collection = AdminEvent._get_collection()
+                    if last_id is None:
+                        # Chỉ sự kiện sau thời điểm bắt đầu đọc
+                        newest = collection.find_one({}, {'_id': 1}, sort=[('$natural', -1)])
+                        last_id = newest['_id'] if newest else None
+                    query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+                    cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(1000)
+                    while cursor.alive:
+                        document = cursor.try_next()
+                        if document is None:
+                            if not self._has_subscribers():
+                                cursor.close()
+                                return
+                            continue
+                        last_id = document['_id']
+                        self.publish(document['event'], document['data'])
+            except Exception as e:
+                self.feed_errors += 1
+                logger.warning('Admin event feed failed: %s', e)
+            time.sleep(1.0)  # cursor chết (collection rỗng) hoặc lỗi: mở lại sau
+
+    def _deliver(self, subscriber, message):
+        if not subscriber.offer(message):
+            self.evicted_slow += 1
+            logger.info('SSE client evicted: queue full (%d events)', self.queue_size)
+            self.unsubscribe(subscriber)
+            subscriber.close('slow')
+
+    async def _poll(self, loop):
+        """Một task mỗi event loop: số liệu session + loại client idle"""
+        from .health import database_health
+
+        while True:
+            with self._lock:
+                subscribers = [s for s in self._subscribers if s.loop is loop]
+                if not subscribers:
+                    self._pollers.pop(loop, None)
+                    return
+            now = time.monotonic()
+            for subscriber in subscribers:
+                if now - subscriber.last_seen > self.idle_timeout:
+                    self.evicted_idle += 1
+                    self.unsubscribe(subscriber)
+                    subscriber.close('idle')
+
+            database_health.get()  # làm mới nền khi quá TTL, không chặn
+            counts = {
+                'active_sessions': database_health.active_sessions,
+                'total_users': database_health.total_users,
+            }
+            if database_health.ok and counts != self.counts:
+                self.counts = counts
+                self.publish('session_count', counts)
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self):
+        with self._lock:
+            clients = len(self._subscribers)
+        return {
+            'clients': clients,
+            'published': self.published,
+            'evicted_slow': self.evicted_slow,
+            'evicted_idle': self.evicted_idle,
+            'rejected': self.rejected,
+            'feed': self.feed,
+            'feed_errors': self.feed_errors,
+        }
+
+
+broadcaster = EventBroadcaster()
+
+
+async def stream(subscriber, keepalive=15.0, max_age=300.0, retry_ms=5000):
+    """Body của response SSE cho một subscriber
+
+    Django 4.2 không phát hiện client ngắt kết nối giữa stream, nên mỗi kết nối
+    kết thúc sau ``max_age`` giây; EventSource kết nối lại sau ``retry_ms``.
+    """
+    try:
+        yield f'retry: {retry_ms}\n\n'
+        deadline = subscriber.connected_at + max_age
+        while time.monotonic() < deadline:
+            message = await subscriber.next_message(min(keepalive, max(0.0, deadline - time.monotonic())))
+            if message is _CLOSED:
+                break
+            yield message if message is not None else ': keepalive\n\n'
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+def user_saved(user, created, changed_fields):
+    """Phát sự kiện cho một User vừa được lưu (gọi sau khi ghi thành công)"""
+    if created:
+        broadcaster.emit('user_created', {
+            'username': user.username,
+            'full_name': user.get_full_name(),
+            'role': user.role,
+            'role_display': user.get_role_display(),
+        })
+        return
+    if 'role' in changed_fields:
+        broadcaster.emit('role_changed', {
+            'username': user.username,
+            'role': user.role,
+            'role_display': user.get_role_display(),
+        })
+    if 'is_active' in changed_fields:
+        broadcaster.emit('status_changed', {
+            'username': user.username,
+            'is_active': user.is_active,
+        })
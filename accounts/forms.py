@@ -1,8 +1,11 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import User
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 
 class CustomUserCreationForm(forms.Form):
     """Form để đăng ký user với MongoDB"""
@@ -415,5 +418,5 @@ class PasswordChangeForm(forms.Form):
             self.user.save()
             return True
         except Exception as e:
-            print(f"Error saving new password: {e}")
+            logger.error("Error saving new password: %s", e)
             return False 
\ No newline at end of file
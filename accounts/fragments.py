@@ -0,0 +1,124 @@
+"""
+Cache fragment template theo vai trò và phiên bản dữ liệu.
+
+Template dùng ``{% cache %}`` của Django trên cache ``fragments`` với key gồm
+vai trò người xem và ``data_version``:
+
+    {% cache fragment_timeout 'admin_stats' user.role data_version using='fragments' %}
+
+``data_version`` tăng mỗi khi một User được tạo/xóa hoặc đổi trường hiển thị
+trong fragment (tên, email, vai trò, ...), nên fragment cũ không bao giờ được dùng
+lại sau thay đổi đó. Cache và ``data_version`` dùng chung giữa các worker trên
+cùng máy (accounts/shmcache.py): process ghi tăng version một lần cho tất cả.
+Thay đổi từ máy khác (hoặc từ worker khác khi ``SHARED_CACHE`` tắt) đến qua bus
+vô hiệu hóa (accounts/invalidation.py, ``users_invalidated``). Lệnh ghi hàng
+loạt không qua ``User.save`` (seed_users, ``changes.delete_users``) tự gọi
+``bump_data_version``.
+Số session đang hoạt động không tăng version (mỗi lần đăng nhập sẽ làm mất
+cache) mà chỉ cũ tối đa ``FRAGMENT_CACHE_TIMEOUT`` giây.
+
+Số liệu trong fragment được tính lười qua ``DashboardStats``: khi fragment còn
+trong cache, view không chạy truy vấn đếm nào. Truy vấn đếm đọc từ secondary
+(accounts/routing.py) trừ khi admin vừa ghi.
+"""
+import logging
+import time
+
+from django.core.cache import caches
+
+from .routing import analytics
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'fragments'
+VERSION_KEY = 'accounts:data_version'
+
+# Trường của User xuất hiện trong các fragment được cache
+FRAGMENT_FIELDS = frozenset({'username', 'first_name', 'last_name', 'email', 'role', 'is_active', 'date_joined'})
+
+
+def data_version():
+    """Phiên bản dữ liệu hiện tại (khởi tạo theo thời gian để khác sau khi restart/evict)"""
+    from .invalidation import invalidation_bus
+
+    invalidation_bus.ensure_started()
+    cache = caches[CACHE_ALIAS]
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def bump_data_version():
+    cache = caches[CACHE_ALIAS]
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+    except Exception as e:
+        logger.warning('Could not bump fragment data version: %s', e)
+
+
+def shared_cache():
+    """True nếu cache fragments dùng chung giữa các worker trên máy (accounts/shmcache.py)"""
+    from .shmcache import SharedMemoryCache
+
+    return isinstance(caches[CACHE_ALIAS], SharedMemoryCache)
+
+
+def users_invalidated(invalidation):
+    """Callback của bus vô hiệu hóa: User đổi ở worker khác (hoặc chính worker này)
+
+    Sự kiện từ chế độ poll không biết trường nào đổi (mỗi lần đăng nhập cũng là
+    một sự kiện). Với cache dùng chung, process ghi trên máy này đã tăng version
+    nên bỏ qua chúng; fragment của thay đổi từ máy khác cũ tối đa
+    ``FRAGMENT_CACHE_TIMEOUT`` giây. Change stream có danh sách trường nên luôn xử lý.
+    """
+    if not invalidation.flush and invalidation.fields is None and shared_cache():
+        return
+    if invalidation.touches(FRAGMENT_FIELDS):
+        bump_data_version()
+
+
+class DashboardStats:
+    """Số liệu cho home/dashboard/admin dashboard, chỉ truy vấn khi template cần
+
+    Truyền phương thức (không gọi) vào context: template Django tự gọi callable
+    khi render biến, và bỏ qua hoàn toàn nếu fragment chứa biến đó lấy từ cache.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self._values = {}
+
+    def _get(self, name, compute, default):
+        if name not in self._values:
+            try:
+                self._values[name] = compute()
+            except Exception as e:
+                logger.warning('Dashboard stat %s failed: %s', name, e)
+                self._values[name] = default
+        return self._values[name]
+
+    def total_users(self):
+        from .models import User
+        return self._get('total_users', lambda: analytics(User.objects, self.request).count(), 0)
+
+    def active_sessions(self):
+        from .models import UserSession
+        return self._get('active_sessions', lambda: analytics(UserSession.objects, self.request).count(), 0)
+
+    def role_stats(self):
+        from .models import User
+        return self._get(
+            'role_stats',
+            lambda: {role_name: analytics(User.objects(role=role_key), self.request).count()
+                     for role_key, role_name in User.ROLES},
+            {},
+        )
+
+    def recent_users(self):
+        from .models import User
+        return self._get('recent_users',
+                         lambda: list(analytics(User.objects, self.request).order_by('-date_joined')[:5]), [])
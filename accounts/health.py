@@ -0,0 +1,95 @@
+"""
+Kiểm tra sức khỏe MongoDB với kết quả được cache.
+
+Ping và đếm document chạy trên thread nền; request chỉ đọc kết quả gần nhất nên
+không bị chặn khi MongoDB chậm hoặc mất kết nối.
+
+Lệnh đọc trên đường request (session, role admin) chạy trong ``request_lookup()``
+và bỏ qua hẳn khi lần kiểm tra gần nhất báo MongoDB đang lỗi.
+"""
+import threading
+import time
+from datetime import datetime
+
+import pymongo
+from django.conf import settings
+
+
+class DatabaseHealth:
+    """Cached ping latency and document counts"""
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self.ok = None
+        self.latency_ms = None
+        self.error = None
+        self.checked_at = None
+        self.total_users = 0
+        self.active_sessions = 0
+        self._checked_monotonic = 0.0
+        self._refreshing = threading.Lock()
+        self._done = threading.Event()
+
+    def check(self):
+        """Ping now (blocking) and update the cached result"""
+        from mongoengine.connection import get_db
+        from .models import User, UserSession
+        from . import monitoring
+
+        with monitoring.suppress():
+            started = time.perf_counter()
+            try:
+                get_db().command('ping')
+                self.latency_ms = round((time.perf_counter() - started) * 1000, 3)
+                # estimated_document_count reads collection metadata only
+                self.total_users = User._get_collection().estimated_document_count()
+                self.active_sessions = UserSession._get_collection().estimated_document_count()
+                self.ok, self.error = True, None
+            except Exception as e:
+                self.ok, self.error = False, str(e)
+        self.checked_at = datetime.now()
+        self._checked_monotonic = time.monotonic()
+
+    def _refresh(self):
+        try:
+            self.check()
+        finally:
+            self._refreshing.release()
+            self._done.set()
+
+    def refresh_in_background(self):
+        """Start a refresh unless one is already running"""
+        if not self._refreshing.acquire(blocking=False):
+            return False
+        self._done.clear()
+        threading.Thread(target=self._refresh, name='mongo-health', daemon=True).start()
+        return True
+
+    @property
+    def down(self):
+        """True khi lần kiểm tra gần nhất thất bại (làm mới nền nếu đã cũ)"""
+        if time.monotonic() - self._checked_monotonic > self.ttl:
+            self.refresh_in_background()
+        return self.ok is False
+
+    def get(self, wait=0.0, force=False):
+        """Return the cached result, refreshing it in the background when stale"""
+        if force or time.monotonic() - self._checked_monotonic > self.ttl:
+            self.refresh_in_background()
+            if wait:
+                self._done.wait(wait)
+        return {
+            'ok': self.ok,
+            'ping_ms': self.latency_ms,
+            'error': self.error,
+            'checked_at': self.checked_at.isoformat() if self.checked_at else None,
+            'refreshing': self._refreshing.locked(),
+        }
+
+
+database_health = DatabaseHealth()
+
+
+def request_lookup():
+    """Giới hạn thời gian (cả chọn server) cho một lệnh đọc trên đường request"""
+    return pymongo.timeout(getattr(settings, 'MONGO_REQUEST_LOOKUP_TIMEOUT_MS', 1000) / 1000)
@@ -0,0 +1,316 @@
+"""
+Bus vô hiệu hóa cache giữa các worker.
+
+Cache trong tiến trình (``fragments`` theo ``data_version``, ...) chỉ biết thay
+đổi do chính worker đó ghi. Một thread nền mỗi worker theo dõi ``users`` và
+``user_sessions`` rồi gọi các callback đã ``register`` với ``Invalidation``:
+
+- Replica set / sharded cluster: change stream trên database. Update chỉ đổi
+  ``NOISE_FIELDS`` (``last_activity`` mỗi request) bị lọc ngay trên server.
+  Resume token giữ trong bộ nhớ nên mất kết nối ngắn không lỡ sự kiện; token
+  mất hiệu lực (oplog đã trôi qua, stream bị invalidate) thì mở lại từ hiện tại
+  và xóa toàn bộ cache đã đăng ký.
+- Standalone / mongomock: mỗi ``INVALIDATION_POLL_SECONDS`` đọc luồng thay đổi
+  của accounts/changes.py (index ``updated_at``) cho users, và số document +
+  ``_id`` mới nhất cho user_sessions. Không ghi thêm gì khi ghi dữ liệu.
+
+Worker hội tụ sau độ trễ mạng (change stream, tối đa ``INVALIDATION_MAX_BACKOFF``
+khi mất kết nối) hoặc ``INVALIDATION_POLL_SECONDS + USER_SYNC_LAG_SECONDS``
+(polling). Thread khởi động lười qua ``ensure_started`` nên chạy đúng cả sau khi
+server fork worker.
+"""
+import logging
+import threading
+import time
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from . import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Mã lỗi change stream: không resume được từ token đã giữ
+RESUME_TOKEN_LOST = frozenset({
+    260,  # InvalidResumeToken
+    280,  # ChangeStreamFatalError
+    286,  # ChangeStreamHistoryLost
+})
+NOT_SUPPORTED = frozenset({40573})  # $changeStream chỉ chạy trên replica set
+
+# Update chỉ chạm các trường này không làm cache nào cũ
+NOISE_FIELDS = {'user_sessions': ('last_activity',)}
+
+
+class Invalidation:
+    """Một document (``key`` = _id) hoặc cả collection (``key`` None) đã thay đổi"""
+
+    __slots__ = ('collection', 'key', 'fields', 'source')
+
+    def __init__(self, collection, key=None, fields=None, source=''):
+        self.collection = collection
+        self.key = key
+        self.fields = fields  # tên trường cấp cao nhất đã đổi, None nếu không rõ
+        self.source = source
+
+    @property
+    def flush(self):
+        return self.key is None
+
+    def touches(self, fields):
+        """True nếu thay đổi có thể chạm một trong ``fields``"""
+        return self.fields is None or not self.fields.isdisjoint(fields)
+
+    def __repr__(self):
+        return f'Invalidation({self.collection!r}, {self.key!r}, fields={self.fields!r}, source={self.source!r})'
+
+
+def supports_change_streams(db):
+    """True với replica set hoặc mongos (hello có setName / msg=isdbgrid)"""
+    try:
+        hello = db.client.admin.command('hello')
+    except Exception:
+        return False
+    return bool(hello.get('setName') or hello.get('msg') == 'isdbgrid')
+
+
+class ChangeStreamWatcher:
+    """Nguồn sự kiện: change stream trên database, lọc theo collection"""
+
+    name = 'changestream'
+
+    def __init__(self, db, collections, max_await_ms=1000, max_backoff=30.0):
+        self.db = db
+        self.collections = tuple(collections)
+        self.max_await_ms = max_await_ms
+        self.max_backoff = max_backoff
+        self.resume_token = None
+
+    def pipeline(self):
+        changed_fields = {'$concatArrays': [
+            {'$map': {
+                'input': {'$objectToArray': {'$ifNull': ['$updateDescription.updatedFields', {}]}},
+                'in': '$$this.k',
+            }},
+            {'$ifNull': ['$updateDescription.removedFields', []]},
+        ]}
+        pipeline = [
+            {'$match': {'ns.coll': {'$in': list(self.collections)}}},
+            {'$project': {'operationType': 1, 'ns': 1, 'documentKey': 1, 'fields': changed_fields}},
+        ]
+        noise = [
+            {'$or': [
+                {'operationType': {'$ne': 'update'}},
+                {'ns.coll': {'$ne': collection}},
+                {'$expr': {'$not': [{'$setIsSubset': ['$fields', list(fields)]}]}},
+            ]}
+            for collection, fields in NOISE_FIELDS.items() if collection in self.collections
+        ]
+        if noise:
+            pipeline.append({'$match': {'$and': noise}})
+        return pipeline
+
+    def invalidations(self, change):
+        """Sự kiện change stream -> danh sách Invalidation"""
+        operation = change['operationType']
+        collection = change.get('ns', {}).get('coll')
+        if operation in ('insert', 'update', 'replace', 'delete'):
+            fields = None
+            if operation == 'update':
+                fields = frozenset(field.split('.', 1)[0] for field in change.get('fields', ()))
+            return [Invalidation(collection, change['documentKey']['_id'], fields, self.name)]
+        # drop, rename, dropDatabase, invalidate: không biết document nào
+        collections = [collection] if collection in self.collections else self.collections
+        return [Invalidation(name, source=self.name) for name in collections]
+
+    def run(self, bus, stop):
+        """Chạy đến khi ``stop``; False nếu server không hỗ trợ change stream"""
+        backoff = 0.5
+        while not stop.is_set():
+            try:
+                with self.db.watch(self.pipeline(), resume_after=self.resume_token,
+                                   max_await_time_ms=self.max_await_ms) as stream:
+                    if self.resume_token is None:
+                        # Thay đổi trước khi stream mở không còn biết được
+                        bus.flush('changestream-start')
+                    backoff = 0.5
+                    while not stop.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            for invalidation in self.invalidations(change):
+                                bus.publish(invalidation)
+                            if change['operationType'] == 'invalidate':
+                                self.resume_token = None
+                                break
+                        # Post-batch token: tiến lên cả khi không có sự kiện
+                        self.resume_token = stream.resume_token
+                continue
+            except OperationFailure as e:
+                if e.code in NOT_SUPPORTED:
+                    return False
+                if e.code in RESUME_TOKEN_LOST or e.has_error_label('NonResumableChangeStreamError'):
+                    logger.warning('Change stream resume token lost (%s), reopening from now', e.code)
+                    bus.resume_token_lost += 1
+                    self.resume_token = None
+                    continue
+                logger.warning('Change stream failed: %s', e)
+            except PyMongoError as e:
+                logger.warning('Change stream failed: %s', e)
+            bus.errors += 1
+            stop.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+        return True
+
+
+class VersionPoller:
+    """Nguồn sự kiện khi không có change stream: đọc định kỳ phiên bản rẻ của dữ liệu"""
+
+    name = 'poll'
+    page_size = 500
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.users_token = None
+        self.sessions_version = None
+
+    def poll_users(self, bus):
+        from . import changes
+
+        if self.users_token is None:
+            self.users_token = changes.latest_token()
+        while True:
+            try:
+                page = changes.changes_page(self.users_token, self.page_size)
+            except changes.ResyncRequired:
+                self.users_token = None
+                bus.publish(Invalidation('users', source=self.name))
+                return
+            for change in page['changes']:
+                bus.publish(Invalidation('users', ObjectId(change['id']), source=self.name))
+            self.users_token = page['next']
+            if not page['has_more']:
+                return
+
+    def poll_sessions(self, bus):
+        from .models import UserSession
+
+        collection = UserSession._get_collection()
+        newest = collection.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        # Đăng nhập đổi _id mới nhất, đăng xuất/hết hạn đổi số document
+        version = (collection.estimated_document_count(), newest['_id'] if newest else None)
+        if self.sessions_version is not None and version != self.sessions_version:
+            bus.publish(Invalidation('user_sessions', source=self.name))
+        self.sessions_version = version
+
+    def run(self, bus, stop):
+        bus.flush('poll-start')
+        while True:
+            try:
+                if bus.has_handlers('users'):
+                    self.poll_users(bus)
+                if bus.has_handlers('user_sessions'):
+                    self.poll_sessions(bus)
+            except Exception as e:
+                bus.errors += 1
+                logger.warning('Invalidation poll failed: %s', e)
+            if stop.wait(self.interval):
+                return True
+
+
+class InvalidationBus:
+    """Phát Invalidation tới cache cục bộ đã đăng ký, từ một thread nền mỗi worker"""
+
+    COLLECTIONS = ('users', 'user_sessions')
+
+    def __init__(self, mode='auto', poll_interval=2.0, max_backoff=30.0):
+        self.mode = mode  # auto | changestream | poll | off
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self._handlers = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.source = None
+        self.received = 0
+        self.flushes = 0
+        self.errors = 0
+        self.resume_token_lost = 0
+        self.last_event_at = None
+
+    def configure(self, settings):
+        self.mode = getattr(settings, 'INVALIDATION_BUS', self.mode)
+        self.poll_interval = getattr(settings, 'INVALIDATION_POLL_SECONDS', self.poll_interval)
+        self.max_backoff = getattr(settings, 'INVALIDATION_MAX_BACKOFF', self.max_backoff)
+
+    def register(self, collection, callback):
+        """Gọi ``callback(invalidation)`` cho mỗi thay đổi của ``collection`` (trên thread nền)"""
+        callbacks = self._handlers.setdefault(collection, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def has_handlers(self, collection):
+        return bool(self._handlers.get(collection))
+
+    def publish(self, invalidation):
+        self.received += 1
+        self.last_event_at = time.time()
+        for callback in self._handlers.get(invalidation.collection, ()):
+            try:
+                callback(invalidation)
+            except Exception as e:
+                logger.warning('Invalidation handler %r failed: %s', callback, e)
+
+    def flush(self, reason):
+        """Mọi cache đã đăng ký có thể đã cũ (bus mới mở, mất resume token)"""
+        self.flushes += 1
+        for collection in tuple(self._handlers):
+            self.publish(Invalidation(collection, source=reason))
+
+    def ensure_started(self):
+        """Khởi động thread nền nếu chưa chạy (rẻ, gọi được trên mỗi lần đọc cache)"""
+        if self.mode == 'off' or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,),
+                                                name='cache-invalidation', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _source(self):
+        from mongoengine.connection import get_db
+
+        db = get_db()
+        if self.mode == 'changestream' or (self.mode == 'auto' and supports_change_streams(db)):
+            return ChangeStreamWatcher(db, self.COLLECTIONS, max_backoff=self.max_backoff)
+        return VersionPoller(self.poll_interval)
+
+    def _run(self, stop):
+        with monitoring.suppress():
+            source = self._source()
+            self.source = source.name
+            if source.run(self, stop) is False:
+                logger.warning('Change streams not supported, falling back to polling')
+                source = VersionPoller(self.poll_interval)
+                self.source = source.name
+                source.run(self, stop)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'source': self.source,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'received': self.received,
+            'flushes': self.flushes,
+            'errors': self.errors,
+            'resume_token_lost': self.resume_token_lost,
+            'last_event_age_s': round(time.time() - self.last_event_at, 1) if self.last_event_at else None,
+        }
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,116 @@
+"""
+Pipeline logging không chặn request: QueueHandler + thread ghi nền, JSON có request id.
+
+Trong thread của request chỉ còn: kiểm tra level, gắn request id, lọc mẫu và
+đưa record vào hàng đợi. Định dạng JSON và ghi ra console/file do
+``QueueListener`` thực hiện trên thread nền (khởi động trong ``AccountsConfig.ready``).
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import zlib
+from datetime import datetime, timezone
+
+_request_id = contextvars.ContextVar('request_id', default='-')
+
+# Attributes every LogRecord has; anything else was passed through ``extra=``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'taskName',
+}
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def set_request_id(request_id):
+    """Đặt request id cho context hiện tại; trả về token để reset"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """Gắn ``record.request_id`` từ context của request đang chạy"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Chỉ giữ một phần log DEBUG, theo request (cả request được giữ hoặc bỏ)
+
+    Record từ INFO trở lên luôn được giữ.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.threshold = int(float(rate) * 1000)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.threshold >= 1000:
+            return True
+        request_id = getattr(record, 'request_id', None) or _request_id.get()
+        return zlib.crc32(request_id.encode()) % 1000 < self.threshold
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'pid': record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener thread"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # The stock prepare() formats the message in the caller's thread; only
+        # tracebacks need rendering here because they reference live frames.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+def start_queue_listeners():
+    """Khởi động QueueListener của các NonBlockingQueueHandler đã cấu hình"""
+    import atexit
+
+    started = []
+    for name in logging.getHandlerNames():
+        handler = logging.getHandlerByName(name)
+        listener = getattr(handler, 'listener', None)
+        if isinstance(handler, NonBlockingQueueHandler) and listener is not None and listener._thread is None:
+            listener.start()
+            atexit.register(listener.stop)
+            started.append(name)
+    return started
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from accounts.fragments import bump_data_version
+from accounts.models import User, UserTombstone
+
+
+class Command(BaseCommand):
+    help = 'Gán updated_at cho User tạo trước khi có API đồng bộ /api/users/changes/'
+
+    def handle(self, *args, **options):
+        User.ensure_indexes()
+        UserTombstone.ensure_indexes()
+
+        # User cũ chưa từng hiện trong luồng thay đổi: coi như vừa thay đổi để client tải về
+        result = User._get_collection().update_many(
+            {'updated_at': None},
+            {'$set': {'updated_at': datetime.now()}},
+        )
+        if result.modified_count:
+            bump_data_version()
+            self.stdout.write(self.style.SUCCESS(f'✅ Đã gán updated_at cho {result.modified_count:,} người dùng.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Tất cả người dùng đã có updated_at.'))
@@ -0,0 +1,68 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.assets import BundleError, compressed_variants, find_bundles
+
+
+class Command(BaseCommand):
+    help = 'Tách các khối {% bundle %} trong template thành file CSS/JS đã minify (chạy trước collectstatic)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Chỉ kiểm tra bundle đã build có khớp template không (exit 1 nếu lệch)')
+        parser.add_argument('--output', default=None,
+                            help='Thư mục static để ghi bundle (mặc định STATICFILES_DIRS[0])')
+
+    def handle(self, *args, **options):
+        output = str(options['output'] or settings.STATICFILES_DIRS[0])
+        template_dirs = [str(directory) for engine in settings.TEMPLATES for directory in engine.get('DIRS', [])]
+
+        try:
+            bundles = find_bundles(template_dirs)
+        except BundleError as e:
+            raise CommandError(f'❌ {e}')
+
+        if not bundles:
+            self.stdout.write(self.style.WARNING('⚠️  Không tìm thấy khối {% bundle %} nào trong template'))
+            return
+
+        stale = []
+        total_source = total_minified = total_gzip = 0
+        for bundle in bundles:
+            content = bundle.minified().encode('utf-8')
+            path = os.path.join(output, bundle.path)
+            current = None
+            if os.path.exists(path):
+                with open(path, 'rb') as existing:
+                    current = existing.read()
+
+            source_size = len(bundle.source.encode('utf-8'))
+            gzip_size = len(compressed_variants(content).get('.gz', content))
+            total_source += source_size
+            total_minified += len(content)
+            total_gzip += gzip_size
+            template = os.path.relpath(bundle.template, settings.BASE_DIR)
+            line = (f'{bundle.path:<34} {source_size / 1024:7.1f} KB -> {len(content) / 1024:6.1f} KB'
+                    f' (gzip {gzip_size / 1024:5.1f} KB)  {template}:{bundle.line}')
+
+            if current == content:
+                self.stdout.write(f'   {line}')
+                continue
+            if options['check']:
+                stale.append(bundle.path)
+                self.stdout.write(self.style.ERROR(f'❌ {line}'))
+                continue
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as target:
+                target.write(content)
+            self.stdout.write(self.style.SUCCESS(f'✅ {line}'))
+
+        self.stdout.write(
+            f'📦 {len(bundles)} bundles: {total_source / 1024:.1f} KB inline -> '
+            f'{total_minified / 1024:.1f} KB minified ({total_gzip / 1024:.1f} KB gzip)'
+        )
+        if stale:
+            raise CommandError(f'❌ {len(stale)} bundle lệch với template, chạy: python manage.py build_assets')
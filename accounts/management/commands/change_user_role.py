@@ -1,4 +1,7 @@
+import getpass
+
 from django.core.management.base import BaseCommand, CommandError
+from accounts import audit
 from accounts.models import User
 
 
@@ -20,11 +23,17 @@ class Command(BaseCommand):
             
             # Lưu vai trò cũ
             old_role = user.get_role_display()
+            old_role_key = user.role
             
             # Cập nhật vai trò
             user.role = new_role
             user.save()  # This will automatically update is_staff and is_superuser
             
+            # Ghi audit log và ghi ngay (process sắp kết thúc)
+            audit.record(f'system:{getpass.getuser()}', 'role_change', username,
+                         {'role': (old_role_key, new_role)}, source='command')
+            audit.audit_buffer.flush()
+            
             new_role_display = user.get_role_display()
             
             self.stdout.write(
@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_db
+
+from accounts.query_plans import explain_command, summarize_plan
+from accounts.query_shapes import QUERY_SHAPES
+
+
+class Command(BaseCommand):
+    help = 'Kiểm tra index cho các truy vấn của ứng dụng bằng explain trên dữ liệu thật'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create',
+            action='store_true',
+            help='Tạo (background) các index còn thiếu cho những shape bị COLLSCAN/SORT',
+        )
+        parser.add_argument(
+            '--hot-only',
+            action='store_true',
+            help='Chỉ kiểm tra các truy vấn nóng (chạy trên mỗi request)',
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+        shapes = [shape for shape in QUERY_SHAPES if shape.hot or not options['hot_only']]
+
+        results = self.check_shapes(db, shapes)
+        problems = [(shape, summary) for shape, summary in results if self.is_problem(shape, summary)]
+
+        indexable = [shape for shape, summary in problems if summary['plan'] != 'ERROR']
+        if indexable and options['create']:
+            self.create_indexes(db, indexable)
+            rechecked = dict(self.check_shapes(db, indexable, quiet=True))
+            problems = [
+                (shape, rechecked.get(shape, summary)) for shape, summary in problems
+                if self.is_problem(shape, rechecked.get(shape, summary))
+            ]
+
+        self.stdout.write('=' * 80)
+        if not problems:
+            self.stdout.write(self.style.SUCCESS(f'✅ Tất cả {len(shapes)} query shape đều dùng index phù hợp.'))
+            return
+
+        errors = [shape for shape, summary in problems if summary['plan'] == 'ERROR']
+        missing = [shape for shape, summary in problems if summary['plan'] != 'ERROR']
+        if missing:
+            self.stdout.write(self.style.WARNING(f'⚠️  {len(missing)} query shape chưa có index phù hợp:'))
+        for shape in missing:
+            index = ', '.join(f'{field}:{direction}' for field, direction in shape.index or [])
+            self.stdout.write(f'   • {shape.name} ({shape.collection}) → gợi ý index: {index or "không có"}')
+
+        # explain lỗi = không kiểm chứng được index, không được coi là đạt
+        if errors:
+            raise CommandError(f'❌ Không explain được: {", ".join(shape.name for shape in errors)}')
+        hot_problems = [shape.name for shape in missing if shape.hot]
+        if hot_problems:
+            raise CommandError(f'❌ Truy vấn nóng chưa có index: {", ".join(hot_problems)}')
+
+    def check_shapes(self, db, shapes, quiet=False):
+        results = []
+        if not quiet:
+            self.stdout.write(f'🔍 Kiểm tra {len(shapes)} query shape:')
+            self.stdout.write('-' * 80)
+        for shape in shapes:
+            command_name, command = shape.command()
+            try:
+                summary = summarize_plan(explain_command(db, command_name, command))
+            except Exception as e:
+                summary = {'plan': 'ERROR', 'stages': [], 'error': str(e), 'in_memory_sort': False}
+            results.append((shape, summary))
+            if not quiet:
+                self.print_result(shape, summary)
+        return results
+
+    def is_problem(self, shape, summary):
+        if summary['plan'] == 'ERROR':
+            return True
+        if summary['in_memory_sort']:
+            return True
+        return summary['plan'] == 'COLLSCAN' and not shape.expect_scan
+
+    def print_result(self, shape, summary):
+        hot = '🔥' if shape.hot else '  '
+        if summary['plan'] == 'ERROR':
+            self.stdout.write(self.style.ERROR(f'{hot} {shape.name:<24} ❌ explain lỗi: {summary["error"]}'))
+            return
+        line = f'{hot} {shape.name:<24} {summary["plan"]:<9} {" > ".join(summary["stages"]):<40} [{shape.source}]'
+        if self.is_problem(shape, summary):
+            self.stdout.write(self.style.ERROR(line))
+        else:
+            self.stdout.write(line)
+
+    def create_indexes(self, db, shapes):
+        created = set()
+        for shape in shapes:
+            if not shape.index:
+                continue
+            key = (shape.collection, tuple(shape.index))
+            if key in created:
+                continue
+            created.add(key)
+            try:
+                name = db[shape.collection].create_index(shape.index, background=True)
+                self.stdout.write(self.style.SUCCESS(f'🛠️  Đã tạo index {name} trên {shape.collection}'))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Không tạo được index cho {shape.name}: {str(e)}'))
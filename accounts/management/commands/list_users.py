@@ -1,9 +1,10 @@
 from django.core.management.base import BaseCommand
 from accounts.models import User
+from accounts.routing import analytics
 
 
 class Command(BaseCommand):
-    help = 'Liệt kê tất cả người dùng trong hệ thống (chỉ có admin và user)'
+    help = 'Liệt kê tất cả người dùng trong hệ thống (chỉ có admin và user), đọc từ secondary nếu có'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -25,10 +26,10 @@ class Command(BaseCommand):
         try:
             # Get users based on filter
             if role_filter:
-                users = User.objects(role=role_filter).order_by('username')
+                users = analytics(User.objects(role=role_filter)).order_by('username')
                 self.stdout.write(f'👥 Danh sách người dùng có vai trò "{dict(User.ROLES)[role_filter]}":')
             else:
-                users = User.objects.all().order_by('username')
+                users = analytics(User.objects).order_by('username')
                 self.stdout.write('👥 Danh sách tất cả người dùng:')
             
             self.stdout.write('-' * 80)
@@ -82,8 +83,8 @@ class Command(BaseCommand):
             self.stdout.write('=' * 80)
             
             # Total users
-            total_users = User.objects.count()
-            active_users = User.objects(is_active=True).count()
+            total_users = analytics(User.objects).count()
+            active_users = analytics(User.objects(is_active=True)).count()
             inactive_users = total_users - active_users
             
             self.stdout.write(f'📈 Tổng quan:')
@@ -93,8 +94,8 @@ class Command(BaseCommand):
             self.stdout.write('')
             
             # Role statistics (simplified for admin and user only)
-            admin_count = User.objects(role='admin').count()
-            user_count = User.objects(role='user').count()
+            admin_count = analytics(User.objects(role='admin')).count()
+            user_count = analytics(User.objects(role='user')).count()
             
             self.stdout.write(f'🏷️  Phân bố vai trò:')
             self.stdout.write(f'   👑 Quản trị viên: {admin_count} người ({admin_count/total_users*100:.1f}%)')
@@ -102,7 +103,7 @@ class Command(BaseCommand):
             self.stdout.write('')
             
             # Login statistics
-            users_with_login = User.objects(last_login__ne=None).count()
+            users_with_login = analytics(User.objects(last_login__ne=None)).count()
             users_never_login = total_users - users_with_login
             
             self.stdout.write(f'🔐 Thống kê đăng nhập:')
@@ -111,7 +112,7 @@ class Command(BaseCommand):
             self.stdout.write('')
             
             # Recent users
-            recent_users = User.objects.order_by('-date_joined')[:5]
+            recent_users = analytics(User.objects).order_by('-date_joined')[:5]
             self.stdout.write(f'🆕 5 người dùng mới nhất:')
             for i, user in enumerate(recent_users, 1):
                 role_icon = '👑' if user.role == 'admin' else '👤'
@@ -0,0 +1,271 @@
+import math
+import random
+import re
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import WriteConcern
+
+from accounts import monitoring
+from accounts.changes import delete_users
+from accounts.fragments import bump_data_version
+from accounts.models import User, UserSession
+
+# Họ phổ biến và tỷ lệ gần đúng trong dân số
+FAMILY_NAMES = [
+    ('Nguyễn', 38), ('Trần', 11), ('Lê', 9.5), ('Phạm', 7), ('Hoàng', 4.1), ('Huỳnh', 1.9),
+    ('Phan', 4.5), ('Vũ', 2.5), ('Võ', 1.4), ('Đặng', 2.1), ('Bùi', 2), ('Đỗ', 1.4),
+    ('Hồ', 1.3), ('Ngô', 1.3), ('Dương', 1), ('Lý', 0.5), ('Đinh', 0.8), ('Trương', 0.9),
+]
+MIDDLE_NAMES = {
+    'male': ['Văn', 'Hữu', 'Đức', 'Minh', 'Quang', 'Thành', 'Công', 'Gia', 'Hoàng', 'Anh'],
+    'female': ['Thị', 'Ngọc', 'Thu', 'Thanh', 'Phương', 'Bảo', 'Khánh', 'Hồng', 'Mai', 'Minh'],
+}
+GIVEN_NAMES = {
+    'male': ['An', 'Bảo', 'Cường', 'Dũng', 'Duy', 'Đạt', 'Hải', 'Hiếu', 'Hùng', 'Huy', 'Khang',
+             'Khoa', 'Long', 'Minh', 'Nam', 'Phong', 'Phúc', 'Quân', 'Sơn', 'Tài', 'Thắng',
+             'Thịnh', 'Trung', 'Tuấn', 'Việt', 'Vinh'],
+    'female': ['Anh', 'Chi', 'Diệp', 'Giang', 'Hà', 'Hạnh', 'Hằng', 'Hoa', 'Hương', 'Lan',
+               'Linh', 'Loan', 'Mai', 'My', 'Ngân', 'Nhung', 'Nhi', 'Oanh', 'Phương', 'Quỳnh',
+               'Tâm', 'Thảo', 'Trang', 'Trâm', 'Uyên', 'Vy', 'Yến'],
+}
+EMAIL_DOMAINS = [
+    ('gmail.com', 70), ('yahoo.com', 8), ('outlook.com', 7), ('hotmail.com', 4),
+    ('icloud.com', 3), ('fpt.com.vn', 2), ('vnu.edu.vn', 3), ('hust.edu.vn', 3),
+]
+PERMISSIONS = ['view_reports', 'export_data', 'manage_content', 'moderate_chat']
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; SM-A546E) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15',
+    'coccoc/126.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36',
+]
+# Giờ truy cập theo giờ Việt Nam: ít lúc 0-6h, đông buổi tối
+HOUR_WEIGHTS = [1, 0.5, 0.3, 0.2, 0.2, 0.4, 1, 2, 3, 3.5, 3.5, 3, 3, 3, 3, 3, 3, 3.5, 4, 5, 5.5, 5, 4, 2]
+
+
+def ascii_slug(text):
+    """``Nguyễn Thị`` -> ``nguyen_thi``"""
+    text = text.replace('Đ', 'D').replace('đ', 'd')
+    text = unicodedata.normalize('NFD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower().replace(' ', '_')
+
+
+def cumulative(weighted):
+    values = [value for value, _ in weighted]
+    total, cum = 0.0, []
+    for _, weight in weighted:
+        total += weight
+        cum.append(total)
+    return values, cum
+
+
+class Command(BaseCommand):
+    help = 'Tạo dữ liệu người dùng giả lập (tên tiếng Việt) với số lượng lớn để kiểm thử tải'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Số người dùng cần tạo (mặc định 10000)')
+        parser.add_argument('--sessions', type=float, default=0.5,
+                            help='Số UserSession trung bình cho mỗi người dùng đăng nhập trong 30 ngày (mặc định 0.5)')
+        parser.add_argument('--admin-ratio', type=float, default=0.005, help='Tỷ lệ quản trị viên (mặc định 0.5%%)')
+        parser.add_argument('--days', type=int, default=3 * 365, help='Khoảng thời gian tham gia tính từ ngày mốc (ngày)')
+        parser.add_argument('--reference-date', help='Ngày mốc ISO (mặc định 00:00 hôm nay) - cố định để tái lập dữ liệu')
+        parser.add_argument('--seed', type=int, default=42, help='Seed ngẫu nhiên - cùng seed cho cùng dữ liệu')
+        parser.add_argument('--prefix', default='seed_', help='Tiền tố username để nhận biết dữ liệu giả lập')
+        parser.add_argument('--start', type=int, default=0, help='Số thứ tự bắt đầu (để nạp thêm vào dữ liệu đã có)')
+        parser.add_argument('--password', default='Seed@Password2024', help='Mật khẩu chung của mọi tài khoản')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Số document mỗi lần insert_many')
+        parser.add_argument('--workers', type=int, default=2, help='Số thread insert song song với việc sinh dữ liệu')
+        parser.add_argument('--clear', action='store_true', help='Xóa người dùng/phiên có tiền tố --prefix trước khi tạo')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        prefix = options['prefix']
+        if count <= 0:
+            raise CommandError('❌ --count phải lớn hơn 0')
+        if not prefix:
+            raise CommandError('❌ --prefix không được để trống (dùng để nhận biết và xóa dữ liệu giả lập)')
+
+        if options['reference_date']:
+            reference = datetime.fromisoformat(options['reference_date'])
+        else:
+            reference = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        users = User._get_collection().with_options(write_concern=WriteConcern(w=1))
+        sessions = UserSession._get_collection().with_options(write_concern=WriteConcern(w=1))
+        User.ensure_indexes()
+        UserSession.ensure_indexes()
+
+        if options['clear']:
+            # Tiền tố là chuỗi thường: '.' hay '*' không được khớp cả tài khoản thật
+            pattern = {'$regex': f'^{re.escape(prefix)}'}
+            deleted_users = delete_users({'username': pattern})  # kèm tombstone cho API đồng bộ
+            deleted_sessions = sessions.delete_many({'user': pattern}).deleted_count
+            self.stdout.write(f'🧹 Đã xóa {deleted_users} người dùng và {deleted_sessions} phiên có tiền tố "{prefix}"')
+
+        # Một lần PBKDF2 cho tất cả tài khoản thay vì một lần mỗi người dùng
+        password_hash = make_password(options['password'])
+
+        self.stdout.write(f'🌱 Tạo {count:,} người dùng (seed={options["seed"]}, mốc {reference:%d/%m/%Y})...')
+        started = time.perf_counter()
+        generator = DatasetGenerator(
+            seed=options['seed'], reference=reference, days=options['days'], prefix=prefix,
+            password_hash=password_hash, admin_ratio=options['admin_ratio'], sessions_per_user=options['sessions'],
+        )
+
+        inserted = {'users': 0, 'sessions': 0}
+        pending = deque()
+        user_batch, session_batch = [], []
+        batch_size = options['batch_size']
+
+        def insert(collection, kind, documents):
+            if kind == 'users':
+                # Thời điểm ghi thật, không phải last_login: API đồng bộ (accounts/changes.py)
+                # dùng updated_at làm vị trí, ghi lùi ngày thì client đã có token bỏ sót
+                updated_at = datetime.now()
+                for document in documents:
+                    document['updated_at'] = updated_at
+            with monitoring.suppress():
+                collection.insert_many(documents, ordered=False)
+            return kind, len(documents)
+
+        def submit(executor, collection, kind, documents):
+            pending.append(executor.submit(insert, collection, kind, documents))
+            # Giới hạn số batch đang chờ để bộ nhớ không tăng theo --count
+            while len(pending) > options['workers'] * 2:
+                done_kind, done = pending.popleft().result()
+                inserted[done_kind] += done
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            next_report = started + 5
+            for index in range(options['start'], options['start'] + count):
+                user, user_sessions = generator.user(index)
+                user_batch.append(user)
+                session_batch.extend(user_sessions)
+                if len(user_batch) >= batch_size:
+                    submit(executor, users, 'users', user_batch)
+                    user_batch = []
+                if len(session_batch) >= batch_size:
+                    submit(executor, sessions, 'sessions', session_batch)
+                    session_batch = []
+                if time.perf_counter() >= next_report:
+                    next_report += 5
+                    done = index - options['start'] + 1
+                    rate = done / (time.perf_counter() - started)
+                    self.stdout.write(f'   … {done:,}/{count:,} người dùng ({rate:,.0f}/giây)')
+            if user_batch:
+                submit(executor, users, 'users', user_batch)
+            if session_batch:
+                submit(executor, sessions, 'sessions', session_batch)
+            while pending:
+                done_kind, done = pending.popleft().result()
+                inserted[done_kind] += done
+
+        if inserted['users']:
+            bump_data_version()  # insert_many bỏ qua User.save(): fragment đã cache phải tính lại
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Đã tạo {inserted["users"]:,} người dùng và {inserted["sessions"]:,} phiên trong {elapsed:.1f} giây '
+            f'({inserted["users"] / elapsed:,.0f} người dùng/giây)'
+        ))
+        self.stdout.write(f'🔑 Mật khẩu chung: {options["password"]}')
+
+
+class DatasetGenerator:
+    """Sinh document người dùng / phiên một cách tất định theo (seed, index)"""
+
+    def __init__(self, seed, reference, days, prefix, password_hash, admin_ratio, sessions_per_user):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.reference = reference
+        self.days = days
+        self.prefix = prefix
+        self.password_hash = password_hash
+        self.admin_ratio = admin_ratio
+        self.sessions_per_user = sessions_per_user
+        self.family_names, self.family_cum = cumulative(FAMILY_NAMES)
+        self.domains, self.domain_cum = cumulative(EMAIL_DOMAINS)
+        self.hours, self.hour_cum = cumulative(list(enumerate(HOUR_WEIGHTS)))
+
+    def _at_hour(self, day):
+        rng = self.rng
+        hour = rng.choices(self.hours, cum_weights=self.hour_cum)[0]
+        return day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+
+    def user(self, index):
+        # Seed lại theo index: --start N sinh đúng những người dùng mà lần chạy dài hơn đã sinh
+        self.rng.seed(f'{self.seed}:{index}')
+        rng = self.rng
+        gender = 'female' if rng.random() < 0.52 else 'male'
+        family = rng.choices(self.family_names, cum_weights=self.family_cum)[0]
+        middle = rng.choice(MIDDLE_NAMES[gender])
+        given = rng.choice(GIVEN_NAMES[gender])
+        slug = f'{ascii_slug(given)}_{ascii_slug(family)}'
+        username = f'{self.prefix}{slug}_{index}'
+        email = f'{slug.replace("_", ".")}.{index}@{rng.choices(self.domains, cum_weights=self.domain_cum)[0]}'
+
+        # Số người đăng ký tăng dần theo thời gian: tập trung về gần ngày mốc
+        days_ago = int(self.days * rng.random() ** 2)
+        date_joined = self._at_hour(self.reference - timedelta(days=days_ago))
+
+        is_admin = rng.random() < self.admin_ratio
+        if is_admin:
+            permissions = list(PERMISSIONS)
+        elif rng.random() < 0.05:
+            permissions = rng.sample(PERMISSIONS, rng.randint(1, 2))
+        else:
+            permissions = []
+
+        # 15% chưa từng đăng nhập; còn lại lần cuối cách ngày mốc theo phân phối mũ (trung bình 14 ngày)
+        last_login = None
+        if rng.random() >= 0.15:
+            since = min(days_ago, int(rng.expovariate(1 / 14)))
+            last_login = max(date_joined, self._at_hour(self.reference - timedelta(days=since)))
+
+        user = {
+            'username': username,
+            'email': email,
+            'first_name': f'{middle} {given}',
+            'last_name': family,
+            'password': self.password_hash,
+            'role': 'admin' if is_admin else 'user',
+            'permissions': permissions,
+            'is_active': rng.random() >= 0.03,
+            'is_verified': rng.random() < 0.7,
+            'is_staff': is_admin,
+            'is_superuser': is_admin,
+            'date_joined': date_joined,
+            'last_login': last_login,
+        }
+        return user, self.sessions(username, last_login)
+
+    def sessions(self, username, last_login):
+        """Phiên của người dùng đăng nhập trong 30 ngày gần nhất (số lượng theo phân phối Poisson)"""
+        rng = self.rng
+        if last_login is None or (self.reference - last_login).days > 30 or self.sessions_per_user <= 0:
+            return []
+        # Poisson bằng phương pháp Knuth - đủ nhanh với trung bình nhỏ
+        limit, count, product = math.exp(-self.sessions_per_user), 0, rng.random()
+        while product > limit:
+            count += 1
+            product *= rng.random()
+
+        sessions = []
+        for _ in range(count):
+            created_at = last_login - timedelta(minutes=rng.randrange(0, 7 * 24 * 60))
+            sessions.append({
+                'user': username,
+                'session_key': f'{rng.getrandbits(256):064x}',
+                'created_at': created_at,
+                'last_activity': created_at + timedelta(minutes=rng.randrange(0, 180)),
+                'ip_address': f'{rng.choice((14, 27, 42, 113, 115, 171, 183))}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                'user_agent': rng.choice(USER_AGENTS),
+                'is_active': True,
+            })
+        return sessions
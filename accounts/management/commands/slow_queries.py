@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = 'Tổng hợp các truy vấn MongoDB chậm nhất theo hình dạng truy vấn (query shape)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10,
+            help='Số shape hiển thị (mặc định 10)',
+        )
+        parser.add_argument(
+            '--hours',
+            type=float,
+            default=24,
+            help='Chỉ xét các lệnh trong N giờ gần nhất (mặc định 24)',
+        )
+        parser.add_argument(
+            '--sort',
+            choices=['total', 'max', 'avg', 'count'],
+            default='total',
+            help='Sắp xếp theo tổng thời gian, max, trung bình hoặc số lần',
+        )
+
+    def handle(self, *args, **options):
+        since = datetime.now() - timedelta(hours=options['hours'])
+        sort_field = {'total': 'total_ms', 'max': 'max_ms', 'avg': 'avg_ms', 'count': 'count'}[options['sort']]
+
+        pipeline = [
+            {'$match': {'created_at': {'$gte': since}}},
+            {'$sort': {'created_at': 1}},
+            {'$group': {
+                '_id': '$shape',
+                'count': {'$sum': 1},
+                'total_ms': {'$sum': '$duration_ms'},
+                'avg_ms': {'$avg': '$duration_ms'},
+                'max_ms': {'$max': '$duration_ms'},
+                'in_memory_sort': {'$max': '$in_memory_sort'},
+                'docs_examined': {'$max': '$docs_examined'},
+                'n_returned': {'$max': '$n_returned'},
+                'last_seen': {'$last': '$created_at'},
+            }},
+            {'$sort': {sort_field: -1}},
+            {'$limit': options['limit']},
+        ]
+
+        try:
+            rows = list(SlowQuery.objects.aggregate(pipeline))
+            # Plan chỉ được explain mỗi explain_interval nên đa số bản ghi có plan=None:
+            # lấy plan mới nhất đã explain của từng shape bằng một lượt riêng
+            plans = {row['_id']: row['plan'] for row in SlowQuery.objects.aggregate([
+                {'$match': {
+                    'created_at': {'$gte': since},
+                    'shape': {'$in': [row['_id'] for row in rows]},
+                    'plan': {'$ne': None},
+                }},
+                {'$sort': {'created_at': 1}},
+                {'$group': {'_id': '$shape', 'plan': {'$last': '$plan'}}},
+            ])} if rows else {}
+        except Exception as e:
+            raise CommandError(f'❌ Lỗi khi đọc slow query log: {str(e)}')
+
+        if not rows:
+            self.stdout.write(self.style.SUCCESS(f'✅ Không có truy vấn chậm nào trong {options["hours"]:g} giờ qua.'))
+            return
+
+        self.stdout.write(f'🐢 {len(rows)} query shape chậm nhất ({options["hours"]:g} giờ qua, sắp xếp theo {options["sort"]}):')
+        self.stdout.write('-' * 80)
+        for i, row in enumerate(rows, 1):
+            plan = plans.get(row['_id']) or 'chưa explain'
+            style = self.style.ERROR if plan == 'COLLSCAN' or row.get('in_memory_sort') else self.style.WARNING
+            self.stdout.write(style(f'{i:2d}. [{plan}] {row["_id"]}'))
+            self.stdout.write(
+                f'    ⏱️  {row["count"]} lần | tổng {row["total_ms"]:.1f} ms | '
+                f'trung bình {row["avg_ms"]:.1f} ms | max {row["max_ms"]:.1f} ms'
+            )
+            self.stdout.write(
+                f'    🔍 Quét {row.get("docs_examined") or 0} document, trả về {row.get("n_returned") or 0}'
+                f'{" | SORT trong bộ nhớ" if row.get("in_memory_sort") else ""} | '
+                f'lần cuối: {row["last_seen"].strftime("%d/%m/%Y %H:%M")}'
+            )
+            self.stdout.write('')
@@ -0,0 +1,346 @@
+"""
+Số liệu dùng chung giữa các worker process qua file memory-mapped.
+
+Mỗi process ghi vào file riêng ``<METRICS_DIR>/metrics_<pid>.db`` gồm một mảng
+int64 có kích thước cố định. Vị trí (slot) của từng histogram/counter được tính
+một lần từ danh sách metric bên dưới, nên khi ghi chỉ cần cộng vào mảng: không
+khóa, không tạo dict/list mới. Mỗi file chỉ có một process ghi; các thread trong
+cùng process có thể hiếm khi làm mất một lần cộng, chấp nhận được với số liệu
+giám sát. Khi đọc (``/metrics/``, ``/api/system-status/``) các file được cộng dồn.
+"""
+import bisect
+import glob
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+# Bucket upper bounds in milliseconds; one extra bucket catches everything above
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+MONGO_COMMANDS = (
+    'find', 'getMore', 'aggregate', 'count', 'distinct', 'insert', 'update', 'delete',
+    'findAndModify', 'createIndexes', 'explain', 'ping', 'other',
+)
+
+CACHE_NAMES = ('default', 'fragments', 'pages', 'other')
+
+RATE_WINDOW = 60
+
+PROCESS_STARTED_AT = time.time()
+
+_HEADER = struct.Struct('<8sqqq')  # magic, layout hash, pid, slot count
+_MAGIC = b'RHMETRIC'
+_HISTOGRAM_WIDTH = 2 + len(BUCKETS_MS) + 1  # count, sum (microseconds), buckets
+
+
+def _default_directory():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'rehearten-metrics')
+
+
+def _view_names():
+    from django.urls import get_resolver
+
+    names = set()
+    for pattern in get_resolver().url_patterns:
+        for sub in getattr(pattern, 'url_patterns', [pattern]):
+            if getattr(sub, 'name', None):
+                names.add(sub.name)
+    return tuple(sorted(names)) + ('other', 'unresolved')
+
+
+class Family:
+    """One metric with a fixed set of label values"""
+
+    def __init__(self, name, kind, help_text, label=None, values=('',)):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.label = label
+        self.values = values
+        self.offsets = {}
+
+    @property
+    def width(self):
+        return _HISTOGRAM_WIDTH if self.kind == 'histogram' else 1
+
+
+class Layout:
+    """Slot offsets for every metric; identical in every worker running the same code"""
+
+    def __init__(self, families):
+        self.families = {family.name: family for family in families}
+        offset = 0
+        for family in families:
+            for value in family.values:
+                family.offsets[value] = offset
+                offset += family.width
+        self.rate_stamps = offset
+        self.rate_counts = offset + RATE_WINDOW
+        self.size = offset + 2 * RATE_WINDOW
+        description = repr([(f.name, f.kind, f.values) for f in families]) + repr(BUCKETS_MS)
+        self.hash = zlib.crc32(description.encode())
+
+
+def _families():
+    return [
+        Family('rehearten_request_latency_ms', 'histogram', 'Request latency by URL name', 'view', _view_names()),
+        Family('rehearten_mongo_command_latency_ms', 'histogram', 'MongoDB command latency', 'command', MONGO_COMMANDS),
+        Family('rehearten_pool_checkout_wait_ms', 'histogram', 'Time waiting for a MongoDB pool connection'),
+        Family('rehearten_password_hash_ms', 'histogram', 'Time spent hashing or checking a password'),
+        Family('rehearten_cache_hits_total', 'counter', 'Cache hits', 'cache', CACHE_NAMES),
+        Family('rehearten_cache_misses_total', 'counter', 'Cache misses', 'cache', CACHE_NAMES),
+    ]
+
+
+def percentile(counts, q):
+    """Estimate the q-th percentile (0-100) from bucket counts by interpolation"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q / 100.0 * total
+    seen = 0
+    for i, n in enumerate(counts):
+        if n and seen + n >= rank:
+            lower = BUCKETS_MS[i - 1] if i else 0.0
+            if i == len(BUCKETS_MS):
+                return lower
+            return lower + (BUCKETS_MS[i] - lower) * (rank - seen) / n
+        seen += n
+    return BUCKETS_MS[-1]
+
+
+def histogram_summary(values):
+    count, total_us, counts = values[0], values[1], values[2:]
+    return {
+        'count': count,
+        'avg_ms': round(total_us / 1000 / count, 3) if count else 0.0,
+        'p50_ms': round(percentile(counts, 50), 3),
+        'p95_ms': round(percentile(counts, 95), 3),
+        'p99_ms': round(percentile(counts, 99), 3),
+    }
+
+
+class Metrics:
+    """Per-process writer and multi-process reader for the metrics files"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._layout = None
+        self._array = None
+        self._mmap = None
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._forget_file)
+
+    # -- setup ---------------------------------------------------------------
+
+    @property
+    def layout(self):
+        if self._layout is None:
+            self._layout = Layout(_families())
+        return self._layout
+
+    def _directory(self):
+        if self.directory is None:
+            from django.conf import settings
+            self.directory = getattr(settings, 'METRICS_DIR', None) or _default_directory()
+        return self.directory
+
+    def _forget_file(self):
+        self._array = None
+        self._mmap = None
+
+    def _open(self):
+        with self._lock:
+            if self._array is not None:
+                return self._array
+            layout = self.layout
+            directory = self._directory()
+            os.makedirs(directory, exist_ok=True)
+            pid = os.getpid()
+            path = os.path.join(directory, f'metrics_{pid}.db')
+            size = _HEADER.size + 8 * layout.size
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.ftruncate(fd, size)
+                self._mmap = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+            self._mmap[:_HEADER.size] = _HEADER.pack(_MAGIC, layout.hash, pid, layout.size)
+            self._array = memoryview(self._mmap)[_HEADER.size:].cast('q')
+            return self._array
+
+    # -- hot path ------------------------------------------------------------
+
+    def _observe(self, offset, value_ms):
+        array = self._array if self._array is not None else self._open()
+        array[offset] += 1
+        array[offset + 1] += int(value_ms * 1000)
+        array[offset + 2 + bisect.bisect_left(BUCKETS_MS, value_ms)] += 1
+
+    def _offset(self, family_name, value):
+        offsets = self.layout.families[family_name].offsets
+        offset = offsets.get(value)
+        return offsets['other'] if offset is None else offset
+
+    def record_request(self, view_name, duration_ms):
+        array = self._array if self._array is not None else self._open()
+        layout = self._layout
+        second = int(time.time())
+        slot = second % RATE_WINDOW
+        if array[layout.rate_stamps + slot] != second:
+            array[layout.rate_stamps + slot] = second
+            array[layout.rate_counts + slot] = 0
+        array[layout.rate_counts + slot] += 1
+        self._observe(self._offset('rehearten_request_latency_ms', view_name or 'unresolved'), duration_ms)
+
+    def record_mongo_command(self, record):
+        self._observe(self._offset('rehearten_mongo_command_latency_ms', record.name), record.duration_ms)
+
+    def record_pool_wait(self, wait_ms):
+        self._observe(self.layout.families['rehearten_pool_checkout_wait_ms'].offsets[''], wait_ms)
+
+    def record_password_hash(self, duration_ms):
+        self._observe(self.layout.families['rehearten_password_hash_ms'].offsets[''], duration_ms)
+
+    def record_cache(self, cache_name, hit):
+        array = self._array if self._array is not None else self._open()
+        family = 'rehearten_cache_hits_total' if hit else 'rehearten_cache_misses_total'
+        array[self._offset(family, cache_name)] += 1
+
+    # -- read side -----------------------------------------------------------
+
+    def collect(self):
+        """Sum the arrays of every worker file with the current layout"""
+        layout = self.layout
+        totals = [0] * layout.size
+        stamps = []
+        workers = 0
+        for path in glob.glob(os.path.join(self._directory(), 'metrics_*.db')):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if len(data) < _HEADER.size:
+                continue
+            magic, layout_hash, pid, size = _HEADER.unpack_from(data)
+            if magic != _MAGIC or layout_hash != layout.hash or size != layout.size:
+                continue
+            values = memoryview(data)[_HEADER.size:_HEADER.size + 8 * size].cast('q')
+            for i in range(layout.rate_stamps):
+                totals[i] += values[i]
+            stamps.append(values[layout.rate_stamps:].tolist())
+            workers += 1
+        now = int(time.time())
+        recent = 0
+        for ring in stamps:
+            for slot in range(RATE_WINDOW):
+                if now - RATE_WINDOW < ring[slot] <= now:
+                    recent += ring[RATE_WINDOW + slot]
+        return totals, recent / RATE_WINDOW, workers
+
+    def snapshot(self):
+        totals, rate, workers = self.collect()
+        families = self.layout.families
+
+        def histograms(name, skip_empty=True):
+            family = families[name]
+            result = {}
+            for value, offset in family.offsets.items():
+                values = totals[offset:offset + _HISTOGRAM_WIDTH]
+                if values[0] or not skip_empty:
+                    result[value] = histogram_summary(values)
+            return result
+
+        views = histograms('rehearten_request_latency_ms')
+        caches = {}
+        for name in CACHE_NAMES:
+            hits = totals[families['rehearten_cache_hits_total'].offsets[name]]
+            misses = totals[families['rehearten_cache_misses_total'].offsets[name]]
+            if hits or misses:
+                caches[name] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 4)}
+        return {
+            'workers': workers,
+            'requests': {
+                'total': sum(summary['count'] for summary in views.values()),
+                'rate_per_second_1m': round(rate, 3),
+            },
+            'views': views,
+            'mongo_commands': histograms('rehearten_mongo_command_latency_ms'),
+            'pool_checkout_wait': histograms('rehearten_pool_checkout_wait_ms', skip_empty=False)[''],
+            'password_hash': histograms('rehearten_password_hash_ms', skip_empty=False)[''],
+            'caches': caches,
+        }
+
+    def exposition(self):
+        """Prometheus text format (version 0.0.4) of the merged metrics"""
+        totals, rate, workers = self.collect()
+        lines = []
+        for family in self.layout.families.values():
+            lines.append(f'# HELP {family.name} {family.help_text}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for value, offset in family.offsets.items():
+                labels = f'{family.label}="{value}"' if family.label else ''
+                if family.kind == 'counter':
+                    lines.append(f'{family.name}{{{labels}}} {totals[offset]}' if labels else f'{family.name} {totals[offset]}')
+                    continue
+                count, total_us = totals[offset], totals[offset + 1]
+                cumulative = 0
+                prefix = f'{labels},' if labels else ''
+                for bound, n in zip(BUCKETS_MS + ('+Inf',), totals[offset + 2:offset + _HISTOGRAM_WIDTH]):
+                    cumulative += n
+                    lines.append(f'{family.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f'{family.name}_sum{suffix} {total_us / 1000}')
+                lines.append(f'{family.name}_count{suffix} {count}')
+        lines.append('# HELP rehearten_requests_per_second Requests per second over the last minute')
+        lines.append('# TYPE rehearten_requests_per_second gauge')
+        lines.append(f'rehearten_requests_per_second {rate}')
+        lines.append('# HELP rehearten_metric_workers Worker processes contributing to these metrics')
+        lines.append('# TYPE rehearten_metric_workers gauge')
+        lines.append(f'rehearten_metric_workers {workers}')
+        return '\n'.join(lines) + '\n'
+
+    def cleanup_dead_workers(self):
+        """Xóa file của các process không còn chạy"""
+        for path in glob.glob(os.path.join(self._directory(), 'metrics_*.db')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics_'):-len('.db')])
+                os.kill(pid, 0)
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except PermissionError:
+                pass
+
+
+metrics = Metrics()
+
+
+def process_info():
+    """PID, uptime và bộ nhớ của process hiện tại"""
+    import resource
+
+    info = {
+        'pid': os.getpid(),
+        'uptime_seconds': round(time.time() - PROCESS_STARTED_AT, 1),
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        info['rss_mb'] = round(resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        info['rss_mb'] = info['max_rss_mb']
+    return info
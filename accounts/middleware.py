@@ -0,0 +1,303 @@
+import logging
+import random
+import re
+import subprocess
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.urls import resolve
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+
+from .log import set_request_id, reset_request_id
+from .metrics import PROCESS_STARTED_AT, metrics
+from .monitoring import QueryStats, start_request, end_request
+from .profiling import Profile, sampler, profile_store
+from .utils import session_is_admin
+
+logger = logging.getLogger('accounts.requests')
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class HybridMiddleware:
+    """Middleware chạy được trong chuỗi WSGI (sync) lẫn ASGI (async)
+
+    Một middleware chỉ hỗ trợ sync trong chuỗi ASGI buộc Django chạy mọi view
+    phía sau trên thread, mất lợi ích của view async. Lớp con kiểm tra
+    ``self.is_async`` ở đầu ``__call__`` và trả về ``self.__acall__(request)``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class RequestIdMiddleware(HybridMiddleware):
+    """Gán request id (từ header X-Request-ID hoặc tạo mới) cho log của request"""
+
+    def start(self, request):
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        return set_request_id(request_id)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+
+class RequestMetricsMiddleware(HybridMiddleware):
+    """Ghi độ trễ mỗi request vào histogram theo tên URL (url_name)"""
+
+    def record(self, request, started):
+        match = getattr(request, 'resolver_match', None)
+        metrics.record_request(match.url_name if match else None, (time.perf_counter() - started) * 1000)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, started)
+        return response
+
+
+class MongoQueryStatsMiddleware(HybridMiddleware):
+    """Đếm lệnh MongoDB của mỗi request - Server-Timing header + log line"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.debug_panel = settings.DEBUG and getattr(settings, 'MONGO_DEBUG_PANEL', False)
+        # Đếm byte phải mã hóa lại mọi lệnh/kết quả sang BSON: chỉ khi cần xem
+        self.measure_bytes = self.debug_panel or getattr(settings, 'MONGO_MEASURE_BYTES', False)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = QueryStats(keep_commands=self.debug_panel, measure_bytes=self.measure_bytes)
+        token = start_request(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = QueryStats(keep_commands=self.debug_panel, measure_bytes=self.measure_bytes)
+        token = start_request(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats, started):
+        total_ms = (time.perf_counter() - started) * 1000
+
+        response['Server-Timing'] = stats.server_timing(total_ms)
+        message = ('request method=%s path=%s status=%s duration_ms=%.2f mongo_commands=%d '
+                   'mongo_ms=%.2f')
+        args = [request.method, request.path, response.status_code, total_ms, stats.count, stats.total_ms]
+        if self.measure_bytes:
+            message += ' mongo_bytes_out=%d mongo_bytes_in=%d'
+            args += [stats.request_bytes, stats.reply_bytes]
+        logger.info(message, *args, extra={'mongo': stats.as_dict(), 'duration_ms': round(total_ms, 3)})
+
+        if self.debug_panel:
+            self._inject_panel(request, response, stats, total_ms)
+        return response
+
+    def _inject_panel(self, request, response, stats, total_ms):
+        """Append the command list to HTML pages (DEBUG only)"""
+        if getattr(response, 'streaming', False):
+            return
+        if 'text/html' not in response.get('Content-Type', ''):
+            return
+        content = response.content.decode(response.charset)
+        if '</body>' not in content:
+            return
+        duplicates = stats.duplicates()
+        panel = render_to_string('accounts/mongo_debug_panel.html', {
+            'stats': stats,
+            'total_ms': total_ms,
+            'commands': [
+                dict(record.as_dict(), signature=record.signature,
+                     repeated=record.signature in duplicates)
+                for record in stats.commands
+            ],
+            'duplicate_count': sum(duplicates.values()) - len(duplicates),
+        })
+        response.content = content.replace('</body>', panel + '</body>', 1).encode(response.charset)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+
+
+class SamplingProfilerMiddleware:
+    """Profile request theo header ``X-Profile`` (admin) hoặc theo tỉ lệ lấy mẫu
+
+    Khi ``PROFILER_ENABLED`` tắt, middleware bị Django bỏ qua hoàn toàn. Chỉ
+    chạy sync: sampler lấy stack của thread đang xử lý request.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+        sampler.interval = getattr(settings, 'PROFILER_INTERVAL_MS', 5) / 1000.0
+        profile_store.max_profiles = getattr(settings, 'PROFILER_MAX_PROFILES', 20)
+
+    def should_profile(self, request):
+        if request.META.get('HTTP_X_PROFILE'):
+            # Role từ cache trong process - thường không tốn lệnh MongoDB nào
+            return session_is_admin(request)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile = Profile(request.method, request.path)
+        started = time.perf_counter()
+        sampler.start(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+            profile.duration_ms = (time.perf_counter() - started) * 1000
+            match = getattr(request, 'resolver_match', None)
+            profile.view_name = match.url_name if match else None
+            profile_store.add(profile)
+        response['X-Profile-Id'] = profile.id
+        return response
+
+
+def deploy_version():
+    """DEPLOY_VERSION, hoặc git revision hiện tại nếu không đặt"""
+    version = getattr(settings, 'DEPLOY_VERSION', '')
+    if version:
+        return version
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=5, check=True).stdout.strip()
+    except Exception:
+        return str(int(PROCESS_STARTED_AT))
+
+
+class AnonymousPageCacheMiddleware(HybridMiddleware):
+    """Cache toàn bộ response của trang công khai cho khách chưa đăng nhập
+
+    Đứng trước SessionMiddleware: request GET không có cookie session tới
+    ``ANON_PAGE_CACHE_PATHS`` được trả từ cache mà không đọc session store hay
+    MongoDB. Key gồm đường dẫn, ngôn ngữ và ``DEPLOY_VERSION`` nên mỗi lần deploy
+    dùng bộ key mới. Có cookie ``messages`` (flash message chờ hiển thị) hoặc
+    query string thì bỏ qua cache; response có Set-Cookie không được lưu.
+    """
+
+    cache_alias = 'pages'
+
+    def __init__(self, get_response):
+        self.timeout = getattr(settings, 'ANON_PAGE_CACHE_TIMEOUT', 0)
+        if settings.DEBUG or self.timeout <= 0:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.paths = frozenset(getattr(settings, 'ANON_PAGE_CACHE_PATHS', ()))
+        self.version = deploy_version()
+        self.messages_cookie = getattr(settings, 'MESSAGE_COOKIE_NAME', 'messages')
+
+    def cacheable_request(self, request):
+        return (
+            request.method == 'GET'
+            and request.path_info in self.paths
+            and not request.META.get('QUERY_STRING')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and self.messages_cookie not in request.COOKIES
+        )
+
+    def cache_key(self, request):
+        language = translation.get_language_from_request(request)
+        return f'anon-page:{self.version}:{language}:{request.path_info}'
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.cacheable_request(request):
+            return self.get_response(request)
+        key, response = self.lookup(request)
+        if response is None:
+            response = self.store(key, self.get_response(request))
+        return response
+
+    async def __acall__(self, request):
+        if not self.cacheable_request(request):
+            return await self.get_response(request)
+        key, response = self.lookup(request)
+        if response is None:
+            response = self.store(key, await self.get_response(request))
+        return response
+
+    def lookup(self, request):
+        """(key, response từ cache hoặc None)"""
+        key = self.cache_key(request)
+        entry = caches[self.cache_alias].get(key)
+        metrics.record_cache(self.cache_alias, entry is not None)
+        if entry is None:
+            return key, None
+        content, status, headers = entry
+        response = HttpResponse(content, status=status)
+        for header, value in headers:
+            response[header] = value
+        response['X-Page-Cache'] = 'HIT'
+        request.resolver_match = resolve(request.path_info)
+        return key, response
+
+    def store(self, key, response):
+        if self.cacheable_response(response):
+            patch_vary_headers(response, ('Accept-Language',))
+            headers = [(header, value) for header, value in response.items() if header != 'Content-Length']
+            caches[self.cache_alias].set(key, (response.content, response.status_code, headers), self.timeout)
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    def cacheable_response(self, response):
+        if response.status_code != 200 or getattr(response, 'streaming', False) or response.cookies:
+            return False
+        cache_control = response.get('Cache-Control', '')
+        return 'private' not in cache_control and 'no-store' not in cache_control
@@ -1,8 +1,17 @@
 # from django.db import models  # Removed - only using MongoDB
-from mongoengine import Document, StringField, EmailField, DateTimeField, BooleanField, ListField
+from mongoengine import (
+    Document, StringField, EmailField, DateTimeField, BooleanField, ListField,
+    FloatField, IntField, DictField, ObjectIdField,
+)
 from datetime import datetime
+from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
 import re
+import time
+
+from . import events
+from .fragments import FRAGMENT_FIELDS, bump_data_version
+from .metrics import metrics
 
 # Create your models here.
 
@@ -31,10 +40,13 @@ class User(Document):
     
     date_joined = DateTimeField(default=datetime.now)
     last_login = DateTimeField()
+    # Cập nhật ở mọi lần ghi - API đồng bộ /api/users/changes/ (accounts/changes.py)
+    updated_at = DateTimeField()
     
     meta = {
         'collection': 'users',
-        'indexes': ['username', 'email', 'role']
+        # Khớp với QUERY_SHAPES trong query_shapes.py - kiểm tra bằng manage.py check_indexes
+        'indexes': ['username', 'email', 'role', '-date_joined', ('role', 'username'), ('updated_at', 'id')]
     }
 
     def __str__(self):
@@ -42,11 +54,17 @@ class User(Document):
 
     def set_password(self, raw_password):
         """Hash and set password"""
+        started = time.perf_counter()
         self.password = make_password(raw_password)
+        metrics.record_password_hash((time.perf_counter() - started) * 1000)
         
     def check_password(self, raw_password):
         """Check if provided password is correct"""
-        return check_password(raw_password, self.password)
+        started = time.perf_counter()
+        try:
+            return check_password(raw_password, self.password)
+        finally:
+            metrics.record_password_hash((time.perf_counter() - started) * 1000)
     
     def get_full_name(self):
         """Return full name"""
@@ -176,12 +194,54 @@ class User(Document):
         # Auto-update is_staff and is_superuser based on role
         self.is_staff = self.role == 'admin'
         self.is_superuser = self.role == 'admin'
-        super().save(*args, **kwargs)
+        # Fragment template đã cache (accounts/fragments.py) hết hiệu lực khi
+        # có user mới hoặc trường hiển thị thay đổi; last_login thì không
+        created = self.pk is None
+        changed_fields = set(self._get_changed_fields())
+        if created or changed_fields:
+            self.updated_at = datetime.now()
+        result = super().save(*args, **kwargs)
+        if created or FRAGMENT_FIELDS.intersection(changed_fields):
+            bump_data_version()
+        # Admin đang mở dashboard nhận sự kiện qua SSE (accounts/events.py)
+        events.user_saved(self, created, changed_fields)
+        return result
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        UserTombstone(user_id=self.pk, username=self.username).save()
+        bump_data_version()
+
+
+class UserTombstone(Document):
+    """User đã xóa, để client đồng bộ qua /api/users/changes/ biết mà xóa theo
+
+    Tự hết hạn sau ``USER_TOMBSTONE_RETENTION_DAYS``; token cũ hơn thời hạn đó
+    phải đồng bộ lại từ đầu.
+    """
+    user_id = ObjectIdField(required=True)
+    username = StringField(required=True)
+    deleted_at = DateTimeField(required=True, default=datetime.now)
+
+    meta = {
+        'collection': 'user_tombstones',
+        'indexes': [
+            ('deleted_at', 'id'),
+            {'fields': ['deleted_at'],
+             'expireAfterSeconds': int(getattr(settings, 'USER_TOMBSTONE_RETENTION_DAYS', 30) * 86400)},
+        ],
+    }
 
 class UserSession(Document):
-    """User session management"""
+    """User session management
+
+    Cũng là nơi lưu session Django của người dùng đã đăng nhập (accounts/sessions.py):
+    ``session_key`` là cookie session, ``session_data`` là dữ liệu đã mã hóa.
+    """
     user = StringField(required=True)  # username
     session_key = StringField(required=True, unique=True)
+    session_data = StringField()
+    expire_date = DateTimeField()
     created_at = DateTimeField(default=datetime.now)
     last_activity = DateTimeField(default=datetime.now)
     ip_address = StringField()
@@ -190,5 +250,77 @@ class UserSession(Document):
     
     meta = {
         'collection': 'user_sessions',
-        'indexes': ['user', 'session_key', 'created_at']
+        'indexes': [
+            'user', 'session_key', 'created_at',
+            {'fields': ['expire_date'], 'expireAfterSeconds': 0},
+        ]
+    }
+
+
+class SlowQuery(Document):
+    """Lệnh MongoDB chậm kèm explain plan (capped collection)"""
+    shape = StringField(required=True)
+    command_name = StringField(required=True)
+    collection_name = StringField()
+    duration_ms = FloatField(required=True)
+    plan = StringField()  # COLLSCAN, IXSCAN, ...
+    stages = ListField(StringField())
+    indexes = ListField(StringField())
+    in_memory_sort = BooleanField(default=False)
+    docs_examined = IntField(default=0)
+    keys_examined = IntField(default=0)
+    n_returned = IntField(default=0)
+    created_at = DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'slow_queries',
+        'max_documents': 10000,
+        'max_size': 16 * 1024 * 1024,
+        'indexes': ['shape', 'created_at'],
     }
+
+
+class AdminEvent(Document):
+    """Sự kiện SSE cho admin, đọc bằng tailable cursor ở mọi worker (accounts/events.py)"""
+    event = StringField(required=True)
+    data = DictField()
+    created_at = DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'admin_events',
+        'max_size': 1024 * 1024,
+        'indexes': [],
+    }
+
+
+class AuditLog(Document):
+    """Nhật ký thao tác quản trị (append-only, capped collection)"""
+    ACTIONS = [
+        ('role_change', 'Thay đổi vai trò'),
+        ('status_change', 'Thay đổi trạng thái'),
+        ('user_update', 'Cập nhật thông tin'),
+        ('user_create', 'Tạo người dùng'),
+    ]
+
+    actor = StringField(required=True)  # username của admin (hoặc tài khoản hệ điều hành khi chạy command)
+    action = StringField(required=True, choices=ACTIONS)
+    target = StringField(required=True)  # username bị thay đổi
+    changes = DictField()  # {field: {'old': ..., 'new': ...}}
+    source = StringField(default='web')  # web, api, command
+    ip_address = StringField()
+    request_id = StringField()
+    created_at = DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'audit_log',
+        'max_size': 256 * 1024 * 1024,
+        'indexes': [
+            ('-created_at', '-id'),
+            ('actor', '-created_at', '-id'),
+            ('target', '-created_at', '-id'),
+            ('action', '-created_at', '-id'),
+        ],
+    }
+
+    def get_action_display(self):
+        return dict(self.ACTIONS).get(self.action, self.action)
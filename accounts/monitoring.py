@@ -0,0 +1,252 @@
+"""
+Theo dõi lệnh MongoDB theo từng request.
+
+``MongoCommandListener`` được đăng ký cùng kết nối MongoDB trong ``settings.py``.
+Mỗi lệnh hoàn tất được ghi vào ``QueryStats`` của request hiện tại (nếu có)
+và chuyển cho các observer đã đăng ký.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+import bson
+from pymongo import monitoring
+
+
+READ_COMMANDS = frozenset({
+    'find', 'getMore', 'aggregate', 'count', 'distinct', 'listIndexes',
+    'listCollections', 'explain',
+})
+WRITE_COMMANDS = frozenset({
+    'insert', 'update', 'delete', 'findAndModify', 'createIndexes', 'drop',
+    'dropIndexes', 'create',
+})
+
+_current_stats = contextvars.ContextVar('mongo_query_stats', default=None)
+_suppressed = contextvars.ContextVar('mongo_monitoring_suppressed', default=False)
+_observers = []
+
+
+class CommandRecord:
+    """One completed MongoDB command"""
+    __slots__ = (
+        'name', 'database', 'collection', 'command', 'duration_ms',
+        'request_bytes', 'reply_bytes', 'succeeded', 'error',
+    )
+
+    def __init__(self, name, database, collection, command, duration_ms,
+                 request_bytes, reply_bytes, succeeded=True, error=None):
+        self.name = name
+        self.database = database
+        self.collection = collection
+        self.command = command
+        self.duration_ms = duration_ms
+        self.request_bytes = request_bytes
+        self.reply_bytes = reply_bytes
+        self.succeeded = succeeded
+        self.error = error
+
+    @property
+    def kind(self):
+        """'read', 'write' hoặc 'other'"""
+        if self.name in READ_COMMANDS:
+            return 'read'
+        if self.name in WRITE_COMMANDS:
+            return 'write'
+        return 'other'
+
+    @property
+    def signature(self):
+        """Key used to spot the same command repeated within a request"""
+        filter_doc = self.command.get('filter') or self.command.get('q') or self.command.get('query')
+        return f"{self.name} {self.collection} {filter_doc!r}"
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'collection': self.collection,
+            'duration_ms': round(self.duration_ms, 3),
+            'request_bytes': self.request_bytes,
+            'reply_bytes': self.reply_bytes,
+            'succeeded': self.succeeded,
+        }
+
+
+class QueryStats:
+    """MongoDB commands issued while handling one request
+
+    Stats started inside another (e.g. the middleware's stats inside a test's
+    ``count_queries()``) also forward every command to the outer one.
+    ``measure_bytes`` mã hóa lại lệnh và kết quả sang BSON để đếm byte - tốn
+    gần bằng chính việc serialize, nên chỉ bật khi cần (debug panel,
+    ``MONGO_MEASURE_BYTES``).
+    """
+
+    def __init__(self, keep_commands=False, measure_bytes=False):
+        self.keep_commands = keep_commands
+        self.measure_bytes = measure_bytes
+        self.parent = None
+        self.commands = []
+        self.count = 0
+        self.total_ms = 0.0
+        self.request_bytes = 0
+        self.reply_bytes = 0
+        self.by_name = {}
+
+    def add(self, record):
+        self.count += 1
+        self.total_ms += record.duration_ms
+        self.request_bytes += record.request_bytes
+        self.reply_bytes += record.reply_bytes
+        self.by_name[record.name] = self.by_name.get(record.name, 0) + 1
+        if self.keep_commands:
+            self.commands.append(record)
+        if self.parent is not None:
+            self.parent.add(record)
+
+    @property
+    def reads(self):
+        return sum(n for name, n in self.by_name.items() if name in READ_COMMANDS)
+
+    @property
+    def writes(self):
+        return sum(n for name, n in self.by_name.items() if name in WRITE_COMMANDS)
+
+    def duplicates(self):
+        """Signatures seen more than once (only when commands are kept)"""
+        seen = {}
+        for record in self.commands:
+            seen[record.signature] = seen.get(record.signature, 0) + 1
+        return {signature: n for signature, n in seen.items() if n > 1}
+
+    def server_timing(self, total_ms=None):
+        """Value for the ``Server-Timing`` response header"""
+        parts = [f'mongo;dur={self.total_ms:.2f};desc="{self.count} commands"']
+        if total_ms is not None:
+            parts.append(f'app;dur={total_ms:.2f}')
+        return ', '.join(parts)
+
+    def as_dict(self):
+        result = {
+            'commands': self.count,
+            'reads': self.reads,
+            'writes': self.writes,
+            'duration_ms': round(self.total_ms, 3),
+            'by_name': dict(self.by_name),
+        }
+        if self.measure_bytes:
+            result['request_bytes'] = self.request_bytes
+            result['reply_bytes'] = self.reply_bytes
+        return result
+
+
+def start_request(stats):
+    """Attribute commands run in the current context to ``stats``; returns a reset token"""
+    parent = _current_stats.get()
+    if parent is not None and parent is not stats:
+        stats.parent = parent
+    return _current_stats.set(stats)
+
+
+def end_request(token):
+    _current_stats.reset(token)
+
+
+def current_stats():
+    return _current_stats.get()
+
+
+@contextmanager
+def suppress():
+    """Do not record commands issued inside this block (e.g. our own explain calls)"""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def register_command_observer(callback):
+    """Call ``callback(record)`` for every completed command"""
+    if callback not in _observers:
+        _observers.append(callback)
+
+
+def unregister_command_observer(callback):
+    if callback in _observers:
+        _observers.remove(callback)
+
+
+def _collection_name(command_name, command):
+    value = command.get(command_name)
+    if isinstance(value, str):
+        return value
+    return command.get('collection', '')
+
+
+def _bson_size(document):
+    try:
+        return len(bson.encode(document))
+    except Exception:
+        return 0
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """pymongo listener that attributes commands to the current request"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _wanted(self):
+        return not _suppressed.get() and (_current_stats.get() is not None or _observers)
+
+    def started(self, event):
+        if not self._wanted():
+            return
+        stats = _current_stats.get()
+        measure = stats is not None and stats.measure_bytes
+        key = (event.connection_id, event.request_id)
+        with self._lock:
+            self._pending[key] = (
+                event.database_name,
+                _collection_name(event.command_name, event.command),
+                event.command,
+                _bson_size(event.command) if measure else 0,
+                measure,
+            )
+
+    def _finish(self, event, reply, succeeded, error=None):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        database, collection, command, request_bytes, measure = pending
+        record = CommandRecord(
+            name=event.command_name,
+            database=database,
+            collection=collection,
+            command=command,
+            duration_ms=event.duration_micros / 1000.0,
+            request_bytes=request_bytes,
+            reply_bytes=_bson_size(reply) if measure and reply is not None else 0,
+            succeeded=succeeded,
+            error=error,
+        )
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.add(record)
+        for observer in tuple(_observers):
+            try:
+                observer(record)
+            except Exception:
+                pass  # Monitoring must never break the query itself
+
+    def succeeded(self, event):
+        self._finish(event, event.reply, True)
+
+    def failed(self, event):
+        self._finish(event, None, False, error=str(event.failure))
+
+
+command_listener = MongoCommandListener()
@@ -0,0 +1,150 @@
+"""
+Kích thước connection pool MongoDB theo mô hình worker và theo dõi sự kiện pool.
+"""
+import logging
+import threading
+import time
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+def pool_options(threads=1, workers=1, background_threads=2, max_total_connections=None,
+                 max_pool_size=None, min_pool_size=None, max_idle_time_ms=30000, wait_queue_timeout_ms=None):
+    """Tham số pool cho ``mongoengine.connect`` của một process
+
+    Mỗi process có pool riêng: cần tối đa một connection cho mỗi thread phục vụ
+    request, cộng thêm vài connection cho thread nền (slow query log, audit...).
+    ``max_total_connections`` giới hạn tổng số connection của tất cả worker.
+    """
+    if max_pool_size is None:
+        max_pool_size = max(1, threads) + background_threads
+        if max_total_connections:
+            max_pool_size = min(max_pool_size, max(1, max_total_connections // max(1, workers)))
+    if min_pool_size is None:
+        min_pool_size = min(max_pool_size, max(1, threads // 4))
+    options = {
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': min_pool_size,
+        'maxIdleTimeMS': max_idle_time_ms,
+    }
+    if wait_queue_timeout_ms:
+        options['waitQueueTimeoutMS'] = wait_queue_timeout_ms
+    return options
+
+
+class PoolStats:
+    """Counters for one process's connection pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checked_out = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.pool_clears = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.slow_checkouts = 0
+
+    def snapshot(self):
+        return {
+            'checkouts': self.checkouts,
+            'checkout_failures': self.checkout_failures,
+            'in_use': self.checked_out,
+            'open_connections': self.connections_created - self.connections_closed,
+            'connections_created': self.connections_created,
+            'connections_closed': self.connections_closed,
+            'pool_clears': self.pool_clears,
+            'wait_avg_ms': round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+            'wait_max_ms': round(self.wait_max_ms, 3),
+            'slow_checkouts': self.slow_checkouts,
+        }
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Đếm checkout, thời gian chờ và connection tạo/đóng; cảnh báo khi chờ lâu"""
+
+    def __init__(self, warn_wait_ms=50.0, warn_interval=10.0):
+        self.stats = PoolStats()
+        self.warn_wait_ms = warn_wait_ms
+        self.warn_interval = warn_interval
+        self._started = threading.local()
+        self._lock = threading.Lock()
+        self._last_warning = 0.0
+        self._observers = []
+
+    def add_wait_observer(self, callback):
+        """Call ``callback(wait_ms)`` after every successful checkout"""
+        self._observers.append(callback)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.stats.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.stats.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.stats.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        self._started.value = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.stats.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            wait_ms = duration * 1000
+        else:
+            started = getattr(self._started, 'value', None)
+            wait_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+        with self._lock:
+            stats = self.stats
+            stats.checkouts += 1
+            stats.checked_out += 1
+            stats.wait_total_ms += wait_ms
+            if wait_ms > stats.wait_max_ms:
+                stats.wait_max_ms = wait_ms
+            slow = wait_ms >= self.warn_wait_ms
+            if slow:
+                stats.slow_checkouts += 1
+        for observer in self._observers:
+            observer(wait_ms)
+        if slow:
+            self._warn(wait_ms, event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.stats.checked_out -= 1
+
+    def _warn(self, wait_ms, event):
+        now = time.monotonic()
+        if now - self._last_warning < self.warn_interval:
+            return
+        self._last_warning = now
+        logger.warning(
+            'MongoDB pool checkout waited %.1f ms (threshold %.1f ms) on %s; in use: %d - consider a larger maxPoolSize',
+            wait_ms, self.warn_wait_ms, event.address, self.stats.checked_out,
+        )
+
+
+pool_listener = PoolMetricsListener()
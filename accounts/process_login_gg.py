@@ -1,42 +1,221 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from pymongo import ReturnDocument
+
+from accounts import events
+from accounts.fragments import bump_data_version
+from accounts.middleware import HybridMiddleware
 from accounts.models import User
 from accounts.utils import create_user_session
 
+logger = logging.getLogger(__name__)
+
+
+class GoogleUserCache:
+    """email -> User MongoDB trong process, kể cả kết quả "không có" (negative cache)
+
+    User bị sửa/xóa ở bất kỳ worker nào rơi khỏi cache qua bus vô hiệu hóa
+    (accounts/invalidation.py); thay đổi của user chưa có trong cache có thể là
+    user mới nên xóa luôn các kết quả negative.
+    """
+
+    def __init__(self, ttl=300.0, negative_ttl=30.0, max_entries=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._users = OrderedDict()  # email -> (User, hết hạn monotonic)
+        self._emails = {}  # _id -> email
+        self._missing = {}  # email -> hết hạn monotonic
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, settings):
+        self.ttl = getattr(settings, 'GOOGLE_USER_CACHE_TTL', self.ttl)
+        self.negative_ttl = getattr(settings, 'GOOGLE_USER_NEGATIVE_TTL', self.negative_ttl)
+
+    def get(self, email):
+        """(có trong cache?, User hoặc None)"""
+        from accounts.invalidation import invalidation_bus
+
+        invalidation_bus.ensure_started()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._users.get(email)
+            if cached is not None and cached[1] > now:
+                self._users.move_to_end(email)
+                self.hits += 1
+                return True, cached[0]
+            if cached is not None:
+                self._remove(email)
+            expires = self._missing.get(email)
+            if expires is not None and expires > now:
+                self.hits += 1
+                return True, None
+            self._missing.pop(email, None)
+            self.misses += 1
+            return False, None
+
+    def put(self, email, user):
+        """Ghi nhớ User của ``email``; ``user`` None = không có / không dùng được"""
+        now = time.monotonic()
+        with self._lock:
+            self._remove(email)
+            if user is None:
+                if self.negative_ttl > 0:
+                    self._missing[email] = now + self.negative_ttl
+                return
+            if self.ttl <= 0:
+                return
+            self._missing.pop(email, None)
+            self._users[email] = (user, now + self.ttl)
+            self._emails[user.pk] = email
+            while len(self._users) > self.max_entries:
+                self._remove(next(iter(self._users)))
+            while len(self._missing) > self.max_entries:
+                self._missing.pop(next(iter(self._missing)))
+
+    def _remove(self, email):
+        cached = self._users.pop(email, None)
+        if cached is not None:
+            self._emails.pop(cached[0].pk, None)
+
+    def invalidated(self, invalidation):
+        """Callback của bus vô hiệu hóa cho collection users"""
+        with self._lock:
+            if invalidation.flush:
+                self._users.clear()
+                self._emails.clear()
+                self._missing.clear()
+                return
+            email = self._emails.get(invalidation.key)
+            if email is not None:
+                self._remove(email)
+            else:
+                self._missing.clear()
+
+    def stats(self):
+        return {'entries': len(self._users), 'missing': len(self._missing), 'hits': self.hits, 'misses': self.misses}
+
+
+google_users = GoogleUserCache()
+
+
+def upsert_google_user(email, username, first_name, last_name):
+    """User của ``email``, tạo mới nếu chưa có - một lệnh ``find_one_and_update`` nguyên tử
+
+    Index unique trên ``email`` bảo đảm hai lần đăng nhập song song không tạo hai
+    user. Trùng ``username`` với user khác vẫn báo DuplicateKeyError như ``save()``.
+    """
+    now = datetime.now()
+    new_id = ObjectId()
+    document = User._get_collection().find_one_and_update(
+        {'email': email},
+        {'$setOnInsert': {
+            '_id': new_id,
+            'username': username,
+            'email': email,
+            'first_name': first_name or username,
+            'last_name': last_name or '',
+            # Không đăng nhập được bằng mật khẩu; make_password(None) không tốn hash
+            'password': make_password(None),
+            'role': 'user',
+            'permissions': [],
+            'is_active': True,
+            'is_verified': True,
+            'is_staff': False,
+            'is_superuser': False,
+            'date_joined': now,
+            'updated_at': now,
+        }},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    user = User._from_son(document)
+    if document['_id'] == new_id:
+        # Tác dụng phụ của User.save() khi tạo mới
+        bump_data_version()
+        events.user_saved(user, True, set())
+    google_users.put(email, user)
+    return user
+
+
 # Hàm xử lý sau khi đăng nhập Google: tạo user MongoDB nếu chưa có và đồng bộ session custom
 
 def process_login_gg(strategy, details, backend, user=None, *args, **kwargs):
     email = details.get('email')
+    if not email:
+        return
     fullname = details.get('fullname') or ''
     first_name = details.get('first_name') or (fullname.split(' ')[0] if fullname else '')
     last_name = details.get('last_name') or (' '.join(fullname.split(' ')[1:]) if fullname else '')
-    username = email.split('@')[0] if email else ''
-    password = 'google_oauth2_default_password'
-
-    mongo_user = User.objects(email=email).first()
-    if not mongo_user and email:
-        mongo_user = User(
-            username=username,
-            email=email,
-            first_name=first_name or username,
-            last_name=last_name or '',
-            is_active=True,
-            is_verified=True,
-        )
-        mongo_user.set_password(password)
-        mongo_user.save()
+    username = email.split('@')[0]
+
+    mongo_user = upsert_google_user(email, username, first_name, last_name)
 
     # Tạo session custom cho user Google
-    if mongo_user:
-        request = strategy.request
-        create_user_session(request, mongo_user)
+    request = strategy.request
+    create_user_session(request, mongo_user)
+
 
 # Middleware đồng bộ session custom sau khi đăng nhập Google
-class SyncCustomSessionMiddleware:
+class SyncCustomSessionMiddleware(HybridMiddleware):
+    """Tạo session custom cho user đã đăng nhập Django (Google) nhưng chưa có session custom
+
+    Đứng sau AuthenticationMiddleware. Đường dẫn trong
+    ``SESSION_SYNC_SKIP_PREFIXES`` (static, ...) và request chưa đăng nhập Django
+    không chạm ``request.user`` hay MongoDB; email -> User được cache trong
+    ``google_users``, email không có user (hoặc tạo session lỗi) được nhớ trong
+    ``GOOGLE_USER_NEGATIVE_TTL`` giây thay vì thử lại ở mọi request.
+    """
+
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
+        prefixes = list(getattr(settings, 'SESSION_SYNC_SKIP_PREFIXES', ()))
+        if settings.STATIC_URL and settings.STATIC_URL.startswith('/'):
+            prefixes.append(settings.STATIC_URL)
+        self.skip_prefixes = tuple(prefixes)
+
+    def needs_sync(self, request):
+        """Kiểm tra rẻ, chỉ dựa vào đường dẫn và session"""
+        if self.skip_prefixes and request.path_info.startswith(self.skip_prefixes):
+            return False
+        return SESSION_KEY in request.session and not request.session.get('username')
+
+    def sync_session(self, request):
+        user = getattr(request, 'user', None)
+        email = getattr(user, 'email', None) if getattr(user, 'is_authenticated', False) else None
+        if not email:
+            return
+        cached, mongo_user = google_users.get(email)
+        if not cached:
+            mongo_user = User.objects(email=email).first()
+            google_users.put(email, mongo_user)
+        if mongo_user and create_user_session(request, mongo_user) is None:
+            google_users.put(email, None)  # MongoDB lỗi: không thử lại ở mọi request
 
     def __call__(self, request):
-        if not request.session.get('username') and hasattr(request, 'user') and getattr(request.user, 'is_authenticated', False) and getattr(request.user, 'email', None):
-            mongo_user = User.objects(email=request.user.email).first()
-            if mongo_user:
-                create_user_session(request, mongo_user)
+        if self.is_async:
+            return self.__acall__(request)
+        if self.needs_sync(request):
+            self.sync_session(request)
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.skip_prefixes and request.path_info.startswith(self.skip_prefixes):
+            return await self.get_response(request)
+        if hasattr(request.session, 'aload_session'):
+            # accounts.sessions: tải session bằng driver async thay vì chặn event loop
+            await request.session.aload_session()
+        if self.needs_sync(request):
+            await sync_to_async(self.sync_session)(request)
+        return await self.get_response(request)
@@ -0,0 +1,164 @@
+"""
+Profiler lấy mẫu (sampling) cho từng request, bật theo yêu cầu.
+
+Một thread nền duy nhất đọc stack của các thread đang được profile qua
+``sys._current_frames()`` mỗi ``interval`` giây. Không dùng ``sys.setprofile``
+nên request được profile chỉ chậm đi rất ít; request không được profile
+không tốn gì thêm.
+"""
+import heapq
+import itertools
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+
+class Profile:
+    """Collapsed stacks sampled while one request was running"""
+
+    def __init__(self, method, path, max_stacks=2000):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.view_name = None
+        self.started_at = datetime.now()
+        self.duration_ms = 0.0
+        self.samples = 0
+        self.stacks = Counter()
+        self.max_stacks = max_stacks
+
+    def add_sample(self, stack):
+        self.samples += 1
+        if stack in self.stacks or len(self.stacks) < self.max_stacks:
+            self.stacks[stack] += 1
+        else:
+            self.stacks[('<truncated>',)] += 1
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'view': self.view_name,
+            'started_at': self.started_at.strftime('%d/%m/%Y %H:%M:%S'),
+            'duration_ms': round(self.duration_ms, 3),
+            'samples': self.samples,
+        }
+
+    def collapsed(self):
+        """``frame;frame;frame count`` lines - input for flamegraph.pl / speedscope"""
+        return '\n'.join(
+            f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()
+        ) + '\n'
+
+    def flame_text(self, min_percent=0.5):
+        """Indented call tree with the share of samples spent under each frame"""
+        tree = {}
+        for stack, count in self.stacks.items():
+            node = tree
+            for frame in stack:
+                entry = node.setdefault(frame, [0, {}])
+                entry[0] += count
+                node = entry[1]
+        total = max(1, self.samples)
+        lines = [f'{self.method} {self.path} - {self.duration_ms:.1f} ms, {self.samples} samples']
+
+        def walk(node, depth):
+            for frame, (count, children) in sorted(node.items(), key=lambda item: -item[1][0]):
+                percent = 100.0 * count / total
+                if percent < min_percent:
+                    continue
+                lines.append(f"{'  ' * depth}{percent:5.1f}% {frame}")
+                walk(children, depth + 1)
+
+        walk(tree, 0)
+        return '\n'.join(lines) + '\n'
+
+
+class ProfileStore:
+    """Keeps the N slowest profiles"""
+
+    def __init__(self, max_profiles=20):
+        self.max_profiles = max_profiles
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        entry = (profile.duration_ms, next(self._counter), profile)
+        with self._lock:
+            if len(self._heap) < self.max_profiles:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def all(self):
+        with self._lock:
+            return [profile for _, _, profile in sorted(self._heap, reverse=True)]
+
+    def get(self, profile_id):
+        for profile in self.all():
+            if profile.id == profile_id:
+                return profile
+        return None
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{code.co_name}"
+
+
+class Sampler:
+    """Background thread sampling the stacks of registered threads"""
+
+    def __init__(self, interval=0.005, max_depth=128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self, profile):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._targets[thread_id] = profile
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+
+    def _sample(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                targets = dict(self._targets)
+            if not targets:
+                self._wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for thread_id, profile in targets.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.add_sample(self._sample(frame))
+            del frames
+            time.sleep(self.interval)
+
+
+sampler = Sampler()
+profile_store = ProfileStore()
@@ -0,0 +1,132 @@
+"""
+Chuẩn hóa hình dạng truy vấn (query shape) và phân tích explain plan của MongoDB.
+"""
+import json
+
+
+EXPLAINABLE_COMMANDS = frozenset({'find', 'aggregate', 'count', 'distinct', 'findAndModify', 'update', 'delete'})
+
+# Fields added by the driver that are not part of the query itself
+_DRIVER_FIELDS = frozenset({
+    'lsid', 'txnNumber', '$db', '$clusterTime', '$readPreference', 'readConcern',
+    'writeConcern', 'autocommit', 'startTransaction', 'apiVersion', 'apiStrict',
+    'apiDeprecationErrors', 'cursor', 'batchSize', 'singleBatch', 'maxTimeMS',
+    'ordered', 'comment',
+})
+
+_SHAPE_FIELDS = {
+    'find': ('filter', 'sort', 'projection'),
+    'aggregate': ('pipeline',),
+    'count': ('query',),
+    'distinct': ('key', 'query'),
+    'findAndModify': ('query', 'sort'),
+}
+
+# Values that keep their literal meaning in a shape (sort direction, projection flags)
+_KEEP_LITERALS = frozenset({'sort', 'projection', '$sort', '$project', 'key'})
+
+_SCAN_STAGES = frozenset({'COLLSCAN'})
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {key: (value[key] if key in _KEEP_LITERALS else _normalize(value[key])) for key in value}
+    if isinstance(value, (list, tuple)):
+        if all(not isinstance(item, (dict, list, tuple)) for item in value):
+            return '?'
+        return [_normalize(item) for item in value]
+    return '?'
+
+
+def _shape_parts(command_name, command):
+    if command_name in ('update', 'delete'):
+        statements = command.get('updates' if command_name == 'update' else 'deletes') or []
+        first = statements[0] if statements else {}
+        return {'q': _normalize(first.get('q', {}))}
+    parts = {}
+    for field in _SHAPE_FIELDS.get(command_name, ()):
+        if field in command:
+            value = command[field]
+            parts[field] = value if field in _KEEP_LITERALS else _normalize(value)
+    return parts
+
+
+def shape_of(command_name, command):
+    """Chuỗi mô tả hình dạng truy vấn, bỏ qua giá trị cụ thể
+
+    ``find users {"filter": {"username": "?"}}``
+    """
+    collection = command.get(command_name)
+    if not isinstance(collection, str):
+        collection = command.get('collection', '')
+    parts = _shape_parts(command_name, command)
+    if not parts:
+        return f"{command_name} {collection}"
+    return f"{command_name} {collection} {json.dumps(parts, default=str, sort_keys=True)}"
+
+
+def explainable(command_name):
+    return command_name in EXPLAINABLE_COMMANDS
+
+
+def explain_command(db, command_name, command, verbosity='executionStats'):
+    """Chạy ``explain`` cho một lệnh đã được driver gửi đi"""
+    inner = {command_name: command[command_name]}
+    for key, value in command.items():
+        if key == command_name or key in _DRIVER_FIELDS or key.startswith('$'):
+            continue
+        inner[key] = value
+    if command_name == 'aggregate':
+        inner['cursor'] = {}
+    return db.command({'explain': inner, 'verbosity': verbosity})
+
+
+def _walk_stages(plan, stages, index_names):
+    if not isinstance(plan, dict):
+        return
+    stage = plan.get('stage')
+    if stage:
+        stages.append(stage)
+        if stage == 'IXSCAN' and plan.get('indexName'):
+            index_names.append(plan['indexName'])
+    if 'inputStage' in plan:
+        _walk_stages(plan['inputStage'], stages, index_names)
+    for child in plan.get('inputStages', []):
+        _walk_stages(child, stages, index_names)
+    if 'queryPlan' in plan:
+        _walk_stages(plan['queryPlan'], stages, index_names)
+
+
+def _find_query_planner(explain):
+    if 'queryPlanner' in explain:
+        return explain['queryPlanner'], explain.get('executionStats', {})
+    # Aggregations wrap the planner output in $cursor stages
+    for stage in explain.get('stages', []):
+        cursor = stage.get('$cursor') if isinstance(stage, dict) else None
+        if cursor and 'queryPlanner' in cursor:
+            return cursor['queryPlanner'], cursor.get('executionStats', {})
+    return {}, {}
+
+
+def summarize_plan(explain):
+    """Tóm tắt explain output: stage chính, index dùng, số document quét"""
+    planner, execution = _find_query_planner(explain or {})
+    stages, index_names = [], []
+    _walk_stages(planner.get('winningPlan', {}), stages, index_names)
+    if any(stage in _SCAN_STAGES for stage in stages):
+        plan = 'COLLSCAN'
+    elif 'IXSCAN' in stages or 'IDHACK' in stages or 'EXPRESS_IXSCAN' in stages:
+        plan = 'IXSCAN'
+    elif 'COUNT_SCAN' in stages or 'RECORD_STORE_FAST_COUNT' in stages:
+        plan = 'COUNT'
+    else:
+        plan = stages[-1] if stages else 'UNKNOWN'
+    return {
+        'plan': plan,
+        'stages': stages,
+        'indexes': index_names,
+        'in_memory_sort': 'SORT' in stages,
+        'docs_examined': execution.get('totalDocsExamined', 0),
+        'keys_examined': execution.get('totalKeysExamined', 0),
+        'n_returned': execution.get('nReturned', 0),
+    }
@@ -0,0 +1,92 @@
+"""
+Danh sách các hình dạng truy vấn (query shape) mà ứng dụng thực sự chạy.
+
+``manage.py check_indexes`` dùng danh sách này để chạy ``explain`` trên dữ liệu
+thật và phát hiện COLLSCAN hoặc SORT trong bộ nhớ. Khi thêm truy vấn mới vào
+views/forms/utils, hãy thêm shape tương ứng vào đây.
+"""
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+
+
+class QueryShape:
+    """One query the application issues, with the index that should serve it"""
+
+    def __init__(self, name, collection, filter=None, sort=None, limit=None, count=False,
+                 source='', hot=False, index=None, expect_scan=False):
+        self.name = name
+        self.collection = collection
+        self.filter = filter or {}
+        self.sort = sort
+        self.limit = limit
+        self.count = count
+        self.source = source
+        self.hot = hot
+        self.index = index
+        self.expect_scan = expect_scan
+
+    def command(self):
+        """(command_name, command document) to explain"""
+        if self.count:
+            return 'count', {'count': self.collection, 'query': self.filter}
+        command = {'find': self.collection, 'filter': self.filter}
+        if self.sort:
+            command['sort'] = dict(self.sort)
+        if self.limit:
+            command['limit'] = self.limit
+        return 'find', command
+
+
+QUERY_SHAPES = [
+    # utils.py - mỗi request đã đăng nhập
+    QueryShape('session_lookup', 'user_sessions', {'session_key': 'k'},
+               source='sessions.SessionStore.load', hot=True, index=[('session_key', ASCENDING)]),
+    QueryShape('user_by_username', 'users', {'username': 'u'},
+               source='utils.get_current_user, views, forms.LoginForm, backends', hot=True,
+               index=[('username', ASCENDING)]),
+    QueryShape('session_expired', 'user_sessions', {'expire_date': {'$lt': datetime(2000, 1, 1)}},
+               source='sessions.SessionStore.clear_expired', index=[('expire_date', ASCENDING)]),
+
+    # forms.py / process_login_gg.py / views.api_profile_update
+    QueryShape('user_by_email', 'users', {'email': 'e@example.com'},
+               source='forms.clean_email, process_login_gg, views.api_profile_update', hot=True,
+               index=[('email', ASCENDING)]),
+
+    # views.py - dashboards
+    QueryShape('users_total', 'users', count=True, source='views.dashboard_view, views.home_view',
+               hot=True, expect_scan=True),
+    QueryShape('sessions_total', 'user_sessions', count=True, source='views.dashboard_view, views.home_view',
+               hot=True, expect_scan=True),
+    QueryShape('users_by_role_count', 'users', {'role': 'admin'}, count=True,
+               source='views.admin_dashboard_view, list_users --stats', hot=True,
+               index=[('role', ASCENDING)]),
+    QueryShape('recent_users', 'users', sort=[('date_joined', DESCENDING)], limit=5,
+               source='views.admin_dashboard_view, list_users --stats', hot=True,
+               index=[('date_joined', DESCENDING)]),
+    QueryShape('users_management_list', 'users', sort=[('date_joined', DESCENDING)],
+               source='views.users_management_view', index=[('date_joined', DESCENDING)]),
+    QueryShape('api_user_list', 'users', source='views.api_user_list', expect_scan=True),
+    QueryShape('users_changed_since', 'users',
+               {'updated_at': {'$gte': datetime(2000, 1, 1), '$lte': datetime(2000, 1, 2)}},
+               sort=[('updated_at', ASCENDING), ('_id', ASCENDING)], limit=501,
+               source='changes.changes_page', index=[('updated_at', ASCENDING), ('_id', ASCENDING)]),
+    QueryShape('tombstones_since', 'user_tombstones',
+               {'deleted_at': {'$gte': datetime(2000, 1, 1), '$lte': datetime(2000, 1, 2)}},
+               sort=[('deleted_at', ASCENDING), ('_id', ASCENDING)], limit=501,
+               source='changes.changes_page', index=[('deleted_at', ASCENDING), ('_id', ASCENDING)]),
+
+    # management commands
+    QueryShape('list_users_by_role', 'users', {'role': 'user'}, sort=[('username', ASCENDING)],
+               source='list_users --role', index=[('role', ASCENDING), ('username', ASCENDING)]),
+    QueryShape('list_users_all', 'users', sort=[('username', ASCENDING)],
+               source='list_users', index=[('username', ASCENDING)]),
+    QueryShape('active_users_count', 'users', {'is_active': True}, count=True,
+               source='list_users --stats', index=[('is_active', ASCENDING)]),
+    QueryShape('logged_in_users_count', 'users', {'last_login': {'$ne': None}}, count=True,
+               source='list_users --stats', index=[('last_login', ASCENDING)]),
+    QueryShape('change_user_role', 'users', {'username': 'u'},
+               source='change_user_role', index=[('username', ASCENDING)]),
+    QueryShape('slow_queries_window', 'slow_queries', {'created_at': {'$gte': datetime(2000, 1, 1)}},
+               source='slow_queries', index=[('created_at', ASCENDING)]),
+]
@@ -0,0 +1,200 @@
+"""
+Định tuyến lệnh đọc giữa primary và secondary của replica set.
+
+Mặc định driver đọc từ primary, và mọi lệnh đọc không đi qua module này giữ
+nguyên như vậy: session, get_current_user, đăng nhập, kiểm tra quyền luôn thấy
+dữ liệu mới nhất. Lệnh đọc chỉ để hiển thị cho admin và chịu được dữ liệu cũ vài
+giây (số liệu dashboard, danh sách người dùng, ``list_users``) đi qua
+``analytics(queryset, request)`` / ``analytics_collection(Document, request)``
+và chạy với ``secondaryPreferred`` + ``maxStalenessSeconds``
+(``MONGO_MAX_STALENESS_SECONDS``): secondary trễ hơn mức đó bị loại, không còn
+secondary nào thì đọc primary. Fragment cache (accounts/fragments.py) có thể
+giữ số liệu từ secondary thêm ``FRAGMENT_CACHE_TIMEOUT`` giây.
+
+Đọc lại thay đổi của chính mình:
+
+- ``note_write(request)`` sau khi ghi: trong ``MONGO_PRIMARY_PIN_SECONDS`` giây
+  lệnh analytics của session đó quay về primary (queryset mongoengine không
+  nhận ClientSession nên không dùng causal consistency được), và operationTime
+  của primary được lưu vào session Django.
+- ``causal_session(request)``: ClientSession causal consistency của pymongo tiếp
+  tục từ operationTime đó. Lệnh pymongo truyền ``session=`` đọc được từ
+  secondary mà vẫn thấy mọi lệnh ghi trước đó của người dùng (secondary chờ
+  tới ``afterClusterTime``).
+
+``MONGO_READ_ROUTING`` tắt (mặc định với mongomock) giữ mọi lệnh đọc ở primary.
+"""
+import base64
+import logging
+import time
+from contextlib import contextmanager
+
+from bson import Int64, Timestamp
+from django.conf import settings
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, get_connection, get_db
+from pymongo import ReadPreference
+from pymongo.read_preferences import SecondaryPreferred
+
+logger = logging.getLogger(__name__)
+
+PIN_SESSION_KEY = '_mongo_primary_until'
+CAUSAL_SESSION_KEY = '_mongo_causal'
+MIN_MAX_STALENESS = 90  # giá trị nhỏ nhất MongoDB chấp nhận cho maxStalenessSeconds
+
+_preferences = {}
+
+
+class RoutingStats:
+    """Số lệnh analytics được định tuyến tới secondary / giữ ở primary"""
+
+    def __init__(self):
+        self.secondary = 0
+        self.pinned = 0
+        self.disabled = 0
+        self.writes_noted = 0
+
+    def snapshot(self):
+        return {
+            'enabled': enabled(),
+            'max_staleness_s': max_staleness(),
+            'secondary_preferred': self.secondary,
+            'pinned_to_primary': self.pinned,
+            'primary_routing_off': self.disabled,
+            'writes_noted': self.writes_noted,
+        }
+
+
+routing_stats = RoutingStats()
+
+
+def enabled():
+    return getattr(settings, 'MONGO_READ_ROUTING', False)
+
+
+def max_staleness():
+    return max(MIN_MAX_STALENESS, int(getattr(settings, 'MONGO_MAX_STALENESS_SECONDS', MIN_MAX_STALENESS)))
+
+
+def secondary_preferred():
+    seconds = max_staleness()
+    preference = _preferences.get(seconds)
+    if preference is None:
+        preference = _preferences[seconds] = SecondaryPreferred(max_staleness=seconds)
+    return preference
+
+
+def pinned(request):
+    """True nếu session của ``request`` vừa ghi và đang bị ghim vào primary"""
+    if request is None:
+        return False
+    try:
+        until = request.session.get(PIN_SESSION_KEY)
+    except Exception:
+        return False
+    return bool(until) and until > time.time()
+
+
+def read_preference(request=None):
+    """Read preference cho một lệnh đọc analytics của ``request``"""
+    if not enabled():
+        routing_stats.disabled += 1
+        return ReadPreference.PRIMARY
+    if pinned(request):
+        routing_stats.pinned += 1
+        return ReadPreference.PRIMARY
+    routing_stats.secondary += 1
+    return secondary_preferred()
+
+
+def analytics(queryset, request=None):
+    """QuerySet mongoengine đọc từ secondary (trừ khi tắt hoặc đang ghim primary)"""
+    preference = read_preference(request)
+    if preference is ReadPreference.PRIMARY:
+        return queryset
+    return queryset.read_preference(preference)
+
+
+def analytics_collection(document, request=None, session=None):
+    """Collection pymongo cho lệnh đọc analytics
+
+    Với ``session`` từ ``causal_session`` đã có operationTime, đọc secondary cả
+    khi request đang bị ghim: afterClusterTime đã bảo đảm thấy lệnh ghi trước đó.
+    """
+    if session is not None and session.operation_time is not None:
+        request = None
+    preference = read_preference(request)
+    return document._get_collection().with_options(read_preference=preference)
+
+
+def pin_primary(request):
+    """Ghim lệnh analytics của session vào primary sau khi ghi (không tốn round trip)"""
+    if not enabled():
+        return
+    request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'MONGO_PRIMARY_PIN_SECONDS', 90)
+    routing_stats.writes_noted += 1
+
+
+def note_write(request, alias=DEFAULT_CONNECTION_NAME):
+    """Gọi sau khi view ghi dữ liệu: ghim primary và lưu operationTime cho ``causal_session``"""
+    if not enabled():
+        return
+    pin_primary(request)
+    try:
+        # Lệnh ghi đã xong trên primary: operationTime của một lệnh sau nó không nhỏ hơn
+        with causal_session(request, alias=alias, remember=True) as session:
+            if session is not None:
+                get_db(alias).command('ping', session=session)
+    except Exception as e:
+        logger.debug('Could not record causal operation time: %s', e)
+
+
+def _encode_cluster_time(cluster_time):
+    timestamp = cluster_time['clusterTime']
+    encoded = {'t': [timestamp.time, timestamp.inc]}
+    signature = cluster_time.get('signature')
+    if signature:
+        encoded['h'] = base64.b64encode(bytes(signature['hash'])).decode()
+        encoded['k'] = int(signature['keyId'])
+    return encoded
+
+
+def _decode_cluster_time(encoded):
+    cluster_time = {'clusterTime': Timestamp(*encoded['t'])}
+    if 'h' in encoded:
+        cluster_time['signature'] = {'hash': base64.b64decode(encoded['h']), 'keyId': Int64(encoded['k'])}
+    return cluster_time
+
+
+@contextmanager
+def causal_session(request=None, alias=DEFAULT_CONNECTION_NAME, remember=False):
+    """ClientSession causal consistency, tiếp tục từ lệnh ghi trước của session Django
+
+    Trả về None khi định tuyến tắt hoặc không mở được session (mongomock):
+    truyền ``session=None`` cho pymongo vẫn chạy bình thường. ``remember=True`` lưu
+    operationTime cuối vào ``request.session`` (chỉ dùng trong request có ghi,
+    vì mỗi lần lưu là một lần ghi session).
+    """
+    session = None
+    if enabled():
+        try:
+            session = get_connection(alias).start_session(causal_consistency=True)
+        except Exception as e:  # mongomock, server không hỗ trợ session
+            logger.debug('Causal session unavailable: %s', e)
+    if session is None:
+        yield None
+        return
+    with session:
+        saved = request.session.get(CAUSAL_SESSION_KEY) if request is not None else None
+        if saved:
+            try:
+                session.advance_cluster_time(_decode_cluster_time(saved['cluster']))
+                session.advance_operation_time(Timestamp(*saved['op']))
+            except Exception as e:
+                logger.debug('Ignoring saved causal session state: %s', e)
+        yield session
+        if remember and request is not None and session.operation_time is not None and session.cluster_time:
+            operation_time = session.operation_time
+            request.session[CAUSAL_SESSION_KEY] = {
+                'op': [operation_time.time, operation_time.inc],
+                'cluster': _encode_cluster_time(session.cluster_time),
+            }
@@ -0,0 +1,330 @@
+"""
+Session engine Django lưu dữ liệu session của người dùng đã đăng nhập ngay
+trong document UserSession.
+
+    SESSION_ENGINE = 'accounts.sessions'
+
+Trước đây mỗi request đăng nhập đọc session Django (cache) rồi đọc thêm
+UserSession, và hai nơi có thể lệch nhau (restart worker mất session LocMem
+trong khi UserSession vẫn còn). Giờ session đã đăng nhập *là* UserSession:
+cookie ``sessionid`` chính là ``UserSession.session_key``, dữ liệu nằm ở
+``session_data`` (mã hóa và ký như backend ``db`` của Django), hết hạn theo
+``expire_date`` (TTL index). Tải và kiểm tra session là một lệnh find theo
+index unique ``session_key``, giới hạn bởi ``MONGO_REQUEST_LOOKUP_TIMEOUT_MS`` và
+bỏ qua khi ``database_health`` đang báo MongoDB lỗi.
+
+- L1 trong process (``SESSION_L1_TTL`` giây, tối đa ``SESSION_L1_MAX_ENTRIES``)
+  đứng trước MongoDB. Document bị xóa/sửa ở worker khác đến L1 qua bus vô hiệu
+  hóa (accounts/invalidation.py); TTL là giới hạn trên khi bus tắt.
+- Chỉ ghi khi dữ liệu session thực sự đổi; ``last_activity`` ghi tối đa mỗi
+  ``SESSION_ACTIVITY_INTERVAL`` giây (``touch_activity``).
+- Session chưa đăng nhập (message flash, ...) vẫn nằm trong cache như engine
+  ``cache``, để user_sessions chỉ chứa phiên đăng nhập.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+from pymongo.errors import DuplicateKeyError
+
+from . import aio
+from .health import database_health, request_lookup
+from .models import UserSession
+
+logger = logging.getLogger(__name__)
+
+PROJECTION = {'user': 1, 'session_data': 1, 'expire_date': 1, 'last_activity': 1}
+
+
+class CachedSession:
+    """Một UserSession đã tải; ghi dữ liệu thì thay bằng bản mới, chỉ ``activity`` được sửa tại chỗ"""
+
+    __slots__ = ('id', 'user', 'encoded', 'expire_date', 'activity', 'cached_at')
+
+    def __init__(self, id, user, encoded, expire_date, activity):
+        self.id = id
+        self.user = user
+        self.encoded = encoded
+        self.expire_date = expire_date
+        self.activity = activity
+        self.cached_at = time.monotonic()
+
+    @classmethod
+    def from_document(cls, document):
+        return cls(document['_id'], document.get('user'), document.get('session_data') or '',
+                   document.get('expire_date'), document.get('last_activity'))
+
+    @property
+    def expired(self):
+        return self.expire_date is not None and self.expire_date <= datetime.now()
+
+
+class SessionCache:
+    """L1 của từng process: session_key -> CachedSession, LRU + TTL"""
+
+    def __init__(self, ttl=10.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys = {}  # _id của UserSession -> session_key (sự kiện xóa chỉ có _id)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, settings):
+        self.ttl = getattr(settings, 'SESSION_L1_TTL', self.ttl)
+        self.max_entries = getattr(settings, 'SESSION_L1_MAX_ENTRIES', self.max_entries)
+
+    def get(self, session_key):
+        from .invalidation import invalidation_bus
+
+        invalidation_bus.ensure_started()
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is not None and time.monotonic() - entry.cached_at <= self.ttl:
+                self._entries.move_to_end(session_key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(session_key)
+            self.misses += 1
+            return None
+
+    def put(self, session_key, entry):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._remove(session_key)
+            self._entries[session_key] = entry
+            self._keys[entry.id] = session_key
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, session_key):
+        with self._lock:
+            self._remove(session_key)
+
+    def _remove(self, session_key):
+        entry = self._entries.pop(session_key, None)
+        if entry is not None:
+            self._keys.pop(entry.id, None)
+
+    def invalidated(self, invalidation):
+        """Callback của bus vô hiệu hóa cho collection user_sessions"""
+        with self._lock:
+            if invalidation.flush:
+                self._entries.clear()
+                self._keys.clear()
+            else:
+                session_key = self._keys.get(invalidation.key)
+                if session_key is not None:
+                    self._remove(session_key)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+session_cache = SessionCache()
+
+
+def _is_authenticated(data):
+    return bool(data.get('is_authenticated') and data.get('username'))
+
+
+class SessionStore(CacheSessionStore):
+    """Session đã đăng nhập trong UserSession, session khách trong cache"""
+
+    cache_key_prefix = 'accounts.sessions.'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self.entry = None  # CachedSession khi session đang nằm trong UserSession
+        self.client = {}  # ip_address / user_agent cho UserSession mới (create_user_session)
+
+    # -- đọc -------------------------------------------------------------------
+
+    def _bind(self, entry):
+        """Dữ liệu của ``entry``, None nếu không dùng được (hết hạn, chữ ký sai)"""
+        if entry.expired:
+            return None
+        data = self.decode(entry.encoded)
+        if not _is_authenticated(data):
+            return None
+        self.entry = entry
+        return data
+
+    def _fetch(self, session_key):
+        if database_health.down:
+            logger.warning('Skipping session load: MongoDB is down')
+            return None
+        with request_lookup():
+            document = UserSession._get_collection().find_one({'session_key': session_key}, PROJECTION)
+        return self._remember(session_key, document)
+
+    async def _afetch(self, session_key):
+        if database_health.down:
+            logger.warning('Skipping session load: MongoDB is down')
+            return None
+        with request_lookup():
+            document = await aio.get_collection(UserSession).find_one({'session_key': session_key}, PROJECTION)
+        return self._remember(session_key, document)
+
+    def _remember(self, session_key, document):
+        if document is None:
+            return None
+        entry = CachedSession.from_document(document)
+        session_cache.put(session_key, entry)
+        return entry
+
+    def _cached(self, session_key):
+        """(UserSession trong L1, dữ liệu session khách trong cache)"""
+        entry = session_cache.get(session_key)
+        return entry, (self._cache.get(self.cache_key) if entry is None else None)
+
+    def _result(self, entry, guest):
+        if guest is not None:
+            return guest
+        if entry is not None:
+            data = self._bind(entry)
+            if data is not None:
+                return data
+        self._session_key = None
+        return {}
+
+    def load(self):
+        self.entry = None
+        entry = guest = None
+        try:
+            if self.session_key:
+                entry, guest = self._cached(self.session_key)
+                if entry is None and guest is None:
+                    entry = self._fetch(self.session_key)
+        except Exception as e:
+            logger.warning('Could not load session: %s', e)
+        return self._result(entry, guest)
+
+    async def aload_session(self):
+        """Tải session bằng driver async trước khi view async đọc ``request.session``"""
+        if hasattr(self, '_session_cache'):
+            return
+        self.entry = None
+        entry = guest = None
+        try:
+            if self.session_key:
+                entry, guest = self._cached(self.session_key)
+                if entry is None and guest is None:
+                    entry = await self._afetch(self.session_key)
+        except Exception as e:
+            logger.warning('Could not load session: %s', e)
+        self._session_cache = self._result(entry, guest)
+
+    # -- ghi -------------------------------------------------------------------
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if not _is_authenticated(data):
+            if self.entry is not None:
+                # Bỏ trạng thái đăng nhập mà không flush: chuyển về cache
+                self._delete(self.session_key, self.entry)
+                must_create = True
+            return super().save(must_create=must_create)
+
+        encoded = self.encode(data)
+        expire_date = datetime.now() + timedelta(seconds=self.get_expiry_age())
+        collection = UserSession._get_collection()
+        entry = self.entry
+        if entry is not None and not must_create:
+            # Chỉ ghi khi dữ liệu đổi (SessionMiddleware lưu mọi session bị gán lại giá trị)
+            if entry.encoded == encoded and entry.expire_date is not None \
+                    and abs((entry.expire_date - expire_date).total_seconds()) < 60:
+                return
+            fields = {'session_data': encoded, 'expire_date': expire_date, 'user': data['username']}
+            if not collection.update_one({'_id': entry.id}, {'$set': fields}).matched_count:
+                session_cache.discard(self.session_key)
+                raise UpdateError  # đã bị xóa (đăng xuất ở nơi khác)
+            entry = CachedSession(entry.id, data['username'], encoded, expire_date, entry.activity)
+        else:
+            now = datetime.now()
+            document = {
+                'user': data['username'],
+                'session_key': self.session_key,
+                'session_data': encoded,
+                'expire_date': expire_date,
+                'created_at': now,
+                'last_activity': now,
+                'is_active': True,
+                'ip_address': self.client.get('ip_address'),
+                'user_agent': self.client.get('user_agent', ''),
+            }
+            try:
+                document_id = collection.insert_one(document).inserted_id
+            except DuplicateKeyError:
+                raise CreateError
+            entry = CachedSession(document_id, data['username'], encoded, expire_date, now)
+            self._cache.delete(self.cache_key)  # bản khách trước khi đăng nhập (nếu có)
+        self.entry = entry
+        session_cache.put(self.session_key, entry)
+
+    def touch_activity(self):
+        """Cập nhật last_activity, tối đa mỗi ``SESSION_ACTIVITY_INTERVAL`` giây"""
+        update = self._activity_update()
+        if update is not None:
+            UserSession._get_collection().update_one(*update)
+
+    async def atouch_activity(self):
+        update = self._activity_update()
+        if update is not None:
+            await aio.get_collection(UserSession).update_one(*update)
+
+    def _activity_update(self):
+        self._get_session()
+        entry = self.entry
+        if entry is None:
+            return None
+        now = datetime.now()
+        interval = timedelta(seconds=getattr(settings, 'SESSION_ACTIVITY_INTERVAL', 60))
+        if entry.activity is not None and now - entry.activity < interval:
+            return None
+        entry.activity = now  # các request song song của cùng session không ghi lặp lại
+        return {'_id': entry.id}, {'$set': {'last_activity': now}}
+
+    # -- xóa / đổi key ---------------------------------------------------------
+
+    def _delete(self, session_key, entry):
+        if entry is not None:
+            UserSession._get_collection().delete_one({'_id': entry.id})
+        session_cache.discard(session_key)
+        self._cache.delete(self.cache_key_prefix + session_key)
+
+    def delete(self, session_key=None):
+        if session_key is None or session_key == self.session_key:
+            if self.session_key is None:
+                return
+            self._delete(self.session_key, self.entry)
+            self.entry = None
+            return
+        UserSession._get_collection().delete_one({'session_key': session_key})
+        session_cache.discard(session_key)
+        self._cache.delete(self.cache_key_prefix + session_key)
+
+    def cycle_key(self):
+        """Key mới (chống session fixation), dữ liệu giữ nguyên"""
+        data = self._session
+        session_key, entry = self.session_key, self.entry
+        self.entry = None
+        self.create()
+        self._session_cache = data
+        if session_key:
+            self._delete(session_key, entry)
+
+    @classmethod
+    def clear_expired(cls):
+        """``manage.py clearsessions`` (TTL index cũng tự xóa)"""
+        UserSession._get_collection().delete_many({'expire_date': {'$lt': datetime.now()}})
@@ -0,0 +1,291 @@
+"""
+Cache backend Django dùng chung giữa các worker trên cùng máy qua file memory-mapped.
+
+    CACHES = {'default': {
+        'BACKEND': 'accounts.shmcache.SharedMemoryCache',
+        'LOCATION': '/dev/shm/rehearten-cache/default',
+        'OPTIONS': {'MAX_ENTRIES': 16384, 'SLOT_SIZE': 1024},
+    }}
+
+File được chia thành các set, mỗi set ``WAYS`` slot kích thước cố định
+(set-associative như cache CPU): key băm vào đúng một set nên mỗi thao tác chỉ
+xem ``WAYS`` slot. Set đầy thì dùng lại slot hết hạn, sau đó slot lâu không
+dùng nhất (LRU trong set). Mỗi thao tác khóa set của nó bằng khóa thread trong
+process và ``fcntl.lockf`` trên một byte ứng với set giữa các process: ``incr``
+nguyên tử với mọi worker, các set khác nhau không chặn nhau.
+
+Giá trị được pickle như LocMemCache. Key + giá trị lớn hơn ``SLOT_SIZE`` không
+được lưu (lần get sau là miss). Không cần server nào: file
+``<LOCATION>/cache-<sets>x<ways>x<slot>.db`` được tạo khi dùng lần đầu; đổi
+kích thước sẽ dùng file mới thay vì cắt file mà worker khác đang map. Chỉ chạy
+trên POSIX (fcntl).
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<8sIIII')  # magic, format, sets, ways, slot size
+_MAGIC = b'RHSHMCAC'
+_FORMAT = 1
+_DATA_OFFSET = 64
+# key hash, hết hạn (time.time(), 0 = không hết hạn), lần dùng cuối (monotonic ns), độ dài giá trị, độ dài key
+_SLOT = struct.Struct('<QdQIH2x')
+_THREAD_LOCK_STRIPES = 64
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+class SharedFile:
+    """mmap của một file cache, dùng chung cho mọi instance backend trong process"""
+
+    def __init__(self, path, sets, ways, slot_size):
+        self.path = path
+        self.sets = sets
+        self.ways = ways
+        self.slot_size = slot_size
+        self.stride = _SLOT.size + slot_size
+        self.size = _DATA_OFFSET + sets * ways * self.stride
+        self.buffer = None
+        self.fd = None
+        self.reset_locks()
+
+    def reset_locks(self):
+        # fcntl chỉ loại trừ giữa các process; thread trong cùng process cần khóa riêng
+        self.thread_locks = [threading.Lock() for _ in range(_THREAD_LOCK_STRIPES)]
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        header = _HEADER.pack(_MAGIC, _FORMAT, self.sets, self.ways, self.slot_size)
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+        try:
+            if os.fstat(fd).st_size != self.size or os.pread(fd, _HEADER.size, 0) != header:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, header, 0)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+        # fd giữ mở suốt đời process: đóng bất kỳ fd nào của file sẽ nhả mọi khóa fcntl
+        self.fd = fd
+        self.buffer = mmap.mmap(fd, self.size)
+
+    def lock(self, index):
+        thread_lock = self.thread_locks[index % _THREAD_LOCK_STRIPES]
+        thread_lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, 1 + index)
+        except BaseException:
+            thread_lock.release()
+            raise
+        return thread_lock
+
+    def unlock(self, index, thread_lock):
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, 1 + index)
+        finally:
+            thread_lock.release()
+
+
+def shared_file(path, sets, ways, slot_size):
+    with _files_lock:
+        shared = _files.get(path)
+        if shared is None:
+            shared = SharedFile(path, sets, ways, slot_size)
+            shared.open()
+            _files[path] = shared
+        return shared
+
+
+def _reset_after_fork():
+    # Khóa thread có thể đang bị giữ bởi thread không còn tồn tại trong process con
+    for shared in _files.values():
+        shared.reset_locks()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class SharedMemoryCache(BaseCache):
+    """Django cache backend trên SharedFile (xem docstring module)"""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.ways = int(options.get('WAYS', 8))
+        self.slot_size = int(options.get('SLOT_SIZE', 1024))
+        self.sets = max(1, -(-self._max_entries // self.ways))
+        self.location = location
+        self._file = shared_file(
+            os.path.join(location, f'cache-{self.sets}x{self.ways}x{self.slot_size}.db'),
+            self.sets, self.ways, self.slot_size,
+        )
+
+    # -- slot helpers (gọi khi đang giữ khóa của set) ---------------------------
+
+    def _key(self, key, version):
+        raw = self.make_and_validate_key(key, version=version).encode()
+        key_hash = int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'little')
+        return raw, key_hash, key_hash % self.sets
+
+    def _find(self, buffer, index, raw, key_hash, now):
+        """(offset của key, còn hạn?, offset slot để ghi key mới)"""
+        stride = self._file.stride
+        base = _DATA_OFFSET + index * self.ways * stride
+        victim, victim_rank = None, None
+        for way in range(self.ways):
+            offset = base + way * stride
+            slot_hash, expires, used, _, key_length = _SLOT.unpack_from(buffer, offset)
+            if key_length == 0:
+                rank = -2
+            else:
+                expired = expires and expires <= now
+                if slot_hash == key_hash and key_length == len(raw) \
+                        and buffer[offset + _SLOT.size:offset + _SLOT.size + key_length] == raw:
+                    return offset, not expired, offset
+                rank = -1 if expired else used
+            if victim is None or rank < victim_rank:
+                victim, victim_rank = offset, rank
+        return None, False, victim
+
+    def _read(self, buffer, offset):
+        _, _, _, value_length, key_length = _SLOT.unpack_from(buffer, offset)
+        start = offset + _SLOT.size + key_length
+        return buffer[start:start + value_length]
+
+    def _write(self, buffer, offset, raw, key_hash, data, expires):
+        start = offset + _SLOT.size
+        buffer[start:start + len(raw)] = raw
+        buffer[start + len(raw):start + len(raw) + len(data)] = data
+        _SLOT.pack_into(buffer, offset, key_hash, expires or 0.0, time.monotonic_ns(), len(data), len(raw))
+
+    def _touch_used(self, buffer, offset):
+        struct.pack_into('<Q', buffer, offset + 16, time.monotonic_ns())
+
+    def _clear_slot(self, buffer, offset):
+        _SLOT.pack_into(buffer, offset, 0, 0.0, 0, 0, 0)
+
+    def _store(self, key, value, timeout, version, only_if_missing):
+        raw, key_hash, index = self._key(key, version)
+        data = pickle.dumps(value, self.pickle_protocol)
+        fits = len(raw) + len(data) <= self.slot_size
+        expires = self.get_backend_timeout(timeout)
+        shared = self._file
+        lock = shared.lock(index)
+        try:
+            offset, live, target = self._find(shared.buffer, index, raw, key_hash, time.time())
+            if only_if_missing and live:
+                return False
+            if not fits:
+                # Giá trị cũ không còn đúng: xóa thay vì để lại
+                if offset is not None:
+                    self._clear_slot(shared.buffer, offset)
+                logger.debug('Cache value too large for %d-byte slot: %s', self.slot_size, key)
+                return False
+            self._write(shared.buffer, target, raw, key_hash, data, expires)
+            return True
+        finally:
+            shared.unlock(index, lock)
+
+    # -- Django cache API -----------------------------------------------------
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(key, value, timeout, version, only_if_missing=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version, only_if_missing=False)
+
+    def get(self, key, default=None, version=None):
+        raw, key_hash, index = self._key(key, version)
+        shared = self._file
+        lock = shared.lock(index)
+        try:
+            offset, live, _ = self._find(shared.buffer, index, raw, key_hash, time.time())
+            if offset is None:
+                return default
+            if not live:
+                self._clear_slot(shared.buffer, offset)
+                return default
+            self._touch_used(shared.buffer, offset)
+            data = self._read(shared.buffer, offset)
+        finally:
+            shared.unlock(index, lock)
+        return pickle.loads(data)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        raw, key_hash, index = self._key(key, version)
+        shared = self._file
+        lock = shared.lock(index)
+        try:
+            offset, live, _ = self._find(shared.buffer, index, raw, key_hash, time.time())
+            if not live:
+                return False
+            struct.pack_into('<d', shared.buffer, offset + 8, self.get_backend_timeout(timeout) or 0.0)
+            return True
+        finally:
+            shared.unlock(index, lock)
+
+    def delete(self, key, version=None):
+        raw, key_hash, index = self._key(key, version)
+        shared = self._file
+        lock = shared.lock(index)
+        try:
+            offset, live, _ = self._find(shared.buffer, index, raw, key_hash, time.time())
+            if offset is not None:
+                self._clear_slot(shared.buffer, offset)
+            return live
+        finally:
+            shared.unlock(index, lock)
+
+    def has_key(self, key, version=None):
+        raw, key_hash, index = self._key(key, version)
+        shared = self._file
+        lock = shared.lock(index)
+        try:
+            return self._find(shared.buffer, index, raw, key_hash, time.time())[1]
+        finally:
+            shared.unlock(index, lock)
+
+    def incr(self, key, delta=1, version=None):
+        """Nguyên tử giữa mọi thread và worker (đọc-cộng-ghi trong khóa của set)"""
+        raw, key_hash, index = self._key(key, version)
+        shared = self._file
+        lock = shared.lock(index)
+        try:
+            offset, live, _ = self._find(shared.buffer, index, raw, key_hash, time.time())
+            if not live:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(self._read(shared.buffer, offset)) + delta
+            data = pickle.dumps(value, self.pickle_protocol)
+            if len(raw) + len(data) > self.slot_size:
+                raise ValueError("Key '%s' value too large" % key)
+            expires = struct.unpack_from('<d', shared.buffer, offset + 8)[0]
+            self._write(shared.buffer, offset, raw, key_hash, data, expires)
+            return value
+        finally:
+            shared.unlock(index, lock)
+
+    def clear(self):
+        shared = self._file
+        set_size = self.ways * shared.stride
+        empty = bytes(set_size)
+        for index in range(self.sets):
+            lock = shared.lock(index)
+            try:
+                start = _DATA_OFFSET + index * set_size
+                shared.buffer[start:start + set_size] = empty
+            finally:
+                shared.unlock(index, lock)
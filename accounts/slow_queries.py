@@ -0,0 +1,117 @@
+"""
+Ghi lại lệnh MongoDB chậm kèm explain plan vào capped collection ``slow_queries``.
+
+Việc chạy ``explain`` và ghi kết quả diễn ra trên một thread nền với hàng đợi
+giới hạn, nên request không phải chờ; khi hàng đợi đầy bản ghi bị bỏ qua.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from . import monitoring
+from .query_plans import shape_of, explainable, explain_command, summarize_plan
+
+logger = logging.getLogger(__name__)
+
+SKIPPED_COMMANDS = frozenset({'explain', 'getMore', 'killCursors', 'endSessions', 'hello', 'isMaster', 'ping'})
+
+
+class SlowQueryRecorder:
+    """Command observer that captures commands slower than a threshold"""
+
+    def __init__(self, threshold_ms=100.0, sample_rate=1.0, explain_interval=300.0, queue_size=256):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.explain_interval = explain_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last_explained = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def __call__(self, record):
+        if record.duration_ms < self.threshold_ms or not record.succeeded:
+            return
+        if record.name in SKIPPED_COMMANDS or record.collection == 'slow_queries':
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='slow-query-recorder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with monitoring.suppress():
+            while True:
+                record = self._queue.get()
+                try:
+                    self._store(record)
+                except Exception as e:
+                    logger.warning('Could not store slow query %s: %s', record.name, e)
+
+    def _should_explain(self, shape):
+        now = time.monotonic()
+        last = self._last_explained.get(shape)
+        if last is not None and now - last < self.explain_interval:
+            return False
+        self._last_explained[shape] = now
+        return True
+
+    def _store(self, record):
+        from mongoengine.connection import get_db
+        from .models import SlowQuery
+
+        shape = shape_of(record.name, record.command)
+        summary = {}
+        if explainable(record.name) and self._should_explain(shape):
+            try:
+                summary = summarize_plan(explain_command(get_db(), record.name, record.command))
+            except Exception as e:
+                logger.debug('explain failed for %s: %s', shape, e)
+
+        SlowQuery(
+            shape=shape,
+            command_name=record.name,
+            collection_name=record.collection,
+            duration_ms=record.duration_ms,
+            plan=summary.get('plan'),
+            stages=summary.get('stages', []),
+            indexes=summary.get('indexes', []),
+            in_memory_sort=summary.get('in_memory_sort', False),
+            docs_examined=summary.get('docs_examined', 0),
+            keys_examined=summary.get('keys_examined', 0),
+            n_returned=summary.get('n_returned', 0),
+        ).save()
+
+
+slow_query_recorder = None
+
+
+def install():
+    """Đăng ký recorder theo cấu hình ``MONGO_SLOW_QUERY_*`` trong settings"""
+    global slow_query_recorder
+    if not getattr(settings, 'MONGO_SLOW_QUERY_ENABLED', True):
+        return None
+    if slow_query_recorder is None:
+        slow_query_recorder = SlowQueryRecorder(
+            threshold_ms=getattr(settings, 'MONGO_SLOW_QUERY_MS', 100.0),
+            sample_rate=getattr(settings, 'MONGO_SLOW_QUERY_SAMPLE_RATE', 1.0),
+            explain_interval=getattr(settings, 'MONGO_SLOW_QUERY_EXPLAIN_INTERVAL', 300.0),
+        )
+        monitoring.register_command_observer(slow_query_recorder)
+    return slow_query_recorder
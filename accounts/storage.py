@@ -0,0 +1,241 @@
+"""
+Static storage có hash trong tên file và biến thể ảnh nhỏ hơn (WebP/AVIF).
+
+Khi chạy ``collectstatic``, mỗi ảnh trong ``STATIC_IMAGE_VARIANTS`` được thu nhỏ
+về các chiều rộng cấu hình, lưu ở định dạng gốc và ở ``STATIC_IMAGE_FORMATS``:
+
+    images/logo_rehearten.png -> images/logo_rehearten.w96.webp, .w96.avif, .w96.png, ...
+
+Các biến thể đi qua ``ManifestStaticFilesStorage`` như file thường nên cũng có
+hash (``logo_rehearten.w96.3f2a....webp``) và có thể cache một năm. Danh sách biến
+thể thực sự đã tạo (kèm kích thước) được ghi vào ``staticfiles-images.json`` để
+template tag ``{% picture %}`` (accounts/templatetags/images.py) dựng srcset.
+
+File text có hash (CSS/JS, gồm bundle từ ``build_assets``) được nén sẵn thành
+``.gz``/``.br`` bên cạnh để ``serve`` (hoặc nginx ``gzip_static``) trả thẳng.
+"""
+import json
+import logging
+import os
+import posixpath
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.cache import patch_vary_headers
+from django.views.static import serve as static_serve
+
+from .assets import COMPRESSIBLE_EXTENSIONS, compressed_variants
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+}
+
+# Tham số encode cho từng định dạng đầu ra
+SAVE_OPTIONS = {
+    'avif': {'quality': 55, 'speed': 6},
+    'webp': {'quality': 80, 'method': 6},
+    'png': {'optimize': True},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'png': 'png', 'jpeg': 'jpg'}
+
+# name.<12 hex>.ext do ManifestStaticFilesStorage tạo
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Chỉ cảnh báo một lần cho mỗi file thiếu, không phải mỗi request
+_missing_reported = set()
+
+
+def variant_name(name, width, fmt):
+    """images/logo.png, 96, 'webp' -> images/logo.w96.webp"""
+    root, _ = posixpath.splitext(name)
+    return f'{root}.w{width}.{EXTENSIONS[fmt]}'
+
+
+def source_format(name):
+    extension = posixpath.splitext(name)[1].lower()
+    return 'jpeg' if extension in ('.jpg', '.jpeg') else 'png'
+
+
+def supported_formats(formats):
+    """Bỏ các định dạng Pillow build hiện tại không encode được (AVIF cần Pillow 11.2+)"""
+    from PIL import features
+
+    available = []
+    for fmt in formats:
+        try:
+            if features.check(fmt):
+                available.append(fmt)
+                continue
+        except ValueError:
+            pass
+        logger.warning('Pillow has no %s encoder, skipping %s image variants', fmt, fmt)
+    return available
+
+
+def resize_image(image, width, fmt):
+    """Thu nhỏ theo chiều rộng, giữ tỉ lệ; trả về (bytes, width, height)"""
+    from PIL import Image
+
+    height = max(1, round(image.height * width / image.width))
+    palette = image.mode == 'P'
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('P', 'LA') else 'RGB')
+    if fmt == 'jpeg' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+    if width != image.width:
+        image = image.resize((width, height), Image.LANCZOS)
+    if fmt == 'png' and palette:
+        # PNG bảng màu gốc nhỏ hơn nhiều so với RGBA sau khi resize
+        image = image.quantize(256)
+
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buffer.getvalue(), width, height
+
+
+class ImageVariantManifestStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage + biến thể ảnh theo chiều rộng khi collectstatic"""
+
+    variants_manifest_name = 'staticfiles-images.json'
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            self.image_variants = {}
+            for name in sorted(paths):
+                widths = self.variant_widths.get(name)
+                if not widths:
+                    continue
+                storage, path = paths[name]
+                for variant in self.create_variants(name, storage, path, widths):
+                    paths[variant] = (self, variant)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        if not dry_run:
+            self.save_variants_manifest()
+            self.compress_files(sorted(set(self.hashed_files.values())))
+
+    @cached_property
+    def variant_widths(self):
+        return {
+            name: sorted(set(widths))
+            for name, widths in getattr(settings, 'STATIC_IMAGE_VARIANTS', {}).items()
+        }
+
+    @cached_property
+    def variant_formats(self):
+        return supported_formats(getattr(settings, 'STATIC_IMAGE_FORMATS', ('avif', 'webp')))
+
+    def create_variants(self, name, storage, path, widths):
+        """Ghi các biến thể của một ảnh vào STATIC_ROOT, trả về danh sách tên file"""
+        from PIL import Image
+
+        with storage.open(path) as source:
+            image = Image.open(source)
+            image.load()
+
+        original = source_format(name)
+        # Không phóng to: chiều rộng lớn hơn ảnh gốc được thay bằng chiều rộng gốc
+        targets = sorted({min(width, image.width) for width in widths})
+        entry = {'width': image.width, 'height': image.height, 'format': original, 'sources': {}}
+        created = []
+        for fmt in [*self.variant_formats, original]:
+            sources = entry['sources'].setdefault(fmt, [])
+            for width in targets:
+                target = variant_name(name, width, fmt)
+                content, width, height = resize_image(image, width, fmt)
+                if self.exists(target):
+                    self.delete(target)
+                self._save(target, ContentFile(content))
+                sources.append([width, height, target])
+                created.append(target)
+
+        self.image_variants[name] = entry
+        logger.info('Created %d image variants for %s', len(created), name)
+        return created
+
+    def compress_files(self, names):
+        """Ghi bản nén .gz/.br cạnh file text có hash để serve không phải nén lại"""
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with self.open(name) as original:
+                content = original.read()
+            for suffix, data in compressed_variants(content).items():
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
+
+    def save_variants_manifest(self):
+        contents = json.dumps({'images': self.image_variants}, indent=1, sort_keys=True).encode()
+        if self.manifest_storage.exists(self.variants_manifest_name):
+            self.manifest_storage.delete(self.variants_manifest_name)
+        self.manifest_storage._save(self.variants_manifest_name, ContentFile(contents))
+
+    def load_variants_manifest(self):
+        try:
+            with self.manifest_storage.open(self.variants_manifest_name) as manifest:
+                return json.loads(manifest.read().decode()).get('images', {})
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @cached_property
+    def image_variants(self):
+        return self.load_variants_manifest()
+
+    def stored_name(self, name):
+        # Chưa chạy collectstatic (test, benchmark) hoặc file không có trong
+        # manifest: dùng tên gốc thay vì làm hỏng cả trang bằng ValueError
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if name not in _missing_reported:
+                _missing_reported.add(name)
+                logger.warning('Static file %s is missing from the manifest', name)
+            return name
+
+
+def serve(request, path):
+    """Phục vụ STATIC_ROOT khi không có web server phía trước (SERVE_STATIC=True)
+
+    File có hash trong tên không bao giờ đổi nội dung nên được cache một năm;
+    file không hash chỉ được cache ngắn. Bản nén sẵn (.br/.gz do collectstatic
+    tạo) được trả về khi trình duyệt chấp nhận.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    if path.startswith('..') or os.path.basename(path).startswith('staticfiles'):
+        raise Http404(path)
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    served = path
+    if path.endswith(COMPRESSIBLE_EXTENSIONS):
+        for suffix, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+            if encoding in accepted and os.path.isfile(os.path.join(settings.STATIC_ROOT, path + suffix)):
+                served = path + suffix
+                break
+
+    # static_serve đặt Content-Type theo file gốc và Content-Encoding theo đuôi .br/.gz
+    response = static_serve(request, served, document_root=settings.STATIC_ROOT)
+    if path.endswith(COMPRESSIBLE_EXTENSIONS):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    if HASHED_NAME_RE.search(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = 'public, max-age=300'
+    return response
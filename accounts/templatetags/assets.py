@@ -0,0 +1,52 @@
+"""
+``{% bundle 'name.css' %}<style>...</style>{% endbundle %}`` - xem accounts/assets.py.
+
+Render ``<link>``/``<script src>`` tới bundle có hash nếu ``build_assets`` và
+``collectstatic`` đã chạy, ngược lại render khối inline bên trong như cũ.
+"""
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from ..assets import BundleError, bundle_kind, bundle_path
+
+register = template.Library()
+
+
+def bundle_url(name):
+    if settings.DEBUG:
+        return None
+    path = bundle_path(name)
+    if path not in getattr(staticfiles_storage, 'hashed_files', {}):
+        return None
+    return static(path)
+
+
+class BundleNode(template.Node):
+    def __init__(self, name, nodelist):
+        self.name = name
+        self.kind = bundle_kind(name)
+        self.nodelist = nodelist
+
+    def render(self, context):
+        url = bundle_url(self.name)
+        if url is None:
+            return self.nodelist.render(context)
+        if self.kind == 'css':
+            return format_html('<link rel="stylesheet" href="{}">', url)
+        return format_html('<script src="{}"></script>', url)
+
+
+@register.tag
+def bundle(parser, token):
+    bits = token.split_contents()
+    if len(bits) != 2 or bits[1][0] not in '\'"' or bits[1][0] != bits[1][-1]:
+        raise template.TemplateSyntaxError("Usage: {% bundle 'name.css' %}...{% endbundle %}")
+    nodelist = parser.parse(('endbundle',))
+    parser.delete_first_token()
+    try:
+        return BundleNode(bits[1][1:-1], nodelist)
+    except BundleError as e:
+        raise template.TemplateSyntaxError(str(e))
@@ -0,0 +1,98 @@
+"""
+Template tag cho ảnh có biến thể WebP/AVIF (xem accounts/storage.py).
+
+    {% load images %}
+    {% picture 'images/logo_rehearten.png' alt='ReHearten' class='hero-logo' sizes='200px' %}
+    <img src="{% image_url 'images/logo_rehearten.png' 88 %}">
+    background-image: {% image_set 'images/background.jpg' 1920 %};
+
+Khi DEBUG hoặc chưa chạy ``collectstatic`` không có biến thể nào: tag trả về
+``<img>`` / URL của file gốc giống ``{% static %}``.
+"""
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..storage import MIME_TYPES
+
+register = template.Library()
+
+
+def image_entry(name):
+    """Thông tin biến thể của ảnh trong staticfiles-images.json, None nếu không có"""
+    if settings.DEBUG:
+        return None
+    return getattr(staticfiles_storage, 'image_variants', {}).get(name)
+
+
+def srcset(sources):
+    return ', '.join(f'{static(path)} {width}w' for width, height, path in sources)
+
+
+def pick_source(sources, width):
+    """Biến thể nhỏ nhất có chiều rộng >= width (hoặc lớn nhất nếu không có)"""
+    for source in sources:
+        if source[0] >= width:
+            return source
+    return sources[-1]
+
+
+@register.simple_tag
+def picture(name, alt='', sizes='100vw', **attrs):
+    """<picture> với <source> AVIF/WebP và <img> định dạng gốc kèm srcset"""
+    entry = image_entry(name)
+    attrs = {key.replace('_', '-'): value for key, value in attrs.items()}
+    attrs.setdefault('decoding', 'async')
+    if entry is None:
+        return format_html('<img src="{}" alt="{}"{}>', static(name), alt, _attributes(attrs))
+
+    fallback = entry['sources'][entry['format']]
+    largest = fallback[-1]
+    attrs.setdefault('width', largest[0])
+    attrs.setdefault('height', largest[1])
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[fmt], srcset(entry['sources'][fmt]), sizes)
+            for fmt in entry['sources'] if fmt != entry['format']
+        ),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}"{}></picture>',
+        sources, static(largest[2]), srcset(fallback), sizes, alt, _attributes(attrs),
+    )
+
+
+@register.simple_tag
+def image_url(name, width=None, fmt=None):
+    """URL của biến thể nhỏ nhất đủ rộng ``width`` px (định dạng gốc nếu không chỉ rõ)"""
+    entry = image_entry(name)
+    if entry is None:
+        return static(name)
+    sources = entry['sources'].get(fmt or entry['format']) or entry['sources'][entry['format']]
+    source = pick_source(sources, int(width)) if width else sources[-1]
+    return static(source[2])
+
+
+@register.simple_tag
+def image_set(name, width=None):
+    """Giá trị CSS image-set() cho background; url() thường khi không có biến thể"""
+    entry = image_entry(name)
+    if entry is None:
+        return format_html("url('{}')", static(name))
+
+    candidates = []
+    for fmt in [*(fmt for fmt in entry['sources'] if fmt != entry['format']), entry['format']]:
+        sources = entry['sources'][fmt]
+        source = pick_source(sources, int(width)) if width else sources[-1]
+        candidates.append((static(source[2]), MIME_TYPES[fmt]))
+    return format_html(
+        'image-set({})',
+        format_html_join(', ', "url('{}') type('{}')", candidates),
+    )
+
+
+def _attributes(attrs):
+    return format_html_join('', ' {}="{}"', attrs.items())
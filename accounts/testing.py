@@ -0,0 +1,92 @@
+"""
+Ngân sách truy vấn MongoDB cho từng URL và công cụ đếm lệnh dùng trong test.
+
+    with count_queries() as stats:
+        client.get('/dashboard/')
+    assert_within_budget('dashboard', stats)
+
+Lệnh được đếm qua ``MongoCommandListener`` nên cần một server MongoDB thật
+(mongomock không phát sự kiện command monitoring).
+"""
+from contextlib import contextmanager
+
+from .monitoring import QueryStats, start_request, end_request
+
+
+# Số lệnh đọc / ghi tối đa cho mỗi URL name trong accounts/urls.py.
+# Session (accounts/sessions.py) tốn tối đa 1 read khi L1 trượt và 1 write
+# (last_activity, thưa hơn); get_current_user tốn 1 read (User) mỗi lần gọi và
+# các view có decorator gọi nó hai lần. Khi tối ưu một view,
+# hạ ngân sách của nó xuống để giữ mức mới.
+QUERY_BUDGETS = {
+    'home': {'reads': 6, 'writes': 1},  # admin: + đếm users và sessions
+    'register': {'reads': 0, 'writes': 0},  # GET, chưa đăng nhập
+    'login': {'reads': 1, 'writes': 3},  # POST: User, last_login (2 lần), UserSession
+    'logout': {'reads': 1, 'writes': 1},
+    'dashboard': {'reads': 5, 'writes': 1},  # user thường: số liệu admin tính lười, không đếm
+    'admin_dashboard': {'reads': 14, 'writes': 1},
+    'profile': {'reads': 3, 'writes': 1},
+    'change_password': {'reads': 3, 'writes': 1},
+    'users_management': {'reads': 8, 'writes': 1},
+    'edit_user': {'reads': 4, 'writes': 1},
+    'audit_log': {'reads': 4, 'writes': 1},
+    'api_user_list': {'reads': 4, 'writes': 1},
+    'api_user_changes': {'reads': 4, 'writes': 1},  # + users và tombstones sau token
+    'api_change_user_role': {'reads': 4, 'writes': 4},  # + session: ghim đọc primary, + sự kiện SSE (admin_events)
+    'api_toggle_user_status': {'reads': 4, 'writes': 4},
+    'api_change_password': {'reads': 3, 'writes': 1},  # mật khẩu hiện tại sai -> 400
+    'api_profile': {'reads': 3, 'writes': 2},
+    'api_get_profile': {'reads': 3, 'writes': 1},
+    'api_events': {'reads': 2, 'writes': 1},  # WSGI: 204 sau khi kiểm tra quyền admin
+    'api_system_status': {'reads': 2, 'writes': 0},  # session, role (khi cache hết hạn); số liệu trong bộ nhớ
+    'api_test_mongodb': {'reads': 2, 'writes': 0},  # session, role; ping chạy trên thread nền
+    'metrics': {'reads': 2, 'writes': 0},
+    'api_profile_list': {'reads': 2, 'writes': 1},
+    'profile_detail': {'reads': 2, 'writes': 1},
+}
+
+
+@contextmanager
+def count_queries():
+    """Đếm mọi lệnh MongoDB chạy trong khối ``with`` (kể cả qua middleware)"""
+    stats = QueryStats(keep_commands=True)
+    token = start_request(stats)
+    try:
+        yield stats
+    finally:
+        end_request(token)
+
+
+def describe_command(record):
+    """``find users {'username': 'an'}`` - one line per offending command"""
+    command = record.command
+    details = command.get('filter') or command.get('q') or command.get('query')
+    if details is None and record.name == 'update':
+        details = [update.get('q') for update in command.get('updates', [])]
+    if details is None and record.name == 'delete':
+        details = [delete.get('q') for delete in command.get('deletes', [])]
+    return f'{record.name} {record.collection} {details!r}' if details is not None else f'{record.name} {record.collection}'
+
+
+def budget_violations(url_name, stats, budgets=None):
+    """Thông báo lỗi cho từng loại lệnh vượt ngân sách (rỗng nếu đạt)"""
+    budgets = QUERY_BUDGETS if budgets is None else budgets
+    if url_name not in budgets:
+        return [f'No query budget declared for URL {url_name!r}']
+
+    budget = budgets[url_name]
+    violations = []
+    for kind, used in (('reads', stats.reads), ('writes', stats.writes)):
+        allowed = budget.get(kind, 0)
+        if used <= allowed:
+            continue
+        commands = [record for record in stats.commands if record.kind == kind[:-1]]
+        lines = '\n'.join(f'    {describe_command(record)}' for record in commands)
+        violations.append(f'{url_name}: {used} {kind} > budget {allowed}\n{lines}')
+    return violations
+
+
+def assert_within_budget(url_name, stats, budgets=None):
+    violations = budget_violations(url_name, stats, budgets)
+    if violations:
+        raise AssertionError('MongoDB query budget exceeded:\n' + '\n'.join(violations))
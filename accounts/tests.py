@@ -1,3 +1,1097 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from bson import Int64, ObjectId, Timestamp
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, override_settings
+from pymongo import MongoClient, ReadPreference
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError
+
+from . import async_views, audit, changes, routing, urls, views
+from .audit import AuditBuffer
+from .events import EventBroadcaster
+from .fragments import users_invalidated
+from .health import DatabaseHealth
+from .middleware import AnonymousPageCacheMiddleware
+from .invalidation import ChangeStreamWatcher, Invalidation, InvalidationBus, VersionPoller
+from .process_login_gg import GoogleUserCache, SyncCustomSessionMiddleware, upsert_google_user
+from .sessions import SessionStore, session_cache
+from .shmcache import SharedMemoryCache
+from .models import AuditLog, User, UserSession
+from .utils import UserRoleCache, create_user_session, session_is_admin
+from .metrics import BUCKETS_MS, Metrics, percentile
+from .profiling import Profile, ProfileStore
+from .log import JsonFormatter, NonBlockingQueueHandler, RequestIdFilter, reset_request_id, set_request_id
+from .storage import variant_name
+from .templatetags import images
+from .management.commands.seed_users import DatasetGenerator
+from .assets import compressed_variants, minify_css, minify_js
+from .pool import PoolMetricsListener, pool_options
+from .query_plans import shape_of, summarize_plan
+from .monitoring import CommandRecord, QueryStats, command_listener, current_stats, end_request, start_request
+from .testing import QUERY_BUDGETS, assert_within_budget, budget_violations, count_queries
+
+
+TEST_PASSWORD = 'Budget@Test2024'
+
+# Không bao giờ chạy test ghi dữ liệu trên Atlas
+needs_test_db = unittest.skipIf(
+    getattr(settings, 'MONGODB_TARGET', 'atlas') == 'atlas',
+    'Needs MONGODB_TARGET=mock or local',
+)
+needs_local_mongod = unittest.skipUnless(
+    getattr(settings, 'MONGODB_TARGET', 'atlas') == 'local',
+    'Needs a real mongod: MONGODB_TARGET=local MONGODB_LOCAL_DB=ReHearten_test',
+)
+
+
+def _record(name, collection, command):
+    return CommandRecord(name, 'test', collection, command, 1.0, 0, 0)
+
+
+class QueryPlanTests(SimpleTestCase):
+    """Shape của lệnh và tóm tắt explain (accounts/query_plans.py)"""
+
+    def test_shape_ignores_values(self):
+        first = shape_of('find', {'find': 'users', 'filter': {'username': 'a', 'age': {'$gt': 3}}, 'sort': {'x': -1}})
+        second = shape_of('find', {'find': 'users', 'filter': {'username': 'b', 'age': {'$gt': 9}}, 'sort': {'x': -1}})
+        self.assertEqual(first, second)
+        self.assertIn('"sort": {"x": -1}', first)
+        self.assertNotEqual(first, shape_of('find', {'find': 'users', 'filter': {'email': 'a'}}))
+        self.assertEqual(shape_of('delete', {'delete': 'users', 'deletes': [{'q': {'_id': 1}, 'limit': 1}]}),
+                         'delete users {"q": {"_id": "?"}}')
+
+    def test_summarize_plan(self):
+        ixscan = {
+            'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'username_1'}}},
+            'executionStats': {'totalDocsExamined': 1, 'totalKeysExamined': 1, 'nReturned': 1},
+        }
+        summary = summarize_plan(ixscan)
+        self.assertEqual((summary['plan'], summary['indexes'], summary['in_memory_sort']), ('IXSCAN', ['username_1'], False))
+
+        collscan = {'stages': [{'$cursor': {'queryPlanner': {
+            'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}}}}]}
+        summary = summarize_plan(collscan)
+        self.assertEqual((summary['plan'], summary['in_memory_sort']), ('COLLSCAN', True))
+        self.assertEqual(summarize_plan({})['plan'], 'UNKNOWN')
+
+
+@needs_test_db
+class CheckIndexesTests(SimpleTestCase):
+    """manage.py check_indexes thoát với lỗi khi truy vấn nóng không dùng index"""
+
+    def run_command(self, stage):
+        explain = {'queryPlanner': {'winningPlan': {'stage': stage}}}
+        with unittest.mock.patch('accounts.management.commands.check_indexes.explain_command', return_value=explain):
+            call_command('check_indexes', '--hot-only', stdout=io.StringIO())
+
+    def test_collscan_on_hot_shape_fails(self):
+        with self.assertRaisesMessage(CommandError, 'Truy vấn nóng chưa có index'):
+            self.run_command('COLLSCAN')
+        self.run_command('IXSCAN')
+
+    def test_explain_error_fails(self):
+        with unittest.mock.patch('accounts.management.commands.check_indexes.explain_command',
+                                 side_effect=RuntimeError('not authorized')):
+            with self.assertRaisesMessage(CommandError, 'Không explain được'):
+                call_command('check_indexes', '--hot-only', stdout=io.StringIO())
+
+
+class PoolSizingTests(SimpleTestCase):
+    """Kích thước pool theo số thread / worker (accounts/pool.py)"""
+
+    def test_pool_options(self):
+        self.assertEqual(pool_options(threads=8)['maxPoolSize'], 10)  # + 2 thread nền
+        self.assertEqual(pool_options(threads=8)['minPoolSize'], 2)
+        # 4 worker chia 20 connection: mỗi worker tối đa 5 dù có 8 thread
+        self.assertEqual(pool_options(threads=8, workers=4, max_total_connections=20)['maxPoolSize'], 5)
+        self.assertEqual(pool_options(threads=8, max_pool_size=3)['maxPoolSize'], 3)
+        self.assertNotIn('waitQueueTimeoutMS', pool_options())
+        self.assertEqual(pool_options(wait_queue_timeout_ms=500)['waitQueueTimeoutMS'], 500)
+
+    def test_listener_counts_checkouts(self):
+        listener = PoolMetricsListener(warn_wait_ms=10)
+        waits = []
+        listener.add_wait_observer(waits.append)
+        with self.assertLogs('accounts.pool', 'WARNING'):
+            for duration in (0.001, 0.02):
+                listener.connection_checked_out(SimpleNamespace(duration=duration, address=('db', 27017)))
+        listener.connection_checked_in(None)
+        stats = listener.stats.snapshot()
+        self.assertEqual((stats['checkouts'], stats['in_use'], stats['slow_checkouts']), (2, 1, 1))
+        self.assertEqual([round(wait) for wait in waits], [1, 20])
+
+
+@unittest.skipUnless(os.name == 'posix', 'Metrics files are memory-mapped')
+class MetricsTests(SimpleTestCase):
+    """File số liệu của từng process được cộng dồn khi đọc (accounts/metrics.py)"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def test_percentile_interpolates_within_bucket(self):
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        counts[BUCKETS_MS.index(5)] = 10  # 2-5 ms
+        self.assertEqual(percentile(counts, 50), 3.5)
+        self.assertEqual(percentile(counts, 100), 5)
+        self.assertEqual(percentile([0] * len(counts), 99), 0.0)
+        counts[-1] = 10  # trên bucket cuối
+        self.assertEqual(percentile(counts, 99), BUCKETS_MS[-1])
+
+    def test_merges_worker_files_and_removes_dead_ones(self):
+        worker = Metrics(self.directory)
+        for duration in (1, 3, 30):
+            worker.record_request('home', duration)
+        worker.record_cache('pages', True)
+        own = os.path.join(self.directory, f'metrics_{os.getpid()}.db')
+        # Worker khác còn sống (process cha) và một worker đã chết, cùng layout
+        shutil.copy(own, os.path.join(self.directory, f'metrics_{os.getppid()}.db'))
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        shutil.copy(own, os.path.join(self.directory, f'metrics_{finished.pid}.db'))
+
+        snapshot = Metrics(self.directory).snapshot()
+        self.assertEqual(snapshot['workers'], 3)
+        self.assertEqual(snapshot['views']['home']['count'], 9)
+        self.assertEqual(snapshot['caches']['pages'], {'hits': 3, 'misses': 0, 'hit_rate': 1.0})
+
+        worker.cleanup_dead_workers()
+        self.assertEqual(Metrics(self.directory).snapshot()['workers'], 2)
+
+
+class ProfileStoreTests(SimpleTestCase):
+    """Profiler giữ N profile chậm nhất (accounts/profiling.py)"""
+
+    def test_keeps_slowest_profiles(self):
+        store = ProfileStore(max_profiles=3)
+        profiles = {}
+        for duration in (5, 50, 1, 20, 80, 10):
+            profile = Profile('GET', f'/p{duration}/')
+            profile.duration_ms = duration
+            profiles[duration] = profile
+            store.add(profile)
+        self.assertEqual([profile.duration_ms for profile in store.all()], [80, 50, 20])
+        self.assertIs(store.get(profiles[50].id), profiles[50])
+        self.assertIsNone(store.get(profiles[1].id))
+
+    def test_collapsed_stacks(self):
+        profile = Profile('GET', '/', max_stacks=2)
+        for stack in (('main', 'view'), ('main', 'view'), ('main', 'render'), ('main', 'other')):
+            profile.add_sample(stack)
+        self.assertEqual(profile.samples, 4)
+        self.assertEqual(profile.collapsed().splitlines()[0], 'main;view 2')
+        self.assertEqual(profile.stacks[('<truncated>',)], 1)
+
+
+class JsonLoggingTests(SimpleTestCase):
+    """Record JSON một dòng mang request id của context (accounts/log.py)"""
+
+    def record(self, message, *args, **extra):
+        record = logging.LogRecord('accounts.test', logging.INFO, __file__, 1, message, args, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_formats_request_id_and_extra(self):
+        token = set_request_id('req-1')
+        try:
+            record = self.record('user %s', 'an', mongo_commands=3)
+            self.assertTrue(RequestIdFilter().filter(record))
+        finally:
+            reset_request_id(token)
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual((entry['message'], entry['request_id'], entry['mongo_commands']), ('user an', 'req-1', 3))
+        self.assertEqual((entry['level'], entry['logger']), ('INFO', 'accounts.test'))
+        self.assertNotIn('args', entry)
+
+    def test_queue_handler_drops_instead_of_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        dropped = NonBlockingQueueHandler.dropped
+        handler.handle(self.record('first'))
+        handler.handle(self.record('second'))
+        self.assertEqual(NonBlockingQueueHandler.dropped - dropped, 1)
+
+
+class ImageVariantTests(SimpleTestCase):
+    """Tên biến thể ảnh và thẻ {% picture %} (accounts/storage.py, templatetags/images.py)"""
+
+    entry = {
+        'format': 'png',
+        'sources': {
+            'avif': [(96, 48, 'images/logo.w96.avif'), (192, 96, 'images/logo.w192.avif')],
+            'png': [(96, 48, 'images/logo.w96.png'), (192, 96, 'images/logo.w192.png')],
+        },
+    }
+
+    def test_variant_name(self):
+        self.assertEqual(variant_name('images/logo.png', 96, 'webp'), 'images/logo.w96.webp')
+        self.assertEqual(variant_name('images/photo.jpeg', 640, 'jpeg'), 'images/photo.w640.jpg')
+
+    @override_settings(DEBUG=True)
+    def test_picture_falls_back_to_plain_img(self):
+        html = images.picture('images/logo.png', alt='Logo', **{'class': 'hero', 'data_role': 'logo'})
+        self.assertEqual(html, '<img src="/static/images/logo.png" alt="Logo" class="hero" data-role="logo" decoding="async">')
+
+    def test_picture_with_variants(self):
+        with unittest.mock.patch.object(images, 'image_entry', return_value=self.entry), \
+                unittest.mock.patch.object(images, 'static', lambda path: f'/static/{path}'):
+            html = images.picture('images/logo.png', alt='Logo', sizes='96px')
+            url = images.image_url('images/logo.png', 100, 'avif')
+        self.assertTrue(html.startswith('<picture><source type="image/avif" srcset="/static/images/logo.w96.avif 96w'))
+        self.assertIn('<img src="/static/images/logo.w192.png"', html)
+        self.assertIn('width="192" height="96"', html)
+        self.assertEqual(url, '/static/images/logo.w192.avif')
+
+
+class AssetBundleTests(SimpleTestCase):
+    """Minify dự phòng (không có rcssmin/rjsmin) và file nén sẵn (accounts/assets.py)"""
+
+    def test_minify_css_fallback(self):
+        source = '/* header */\n.a  >  .b {\n  color: red ;\n  content: "a  /* b */";\n}\n'
+        with unittest.mock.patch.dict(sys.modules, {'rcssmin': None}):
+            self.assertEqual(minify_css(source), '.a>.b{color:red;content:"a  /* b */"}\n')
+
+    def test_minify_js_fallback_keeps_lines_and_template_literals(self):
+        source = '// top\nconst a = 1;  \n\n/* multi\n   line */\nconst t = `x\n  // kept\n`;\nfoo(a, t);\n'
+        with unittest.mock.patch.dict(sys.modules, {'rjsmin': None}):
+            self.assertEqual(minify_js(source), 'const a = 1;\nconst t = `x\n  // kept\n`;\nfoo(a, t);\n')
+
+    def test_compressed_variants(self):
+        self.assertEqual(compressed_variants(b'body{}'), {})  # dưới MIN_COMPRESS_SIZE
+        content = b'.item { color: red; }\n' * 100
+        variants = compressed_variants(content)
+        self.assertEqual(gzip.decompress(variants['.gz']), content)
+        self.assertEqual(variants['.gz'], compressed_variants(content)['.gz'])  # mtime=0: build lặp lại giống hệt
+        self.assertEqual(compressed_variants(os.urandom(4096)), {})  # nén không đáng
+
+
+class SeedDatasetTests(SimpleTestCase):
+    """seed_users sinh cùng người dùng cho cùng (seed, index), kể cả khi dùng --start"""
+
+    def generator(self):
+        return DatasetGenerator(seed=7, reference=datetime(2026, 1, 1), days=365, prefix='seed_',
+                                password_hash='x', admin_ratio=0.01, sessions_per_user=1.0)
+
+    def test_user_depends_only_on_seed_and_index(self):
+        full = self.generator()
+        expected = [full.user(index) for index in range(5)][3:]
+        resumed = self.generator()
+        self.assertEqual([resumed.user(index) for index in (3, 4)], expected)
+        self.assertNotEqual(expected[0][0]['username'], expected[1][0]['username'])
+
+
+class FragmentInvalidationTests(SimpleTestCase):
+    """users_invalidated chỉ bỏ qua sự kiện poll (không rõ trường) khi cache dùng chung"""
+
+    def bumps(self, shared, invalidation):
+        with unittest.mock.patch('accounts.fragments.shared_cache', return_value=shared), \
+                unittest.mock.patch('accounts.fragments.bump_data_version') as bump:
+            users_invalidated(invalidation)
+        return bump.call_count
+
+    def test_shared_cache_skips_only_unknown_fields(self):
+        key = ObjectId()
+        self.assertEqual(self.bumps(True, Invalidation('users', key, source='poll')), 0)
+        self.assertEqual(self.bumps(True, Invalidation('users', key, {'role'}, 'changestream')), 1)
+        self.assertEqual(self.bumps(True, Invalidation('users', key, {'last_login'}, 'changestream')), 0)
+        self.assertEqual(self.bumps(True, Invalidation('users', source='poll')), 1)  # flush
+        self.assertEqual(self.bumps(False, Invalidation('users', key, source='poll')), 1)
+
+
+class FakeAuditCollection:
+    """insert_many ghi lại từng lô; ``failures`` là các lỗi lần lượt ném ra"""
+
+    def __init__(self, *failures):
+        self.batches = []
+        self.failures = list(failures)
+
+    def insert_many(self, documents, ordered=True):
+        if self.failures:
+            error = self.failures.pop(0)
+            if error is not None:
+                raise error
+        self.batches.append([document['n'] for document in documents])
+
+
+class AuditBufferTests(SimpleTestCase):
+    """Bộ đệm nhật ký: ghi theo lô, giữ lại bản ghi khi MongoDB lỗi"""
+
+    def buffer(self, collection, count, batch_size=2):
+        buffer = AuditBuffer(batch_size=batch_size, flush_interval=3600)
+        with unittest.mock.patch.object(AuditBuffer, '_ensure_worker'):
+            for n in range(count):
+                buffer.add({'n': n})
+        patcher = unittest.mock.patch.object(AuditLog, '_get_collection', return_value=collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return buffer
+
+    def test_flush_writes_in_batches(self):
+        collection = FakeAuditCollection()
+        buffer = self.buffer(collection, 5)
+        self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(collection.batches, [[0, 1], [2, 3], [4]])
+        self.assertEqual((buffer.written, buffer.flush()), (5, 0))
+
+    def test_transient_error_keeps_batch_for_retry(self):
+        collection = FakeAuditCollection(None, AutoReconnect('primary stepped down'))
+        buffer = self.buffer(collection, 5)
+        with self.assertRaises(AutoReconnect):
+            buffer.flush()
+        self.assertEqual(buffer.written, 2)  # lô đầu đã ghi vẫn được đếm
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(collection.batches, [[0, 1], [2, 3], [4]])
+
+    def test_bulk_write_error_retries_only_non_duplicates(self):
+        error = BulkWriteError({'nInserted': 1, 'writeErrors': [
+            {'index': 0, 'code': 11000, 'errmsg': 'duplicate key'},
+            {'index': 2, 'code': 50, 'errmsg': 'operation exceeded time limit'},
+        ]})
+        collection = FakeAuditCollection(error)
+        buffer = self.buffer(collection, 4, batch_size=3)
+        with self.assertLogs('accounts.audit', 'WARNING'):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(buffer._records), [{'n': 2}, {'n': 3}])
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual((collection.batches, buffer.written), ([[2, 3]], 3))
+
+    def test_exit_flush_registered_once(self):
+        buffer = AuditBuffer(flush_interval=3600)
+        with unittest.mock.patch('accounts.audit.atexit.register') as register:
+            buffer._ensure_worker()
+            first = buffer._thread
+            buffer._thread = threading.Thread(target=lambda: None)  # worker chết (ví dụ sau fork)
+            buffer._ensure_worker()
+        self.assertIsNot(buffer._thread, first)
+        self.assertTrue(buffer._thread.is_alive())
+        register.assert_called_once_with(buffer.flush)
+
+
+@needs_test_db
+class AuditQueryTests(SimpleTestCase):
+    """Phân trang nhật ký theo (created_at, _id)"""
+
+    def tearDown(self):
+        AuditLog.objects(actor='aq_admin').delete()
+        super().tearDown()
+
+    def test_pages_keep_entries_sharing_a_timestamp(self):
+        created_at = datetime(2026, 1, 1, 12, 0)
+        AuditLog.objects.insert([
+            AuditLog(actor='aq_admin', action='user_update', target=f'aq_{n}',
+                     created_at=created_at if n < 3 else created_at - timedelta(seconds=1))
+            for n in range(5)
+        ])
+        seen = []
+        before = before_id = None
+        while True:
+            page = audit.query(actor='aq_admin', before=before, before_id=before_id, limit=2)
+            seen += [entry.target for entry in page]
+            if len(page) < 2:
+                break
+            before, before_id = page[-1].created_at, page[-1].id
+        self.assertEqual(sorted(seen), [f'aq_{n}' for n in range(5)])
+        self.assertEqual(len(audit.query(actor='aq_admin', before=created_at)), 2)
+
+
+class QueryBudgetDeclarationTests(SimpleTestCase):
+    """Chạy không cần MongoDB"""
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns if pattern.name}
+        self.assertEqual(sorted(names - set(QUERY_BUDGETS)), [])
+        self.assertEqual(sorted(set(QUERY_BUDGETS) - names), [])
+
+    def test_violation_lists_offending_commands(self):
+        stats = QueryStats(keep_commands=True)
+        stats.add(_record('find', 'users', {'find': 'users', 'filter': {'username': 'an'}}))
+        stats.add(_record('find', 'user_sessions', {'find': 'user_sessions', 'filter': {'user': 'an'}}))
+        stats.add(_record('update', 'user_sessions', {'update': 'user_sessions', 'updates': [{'q': {'_id': 1}}]}))
+
+        violations = budget_violations('x', stats, {'x': {'reads': 1, 'writes': 1}})
+        self.assertEqual(len(violations), 1)
+        self.assertIn('2 reads > budget 1', violations[0])
+        self.assertIn("find users {'username': 'an'}", violations[0])
+        self.assertIn("find user_sessions {'user': 'an'}", violations[0])
+        with self.assertRaises(AssertionError):
+            assert_within_budget('x', stats, {'x': {'reads': 1, 'writes': 1}})
+        assert_within_budget('x', stats, {'x': {'reads': 2, 'writes': 1}})
+
+    def test_nested_stats_forward_to_outer_counter(self):
+        with count_queries() as outer:
+            inner = QueryStats()
+            token = start_request(inner)
+            try:
+                current_stats().add(_record('insert', 'audit_log', {'insert': 'audit_log'}))
+            finally:
+                end_request(token)
+        self.assertEqual((inner.writes, outer.writes), (1, 1))
+
+    def test_bytes_measured_only_on_request(self):
+        def run(stats):
+            event = SimpleNamespace(connection_id=1, request_id=1, database_name='test', command_name='find',
+                                    command={'find': 'users', 'filter': {}}, duration_micros=1000,
+                                    reply={'ok': 1, 'cursor': {'firstBatch': []}})
+            token = start_request(stats)
+            try:
+                command_listener.started(event)
+                command_listener.succeeded(event)
+            finally:
+                end_request(token)
+            return stats
+
+        plain = run(QueryStats())
+        self.assertEqual((plain.count, plain.request_bytes, plain.reply_bytes), (1, 0, 0))
+        self.assertNotIn('reply_bytes', plain.as_dict())
+        measured = run(QueryStats(measure_bytes=True))
+        self.assertGreater(measured.request_bytes, 0)
+        self.assertGreater(measured.reply_bytes, 0)
+
+
+class EventBroadcasterTests(SimpleTestCase):
+    """Hàng đợi SSE giới hạn: client chậm bị ngắt, worker đầy từ chối client mới"""
+
+    def test_slow_client_is_evicted(self):
+        async def scenario():
+            broadcaster = EventBroadcaster(queue_size=2, poll_interval=3600)
+            slow = broadcaster.subscribe()
+            for number in range(3):
+                broadcaster.publish('role_changed', {'n': number})
+            await asyncio.sleep(0)
+            return broadcaster.stats(), slow.closed, await slow.next_message(0.1)
+
+        stats, closed, message = asyncio.run(scenario())
+        self.assertEqual((stats['clients'], stats['evicted_slow'], closed), (0, 1, True))
+        self.assertIsNotNone(message)
+        self.assertNotIn('role_changed', str(message))
+
+    def test_rejects_clients_over_limit(self):
+        async def scenario():
+            broadcaster = EventBroadcaster(max_clients=1, poll_interval=3600)
+            return broadcaster.subscribe(), broadcaster.subscribe(), broadcaster.stats()
+
+        first, second, stats = asyncio.run(scenario())
+        self.assertIsNotNone(first)
+        self.assertIsNone(second)
+        self.assertEqual(stats['rejected'], 1)
+
+
+@override_settings(DEBUG=False, ANON_PAGE_CACHE_TIMEOUT=60, ANON_PAGE_CACHE_PATHS=('/',), DEPLOY_VERSION='test')
+class AnonymousPageCacheTests(SimpleTestCase):
+    """Cache toàn trang chỉ phục vụ khách không có trạng thái riêng"""
+
+    def setUp(self):
+        caches['pages'].clear()
+        self.calls = []
+        self.response = lambda: HttpResponse('home')
+        self.middleware = AnonymousPageCacheMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.calls.append(request)
+        return self.response()
+
+    def get(self, path='/', **cookies):
+        request = RequestFactory().get(path)
+        request.COOKIES.update(cookies)
+        return self.middleware(request)
+
+    def test_hit_skips_session_and_database(self):
+        self.assertEqual(self.get()['X-Page-Cache'], 'MISS')
+        with count_queries() as stats:
+            request = RequestFactory().get('/')
+            response = self.middleware(request)
+        self.assertEqual((response['X-Page-Cache'], response.content), ('HIT', b'home'))
+        self.assertEqual(len(self.calls), 1)  # SessionMiddleware và view nằm sau get_response
+        self.assertFalse(hasattr(request, 'session'))
+        self.assertEqual(stats.count, 0)
+
+    def test_personal_requests_bypass_cache(self):
+        self.get()
+        for kwargs in ({settings.SESSION_COOKIE_NAME: 'abc'}, {'messages': 'flash'}):
+            response = self.get(**kwargs)
+            self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertFalse(self.get('/?next=/dashboard/').has_header('X-Page-Cache'))
+        self.assertEqual(len(self.calls), 4)
+
+    def test_private_responses_not_stored(self):
+        def with_cookie():
+            response = HttpResponse('home')
+            response.set_cookie('csrftoken', 'x')
+            return response
+
+        def private():
+            response = HttpResponse('home')
+            response['Cache-Control'] = 'private'
+            return response
+
+        for factory in (with_cookie, private):
+            self.response = factory
+            self.assertEqual(self.get()['X-Page-Cache'], 'MISS')
+            self.assertEqual(self.get()['X-Page-Cache'], 'MISS')
+        self.assertEqual(len(self.calls), 4)
+
+
+@needs_local_mongod
+class QueryBudgetTests(SimpleTestCase):
+    """Mỗi URL name trong accounts/urls.py phải nằm trong ngân sách QUERY_BUDGETS"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User.objects(username__startswith='qb_').delete()
+        UserSession.objects(user__startswith='qb_').delete()
+        password = make_password(TEST_PASSWORD)
+        for username, role in (('qb_admin', 'admin'), ('qb_user', 'user'), ('qb_target', 'user')):
+            User(username=username, email=f'{username}@test.rehearten.local', first_name='Test',
+                 last_name='Budget', password=password, role=role).save()
+        cls.admin = cls.login('qb_admin')
+        cls.user = cls.login('qb_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        User.objects(username__startswith='qb_').delete()
+        UserSession.objects(user__startswith='qb_').delete()
+        super().tearDownClass()
+
+    @classmethod
+    def login(cls, username):
+        client = Client()
+        response = client.post('/login/', {'username': username, 'password': TEST_PASSWORD})
+        assert response.status_code == 302, f'login failed for {username}'
+        return client
+
+    def scenarios(self):
+        """(url_name, client, method, path, kwargs)"""
+        as_json = {'content_type': 'application/json'}
+        return [
+            ('home', self.admin, 'get', '/', {}),
+            ('register', Client(), 'get', '/register/', {}),
+            ('login', Client(), 'post', '/login/', {'data': {'username': 'qb_user', 'password': TEST_PASSWORD}}),
+            ('logout', self.login('qb_user'), 'get', '/logout/', {}),
+            ('dashboard', self.user, 'get', '/dashboard/', {}),
+            ('admin_dashboard', self.admin, 'get', '/admin-dashboard/', {}),
+            ('profile', self.user, 'get', '/profile/', {}),
+            ('change_password', self.user, 'get', '/change-password/', {}),
+            ('users_management', self.admin, 'get', '/users/', {}),
+            ('edit_user', self.admin, 'get', '/users/edit/qb_target/', {}),
+            ('audit_log', self.admin, 'get', '/audit-log/', {}),
+            ('api_user_list', self.admin, 'get', '/api/users/', {}),
+            ('api_user_changes', self.admin, 'get', '/api/users/changes/', {}),
+            ('api_change_user_role', self.admin, 'post', '/api/change-user-role/',
+             {'data': json.dumps({'username': 'qb_target', 'role': 'admin'}), **as_json}),
+            ('api_toggle_user_status', self.admin, 'post', '/api/toggle-user-status/',
+             {'data': json.dumps({'username': 'qb_target'}), **as_json}),
+            ('api_change_password', self.user, 'post', '/api/change-password/',
+             {'data': json.dumps({'current_password': 'wrong', 'new_password1': 'a', 'new_password2': 'b'}), **as_json}),
+            ('api_profile', self.user, 'patch', '/api/profile/',
+             {'data': json.dumps({'first_name': 'Lan'}), **as_json}),
+            ('api_get_profile', self.user, 'get', '/api/get-profile/', {}),
+            ('api_events', self.admin, 'get', '/api/events/', {}),
+            ('api_system_status', self.admin, 'get', '/api/system-status/', {}),
+            ('api_test_mongodb', self.admin, 'get', '/test/mongodb/', {}),
+            ('metrics', self.admin, 'get', '/metrics/', {}),
+            ('api_profile_list', self.admin, 'get', '/api/profiles/', {}),
+            ('profile_detail', self.admin, 'get', '/api/profiles/missing/', {}),
+        ]
+
+    def test_scenarios_cover_every_url(self):
+        self.assertEqual({scenario[0] for scenario in self.scenarios()}, set(QUERY_BUDGETS))
+
+    def test_urls_within_query_budget(self):
+        for url_name, client, method, path, kwargs in self.scenarios():
+            with self.subTest(url_name=url_name):
+                with count_queries() as stats:
+                    response = getattr(client, method)(path, **kwargs)
+                self.assertLess(response.status_code, 500)
+                assert_within_budget(url_name, stats)
+
+
+@needs_test_db
+class AsyncApiTests(SimpleTestCase):
+    """View async (ASYNC_VIEWS) trả cùng kết quả với bản đồng bộ"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User.objects(username__startswith='aa_').delete()
+        password = make_password(TEST_PASSWORD)
+        for username, role in (('aa_admin', 'admin'), ('aa_target', 'user')):
+            User(username=username, email=f'{username}@test.rehearten.local', first_name='Test',
+                 last_name='Async', password=password, role=role).save()
+
+    @classmethod
+    def tearDownClass(cls):
+        User.objects(username__startswith='aa_').delete()
+        UserSession.objects(user__startswith='aa_').delete()
+        super().tearDownClass()
+
+    def request(self, method, path, username=None, body=None):
+        request = getattr(RequestFactory(), method)(path, body, content_type='application/json')
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        if username:
+            create_user_session(request, User.objects.get(username=username))
+        return request
+
+    def test_decorated_views_stay_async(self):
+        for name in ('api_get_profile', 'api_user_list', 'api_profile_update',
+                     'api_change_user_role', 'api_toggle_user_status'):
+            self.assertTrue(iscoroutinefunction(getattr(async_views, name)), name)
+            self.assertTrue(getattr(async_views, name).csrf_exempt, name)
+
+    def test_same_response_as_sync_views(self):
+        for name in ('api_get_profile', 'api_user_list'):
+            with self.subTest(view=name):
+                sync_response = getattr(views, name)(self.request('get', '/', 'aa_admin'))
+                async_response = async_to_sync(getattr(async_views, name))(self.request('get', '/', 'aa_admin'))
+                self.assertEqual(async_response.status_code, sync_response.status_code)
+                self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+
+        response = async_to_sync(async_views.api_get_profile)(self.request('get', '/'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_role_change_updates_django_flags(self):
+        body = json.dumps({'username': 'aa_target', 'role': 'admin'})
+        response = async_to_sync(async_views.api_change_user_role)(self.request('post', '/', 'aa_admin', body))
+        self.assertEqual(response.status_code, 200)
+        target = User.objects.get(username='aa_target')
+        self.assertEqual((target.role, target.is_staff, target.is_superuser), ('admin', True, True))
+
+    def test_profile_update_validates_like_sync_view(self):
+        body = json.dumps({'first_name': 'x' * 31})
+        sync_response = views.api_profile_update(self.request('patch', '/', 'aa_target', body))
+        async_response = async_to_sync(async_views.api_profile_update)(self.request('patch', '/', 'aa_target', body))
+        self.assertEqual((async_response.status_code, sync_response.status_code), (400, 400))
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        self.assertIn('first_name', json.loads(async_response.content))
+        self.assertEqual(User.objects.get(username='aa_target').first_name, 'Test')
+
+    def test_profile_update_maps_duplicate_email(self):
+        # Email bị lấy giữa lúc kiểm tra và lúc ghi: unique index từ chối $set
+        body = json.dumps({'email': 'aa_taken@test.rehearten.local'})
+        with unittest.mock.patch('accounts.async_views.update_user',
+                                 side_effect=DuplicateKeyError('E11000 duplicate key error')):
+            response = async_to_sync(async_views.api_profile_update)(self.request('patch', '/', 'aa_target', body))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'email': ['Email này đã được sử dụng']})
+
+
+@needs_test_db
+@override_settings(USER_SYNC_LAG_SECONDS=0)
+class UserChangesTests(SimpleTestCase):
+    """/api/users/changes/: phân trang theo token, tombstone khi xóa"""
+
+    def tearDown(self):
+        User.objects(username__startswith='uc_').delete()
+        super().tearDown()
+
+    def sync_all(self, since, limit):
+        seen = []
+        while True:
+            page = changes.changes_page(since, limit)
+            seen += [(change['op'], change['user']['username']) for change in page['changes']]
+            since = page['next']
+            if not page['has_more']:
+                return seen, since
+
+    def test_pages_through_upserts_and_deletes(self):
+        start = changes.encode_token(datetime.now() - timedelta(milliseconds=1), '0' * 24)
+        for username in ('uc_a', 'uc_b', 'uc_c'):
+            User(username=username, email=f'{username}@test.rehearten.local', first_name='Test',
+                 last_name='Changes', password='x').save()
+        User.objects.get(username='uc_b').delete()
+
+        seen, token = self.sync_all(start, limit=1)
+        seen = [change for change in seen if change[1].startswith('uc_')]
+        self.assertEqual(seen, [('upsert', 'uc_a'), ('upsert', 'uc_c'), ('delete', 'uc_b')])
+        self.assertEqual(self.sync_all(token, limit=10)[0], [])
+
+    def test_same_timestamp_across_collections(self):
+        from .models import UserTombstone
+
+        moment = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+        start = changes.encode_token(moment - timedelta(milliseconds=1), '0' * 24)
+        # delete_users ghi cả lô tombstone cùng deleted_at, trùng mốc với một User
+        UserTombstone._get_collection().insert_many(
+            [{'user_id': ObjectId(), 'username': f'uc_gone_{n}', 'deleted_at': moment} for n in range(2)])
+        User._get_collection().insert_one({'username': 'uc_same', 'updated_at': moment})
+        try:
+            seen, _ = self.sync_all(start, limit=1)
+        finally:
+            UserTombstone.objects(username__startswith='uc_').delete()
+        seen = [change for change in seen if change[1].startswith(('uc_same', 'uc_gone_'))]
+        self.assertEqual(seen, [('upsert', 'uc_same'), ('delete', 'uc_gone_0'), ('delete', 'uc_gone_1')])
+
+    def test_bad_and_expired_tokens(self):
+        with self.assertRaises(changes.TokenError):
+            changes.changes_page('not-a-token', 10)
+        with self.assertRaises(changes.ResyncRequired):
+            changes.changes_page(changes.encode_token(datetime(2000, 1, 1), '0' * 24), 10)
+
+
+def _collect(bus, *collections):
+    received = []
+    for collection in collections:
+        bus.register(collection, received.append)
+    return received
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+@needs_test_db
+@override_settings(USER_SYNC_LAG_SECONDS=0)
+class VersionPollerTests(SimpleTestCase):
+    """Fallback không có change stream: đọc luồng thay đổi users và phiên bản user_sessions"""
+
+    def tearDown(self):
+        User.objects(username__startswith='ip_').delete()
+        UserSession.objects(user__startswith='ip_').delete()
+        super().tearDown()
+
+    def test_reports_changed_users_and_sessions(self):
+        bus = InvalidationBus()
+        received = _collect(bus, 'users', 'user_sessions')
+        poller = VersionPoller()
+        poller.poll_users(bus)
+        poller.poll_sessions(bus)
+        self.assertEqual(received, [])
+
+        user = User(username='ip_user', email='ip_user@test.rehearten.local', first_name='Test',
+                    last_name='Poll', password='x')
+        user.save()
+        UserSession(user='ip_user', session_key='ip_session').save()
+        poller.poll_users(bus)
+        poller.poll_sessions(bus)
+        self.assertEqual([(i.collection, i.key) for i in received], [('users', user.pk), ('user_sessions', None)])
+
+        received.clear()
+        user.delete()
+        poller.poll_users(bus)
+        self.assertEqual([(i.collection, i.key) for i in received], [('users', user.pk)])
+
+
+@needs_test_db
+class SessionEngineTests(SimpleTestCase):
+    """SESSION_ENGINE accounts.sessions: session đăng nhập là UserSession"""
+
+    def tearDown(self):
+        UserSession.objects(user__startswith='se_').delete()
+        super().tearDown()
+
+    def login(self):
+        session = SessionStore()
+        session.update({'username': 'se_user', 'is_authenticated': True, 'role': 'user'})
+        session.save()
+        return session
+
+    def test_round_trip_and_unchanged_saves(self):
+        session = self.login()
+        document = UserSession.objects.get(session_key=session.session_key)
+        self.assertEqual(document.user, 'se_user')
+
+        loaded = SessionStore(session.session_key)
+        self.assertEqual(loaded['role'], 'user')
+        entry = loaded.entry
+        loaded['role'] = 'user'  # gán lại cùng giá trị: SessionMiddleware vẫn gọi save
+        loaded.save()
+        self.assertIs(loaded.entry, entry)  # không ghi: entry chỉ được thay sau update_one
+
+        loaded['role'] = 'admin'
+        loaded.save()
+        session_cache.discard(session.session_key)
+        self.assertEqual(SessionStore(session.session_key)['role'], 'admin')
+
+        loaded.flush()
+        self.assertFalse(UserSession.objects(session_key=session.session_key))
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+
+    def test_l1_invalidated_when_session_deleted_elsewhere(self):
+        session = self.login()
+        self.assertIsNotNone(session_cache.get(session.session_key))
+        UserSession.objects(session_key=session.session_key).delete()
+        # L1 vẫn giữ tới khi bus báo thay đổi (worker khác đăng xuất)
+        self.assertEqual(SessionStore(session.session_key)['username'], 'se_user')
+        session_cache.invalidated(Invalidation('user_sessions', session.entry.id))
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+
+    def test_guest_sessions_stay_in_cache(self):
+        session = SessionStore()
+        session['cart'] = 1
+        session.save()
+        self.assertFalse(UserSession.objects(session_key=session.session_key))
+        self.assertEqual(SessionStore(session.session_key)['cart'], 1)
+
+
+@needs_test_db
+class GoogleSessionSyncTests(SimpleTestCase):
+    """Đăng nhập Google: upsert một lệnh, middleware không truy vấn lặp lại"""
+
+    def tearDown(self):
+        User.objects(email__startswith='gs_').delete()
+        UserSession.objects(user__startswith='gs_').delete()
+        super().tearDown()
+
+    def request(self, path, email):
+        request = RequestFactory().get(path)
+        request.session = SessionStore()
+        request.session[SESSION_KEY] = 'google-user'
+        request.user = type('GoogleUser', (), {'is_authenticated': True, 'email': email})()
+        return request
+
+    def test_upsert_creates_user_once(self):
+        first = upsert_google_user('gs_user@test.rehearten.local', 'gs_user', 'Google', 'User')
+        second = upsert_google_user('gs_user@test.rehearten.local', 'gs_user', 'Other', 'Name')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(User.objects(email='gs_user@test.rehearten.local').count(), 1)
+        self.assertEqual((second.first_name, second.role), ('Google', 'user'))
+        self.assertFalse(second.check_password('google_oauth2_default_password'))
+
+    def test_middleware_caches_email_lookups(self):
+        upsert_google_user('gs_sync@test.rehearten.local', 'gs_sync', 'Google', 'Sync')
+        users = GoogleUserCache()
+        middleware = SyncCustomSessionMiddleware(lambda request: None)
+        with unittest.mock.patch('accounts.process_login_gg.google_users', users):
+            request = self.request('/dashboard/', 'gs_sync@test.rehearten.local')
+            middleware(request)
+            self.assertEqual(request.session['username'], 'gs_sync')
+
+            static = self.request('/static/app.css', 'gs_sync@test.rehearten.local')
+            middleware(static)
+            self.assertNotIn('username', static.session)
+
+            for _ in range(3):
+                middleware(self.request('/', 'gs_missing@test.rehearten.local'))
+        self.assertEqual(users.stats(), {'entries': 1, 'missing': 1, 'hits': 2, 'misses': 2})
+
+
+@needs_test_db
+class SessionAdminTests(SimpleTestCase):
+    """Quyền admin của endpoint giám sát theo bản ghi User, không theo role trong session"""
+
+    def tearDown(self):
+        User.objects(username__startswith='sa_').delete()
+        super().tearDown()
+
+    def test_role_follows_user_record(self):
+        user = User(username='sa_admin', email='sa_admin@test.rehearten.local', first_name='Session',
+                    last_name='Admin', password=make_password(TEST_PASSWORD), role='admin')
+        user.save()
+        request = RequestFactory().get('/api/system-status/')
+        # Session tạo trước khi lưu role: không có khóa 'role'
+        request.session = {'is_authenticated': True, 'user_id': str(user.id), 'username': 'sa_admin'}
+        roles = UserRoleCache()
+        with unittest.mock.patch('accounts.utils.user_roles', roles):
+            self.assertTrue(session_is_admin(request))
+            self.assertTrue(session_is_admin(request))
+            self.assertEqual(roles.stats()['misses'], 1)
+
+            User.objects(id=user.id).update(set__role='user')
+            roles.invalidated(Invalidation('users', user.id))
+            self.assertFalse(session_is_admin(request))
+
+            User.objects(id=user.id).update(set__role='admin', set__is_active=False)
+            roles.invalidated(Invalidation('users', user.id))
+            self.assertFalse(session_is_admin(request))
+
+
+class UnreachableDatabaseTests(SimpleTestCase):
+    """MongoDB mất kết nối: endpoint giám sát dùng role trong session, không chờ 30 giây"""
+
+    def setUp(self):
+        # Không có gì lắng nghe ở cổng 1; serverSelectionTimeoutMS như cấu hình Atlas
+        self.client = MongoClient('mongodb://127.0.0.1:1/', serverSelectionTimeoutMS=30000, connect=False)
+        self.addCleanup(self.client.close)
+        collection = self.client.get_database('unreachable').get_collection('users')
+        patcher = unittest.mock.patch.object(User, '_get_collection', return_value=collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, role):
+        request = RequestFactory().get('/api/system-status/')
+        request.session = {'is_authenticated': True, 'user_id': str(ObjectId()), 'role': role}
+        return request
+
+    @override_settings(MONGO_REQUEST_LOOKUP_TIMEOUT_MS=200)
+    def test_role_lookup_is_bounded(self):
+        health = DatabaseHealth()
+        with unittest.mock.patch('accounts.utils.user_roles', UserRoleCache()), \
+                unittest.mock.patch('accounts.utils.database_health', health), \
+                self.assertLogs('accounts.utils', 'WARNING'):
+            started = time.monotonic()
+            self.assertTrue(session_is_admin(self.request('admin')))
+            self.assertFalse(session_is_admin(self.request('user')))
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_skips_lookup_while_health_reports_down(self):
+        health = DatabaseHealth()
+        health.ok, health._checked_monotonic = False, time.monotonic()
+        with unittest.mock.patch('accounts.utils.user_roles', UserRoleCache()), \
+                unittest.mock.patch('accounts.utils.database_health', health), \
+                unittest.mock.patch.object(User, '_get_collection') as get_collection:
+            self.assertTrue(session_is_admin(self.request('admin')))
+        get_collection.assert_not_called()
+
+    @override_settings(MONGO_REQUEST_LOOKUP_TIMEOUT_MS=200)
+    def test_session_load_is_bounded(self):
+        collection = self.client.get_database('unreachable').get_collection('user_sessions')
+        with unittest.mock.patch.object(UserSession, '_get_collection', return_value=collection), \
+                unittest.mock.patch('accounts.sessions.database_health', DatabaseHealth()), \
+                self.assertLogs('accounts.sessions', 'WARNING'):
+            started = time.monotonic()
+            self.assertEqual(SessionStore('u' * 32).load(), {})
+        self.assertLess(time.monotonic() - started, 5)
+
+
+@override_settings(MONGO_READ_ROUTING=True, MONGO_MAX_STALENESS_SECONDS=30)
+class ReadRoutingTests(SimpleTestCase):
+    """Đọc analytics lên secondary, về primary sau khi chính session đó ghi"""
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        return request
+
+    def test_secondary_until_session_writes(self):
+        request = self.request()
+        preference = routing.read_preference(request)
+        self.assertEqual((preference.mongos_mode, preference.max_staleness), ('secondaryPreferred', 90))
+        self.assertIs(routing.analytics(User.objects, request)._read_preference, preference)
+
+        routing.pin_primary(request)
+        self.assertIs(routing.read_preference(request), ReadPreference.PRIMARY)
+        self.assertIs(routing.read_preference(self.request()), preference)  # admin khác không bị ghim
+        with override_settings(MONGO_READ_ROUTING=False):
+            self.assertIs(routing.read_preference(self.request()), ReadPreference.PRIMARY)
+
+    def test_cluster_time_survives_session_serializer(self):
+        cluster_time = {'clusterTime': Timestamp(1700000000, 7),
+                        'signature': {'hash': b'\x01' * 20, 'keyId': Int64(42)}}
+        encoded = json.loads(json.dumps(routing._encode_cluster_time(cluster_time)))
+        self.assertEqual(routing._decode_cluster_time(encoded), cluster_time)
+
+
+@unittest.skipUnless(os.getenv('MONGODB_REPLSET_URI'), 'Needs MONGODB_REPLSET_URI (single-node replica set)')
+class ChangeStreamWatcherTests(SimpleTestCase):
+    """Change stream trên replica set thật, ví dụ: mongod --replSet rs0 && rs.initiate()"""
+
+    def setUp(self):
+        from pymongo import MongoClient
+
+        self.client = MongoClient(os.getenv('MONGODB_REPLSET_URI'))
+        self.db = self.client['rehearten_invalidation_test']
+        self.client.drop_database(self.db.name)
+        self.bus = InvalidationBus()
+        self.received = _collect(self.bus, 'users', 'user_sessions')
+        self.watcher = ChangeStreamWatcher(self.db, InvalidationBus.COLLECTIONS, max_await_ms=100)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.watcher.run, args=(self.bus, self.stop), daemon=True)
+        self.thread.start()
+        self.assertTrue(_wait_for(lambda: self.bus.flushes == 1 and self.watcher.resume_token))
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join(5)
+        self.client.drop_database(self.db.name)
+        self.client.close()
+        super().tearDown()
+
+    def keys(self, collection):
+        return [i.key for i in self.received if i.collection == collection and not i.flush]
+
+    def test_delivers_changes_and_skips_activity_updates(self):
+        user_id = self.db.users.insert_one({'username': 'cs_user', 'role': 'user'}).inserted_id
+        self.db.users.update_one({'_id': user_id}, {'$set': {'role': 'admin'}})
+        session_id = self.db.user_sessions.insert_one({'user': 'cs_user', 'last_activity': 1}).inserted_id
+        self.db.user_sessions.update_one({'_id': session_id}, {'$set': {'last_activity': 2}})
+        self.db.user_sessions.delete_one({'_id': session_id})
+
+        self.assertTrue(_wait_for(lambda: len(self.keys('user_sessions')) == 2))
+        self.assertEqual(self.keys('users'), [user_id, user_id])
+        self.assertEqual(self.keys('user_sessions'), [session_id, session_id])
+        role_change = [i for i in self.received if i.collection == 'users'][-1]
+        self.assertEqual(role_change.fields, frozenset({'role'}))
+
+    def test_recovers_after_stream_invalidation(self):
+        # dropDatabase invalidate stream: token cũ không dùng được, phải mở lại và xóa cache
+        self.db.users.insert_one({'username': 'cs_before'})
+        self.client.drop_database(self.db.name)
+        self.assertTrue(_wait_for(lambda: self.bus.flushes >= 2))
+        self.assertTrue(_wait_for(lambda: self.watcher.resume_token is not None))
+
+        user_id = self.db.users.insert_one({'username': 'cs_after'}).inserted_id
+        self.assertTrue(_wait_for(lambda: user_id in self.keys('users')))
+
+
+def _incr_shared(location, params, times):
+    cache = SharedMemoryCache(location, params)
+    for _ in range(times):
+        cache.incr('counter')
+
+
+@unittest.skipUnless(os.name == 'posix', 'SharedMemoryCache needs fcntl')
+class SharedMemoryCacheTests(SimpleTestCase):
+    """Cache memory-mapped dùng chung giữa các process (accounts/shmcache.py)"""
+
+    params = {'OPTIONS': {'MAX_ENTRIES': 16, 'WAYS': 4, 'SLOT_SIZE': 256}}
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.cache = SharedMemoryCache(self.location, self.params)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_incr_shared, args=(self.location, self.params, 500)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 2000)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiry_eviction_and_oversized_values(self):
+        self.cache.set('short', 1, timeout=0.05)
+        self.cache.set('kept', 'value')
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 2))
+
+        self.cache.set('kept', 'x' * 1000)  # không vừa slot: xóa giá trị cũ, không trả giá trị cũ
+        self.assertIsNone(self.cache.get('kept'))
+
+        for i in range(64):
+            self.cache.set(f'key{i}', i)
+        self.assertEqual(sum(self.cache.get(f'key{i}') is not None for i in range(64)), 16)
+        self.assertEqual(self.cache.get('key63'), 63)
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# ASYNC_VIEWS (bật trong REHEARTEN/asgi.py): JSON API dùng driver MongoDB async
+api = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # Main pages
@@ -17,12 +21,22 @@ urlpatterns = [
     path('change-password/', views.change_password_view, name='change_password'),
     path('users/', views.users_management_view, name='users_management'),
     path('users/edit/<str:username>/', views.edit_user_view, name='edit_user'),
+    path('audit-log/', views.audit_log_view, name='audit_log'),
     
     # APIs
-    path('api/users/', views.api_user_list, name='api_user_list'),
-    path('api/change-user-role/', views.api_change_user_role, name='api_change_user_role'),
-    path('api/toggle-user-status/', views.api_toggle_user_status, name='api_toggle_user_status'),
+    path('api/users/', api.api_user_list, name='api_user_list'),
+    path('api/users/changes/', api.api_user_changes, name='api_user_changes'),
+    path('api/change-user-role/', api.api_change_user_role, name='api_change_user_role'),
+    path('api/toggle-user-status/', api.api_toggle_user_status, name='api_toggle_user_status'),
     path('api/change-password/', views.api_change_password, name='api_change_password'),
-    path('api/profile/', views.api_profile_update, name='api_profile'),
-    path('api/get-profile/', views.api_get_profile, name='api_get_profile'),
+    path('api/profile/', api.api_profile_update, name='api_profile'),
+    path('api/get-profile/', api.api_get_profile, name='api_get_profile'),
+    path('api/events/', api.api_events, name='api_events'),
+
+    # Monitoring
+    path('api/system-status/', views.api_system_status, name='api_system_status'),
+    path('test/mongodb/', views.api_test_mongodb, name='api_test_mongodb'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('api/profiles/', views.api_profile_list, name='api_profile_list'),
+    path('api/profiles/<str:profile_id>/', views.profile_detail_view, name='profile_detail'),
 ]
\ No newline at end of file
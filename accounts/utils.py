@@ -1,7 +1,15 @@
+from bson import ObjectId
 from django.conf import settings
+from . import aio
+from .health import database_health, request_lookup
 from .models import User, UserSession
 from datetime import datetime
+import logging
 import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 
 def get_client_ip(request):
@@ -14,26 +22,130 @@ def get_client_ip(request):
     return ip
 
 
+def merged_sessions(request):
+    """True nếu session Django nằm trong UserSession (SESSION_ENGINE = 'accounts.sessions')"""
+    return hasattr(request.session, 'touch_activity')
+
+
+class UserRoleCache:
+    """user_id -> (role, is_active) trong process, TTL ngắn
+
+    Dùng cho kiểm tra quyền admin không qua ``get_current_user`` (endpoint giám
+    sát, profiler): role trong session Django là role lúc đăng nhập, còn cache
+    này theo bản ghi User và bị xóa qua bus vô hiệu hóa khi user thay đổi.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._entries = {}  # user_id (str) -> (role, is_active, hết hạn monotonic)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, settings):
+        self.ttl = getattr(settings, 'SESSION_ROLE_CACHE_TTL', self.ttl)
+
+    def get(self, user_id):
+        from .invalidation import invalidation_bus
+
+        invalidation_bus.ensure_started()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached is not None and cached[2] > time.monotonic():
+                self.hits += 1
+                return cached[:2]
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+
+    def put(self, user_id, role, is_active):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (role, is_active, time.monotonic() + self.ttl)
+
+    def invalidated(self, invalidation):
+        """Callback của bus vô hiệu hóa cho collection users"""
+        with self._lock:
+            if invalidation.flush:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(invalidation.key), None)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+user_roles = UserRoleCache()
+
+
+def session_is_admin(request):
+    """True nếu user của session hiện là admin đang hoạt động
+
+    Đọc role từ ``user_roles`` (tối đa một lệnh ``find_one`` theo _id khi cache
+    hết hạn), không tin ``request.session['role']``: role có thể đã bị đổi, user
+    bị vô hiệu hóa, và session tạo trước khi lưu role không có khóa này. MongoDB
+    lỗi (hoặc ``database_health`` đang báo lỗi) thì mới dùng role trong session
+    để endpoint giám sát vẫn trả lời ngay; lệnh đọc bị giới hạn bởi
+    ``MONGO_REQUEST_LOOKUP_TIMEOUT_MS``.
+    """
+    if not request.session.get('is_authenticated'):
+        return False
+    user_id = request.session.get('user_id')
+    if not user_id:
+        return False
+    cached = user_roles.get(user_id)
+    if cached is None:
+        if database_health.down:
+            return request.session.get('role') == 'admin'
+        try:
+            with request_lookup():
+                document = User._get_collection().find_one({'_id': ObjectId(user_id)}, {'role': 1, 'is_active': 1})
+        except Exception as e:
+            logger.warning("Error loading role for session user: %s", e)
+            return request.session.get('role') == 'admin'
+        if document:
+            cached = (document.get('role'), document.get('is_active', True))
+        else:
+            cached = (None, False)
+        user_roles.put(user_id, *cached)
+    role, is_active = cached
+    return bool(is_active) and role == 'admin'
+
+
 def create_user_session(request, user):
     """Create a user session"""
     try:
-        session_key = secrets.token_urlsafe(32)
-        
-        # Store session in database
-        user_session = UserSession(
-            user=user.username,
-            session_key=session_key,
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
-        user_session.save()
+        if merged_sessions(request):
+            # Key mới chống session fixation; lần save đầu có dữ liệu đăng nhập tạo UserSession
+            request.session.cycle_key()
+            request.session.client = {
+                'ip_address': get_client_ip(request),
+                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            }
+            session_key = request.session.session_key
+        else:
+            session_key = secrets.token_urlsafe(32)
+
+            # Store session in database
+            user_session = UserSession(
+                user=user.username,
+                session_key=session_key,
+                ip_address=get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+            user_session.save()
         
         # Store in Django session
         request.session['user_id'] = str(user.id)
         request.session['username'] = user.username
+        request.session['role'] = user.role
+        user_roles.put(str(user.id), user.role, user.is_active)
         request.session['session_key'] = session_key
         request.session['is_authenticated'] = True
-        
+        if merged_sessions(request):
+            request.session.save()  # ghi ngay để lỗi MongoDB trả None như trước
+
         return session_key
     except Exception as e:
         # Handle MongoDB connection issues gracefully
@@ -44,59 +156,112 @@ def get_current_user(request):
     """Get current logged in user"""
     try:
         if not request.session.get('is_authenticated'):
-            print("DEBUG: Session not authenticated")
+            logger.debug("Session not authenticated")
             return None
             
         username = request.session.get('username')
         session_key = request.session.get('session_key')
         
         if not username or not session_key:
-            print(f"DEBUG: Missing session data - username: {username}, session_key: {bool(session_key)}")
-            return None
-        
-        # Verify session exists in database
-        user_session = UserSession.objects(user=username, session_key=session_key).first()
-        if not user_session:
-            # Session expired or invalid
-            print(f"DEBUG: UserSession not found for user: {username}")
-            request.session.flush()
+            logger.debug("Missing session data - username: %s, session_key: %s", username, bool(session_key))
             return None
         
-        # Update last activity
-        user_session.last_activity = datetime.now()
-        user_session.save()
+        if merged_sessions(request):
+            # Session đã được kiểm tra khi tải từ UserSession; last_activity ghi thưa
+            request.session.touch_activity()
+        else:
+            # Verify session exists in database
+            user_session = UserSession.objects(user=username, session_key=session_key).first()
+            if not user_session:
+                # Session expired or invalid
+                logger.debug("UserSession not found for user: %s", username)
+                request.session.flush()
+                return None
+
+            # Update last activity
+            user_session.last_activity = datetime.now()
+            user_session.save()
         
         # Get user
         user = User.objects(username=username).first()
         if not user:
-            print(f"DEBUG: User not found in database: {username}")
+            logger.debug("User not found in database: %s", username)
             return None
             
         # Debug user role
         if not user.role:
-            print(f"DEBUG: User {username} has no role assigned")
+            logger.debug("User %s has no role assigned", username)
             return user  # Still return user, let view handle the role issue
             
-        print(f"DEBUG: User authenticated successfully - username: {user.username}, role: {user.role}")
+        logger.debug("User authenticated successfully - username: %s, role: %s", user.username, user.role)
         return user
         
     except Exception as e:
         # Handle MongoDB connection issues gracefully
-        print(f"DEBUG: Error in get_current_user: {str(e)}")
+        logger.warning("Error in get_current_user: %s", e)
         return None
 
 
+async def aget_current_user(request):
+    """Async version of get_current_user (async MongoDB driver, see aio.py)
+
+    Kiểm tra session và cập nhật last_activity trong một lệnh
+    ``find_one_and_update``; kết quả được giữ trên request nên decorator và view
+    gọi lại không tốn thêm round trip.
+    """
+    if hasattr(request, '_acurrent_user'):
+        return request._acurrent_user
+    user = None
+    try:
+        merged = merged_sessions(request)
+        if merged:
+            await request.session.aload_session()
+        username = request.session.get('username')
+        session_key = request.session.get('session_key')
+        if request.session.get('is_authenticated') and username and session_key:
+            if merged:
+                await request.session.atouch_activity()
+                user_session = True
+            else:
+                user_session = await aio.get_collection(UserSession).find_one_and_update(
+                    {'user': username, 'session_key': session_key},
+                    {'$set': {'last_activity': datetime.now()}},
+                    {'_id': 1},
+                )
+            if not user_session:
+                logger.debug("UserSession not found for user: %s", username)
+                request.session.flush()
+            else:
+                user = aio.to_document(User, await aio.get_collection(User).find_one({'username': username}))
+                if not user:
+                    logger.debug("User not found in database: %s", username)
+    except Exception as e:
+        logger.warning("Error in aget_current_user: %s", e)
+        user = None
+    request._acurrent_user = user
+    return user
+
+
 def logout_user(request):
     """Logout user and cleanup session"""
     username = request.session.get('username')
     session_key = request.session.get('session_key')
     
-    if username and session_key:
+    if username and session_key and not merged_sessions(request):
         try:
             # Remove session from database
             UserSession.objects(user=username, session_key=session_key).delete()
         except Exception:
             pass  # Handle MongoDB connection issues gracefully
     
-    # Clear Django session
-    request.session.flush() 
\ No newline at end of file
+    # Clear Django session (accounts.sessions: xóa luôn UserSession)
+    try:
+        request.session.flush()
+    except Exception:
+        pass  # Handle MongoDB connection issues gracefully 
+
+def field_errors(error):
+    """ValidationError của mongoengine -> ``{field: [message]}`` như lỗi 400 của API profile"""
+    if error.errors:
+        return {field: [str(message)] for field, message in error.to_dict().items()}
+    return {error.field_name or 'error': [error.message]}
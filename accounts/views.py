@@ -1,12 +1,22 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from .forms import CustomUserCreationForm, LoginForm, UserUpdateForm, PasswordChangeForm
-from .models import User, UserSession
-from .utils import get_current_user, create_user_session, logout_user
-from .decorators import login_required, admin_required
-import secrets
+from .models import User, AuditLog
+from .utils import get_current_user, create_user_session, logout_user, field_errors
+from .decorators import login_required, admin_required, api_admin_required, api_session_admin_required
+from . import audit, changes, routing
+from .events import broadcaster
+from .invalidation import invalidation_bus
+from .sessions import session_cache
+from .fragments import DashboardStats
+from .health import database_health
+from .metrics import metrics, process_info
+from .pool import pool_listener
+from .profiling import profile_store
+from bson import ObjectId
+from mongoengine.errors import NotUniqueError, ValidationError
 from datetime import datetime
 import json
 import logging
@@ -14,57 +24,15 @@ import re
 
 logger = logging.getLogger(__name__)
 
-
-def get_client_ip(request):
-    """Get client IP address"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+# Trường của User được ghi vào audit log khi admin chỉnh sửa
+AUDITED_USER_FIELDS = ('first_name', 'last_name', 'email', 'role', 'is_active', 'permissions')
 
 
-def create_user_session(request, user):
-    """Create a user session"""
-    try:
-        session_key = secrets.token_urlsafe(32)
-        
-        # Store session in database
-        user_session = UserSession(
-            user=user.username,
-            session_key=session_key,
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
-        user_session.save()
-        
-        # Store in Django session
-        request.session['user_id'] = str(user.id)
-        request.session['username'] = user.username
-        request.session['session_key'] = session_key
-        request.session['is_authenticated'] = True
-
-        return session_key
-    except Exception as e:
-        # Handle MongoDB connection issues gracefully
-        return None
-
-
-def logout_user(request):
-    """Logout user and cleanup session"""
-    username = request.session.get('username')
-    session_key = request.session.get('session_key')
-    
-    if username and session_key:
-        try:
-            # Remove session from database
-            UserSession.objects(user=username, session_key=session_key).delete()
-        except Exception:
-            pass  # Handle MongoDB connection issues gracefully
-    
-    # Clear Django session
-    request.session.flush()
+def audit_snapshot(user):
+    """Giá trị hiện tại của các trường được audit (list thường để so sánh và lưu BSON)"""
+    snapshot = {field: getattr(user, field) for field in AUDITED_USER_FIELDS}
+    snapshot['permissions'] = list(snapshot['permissions'] or [])
+    return snapshot
 
 
 def home_view(request):
@@ -75,14 +43,11 @@ def home_view(request):
         'user': user,
     }
     
-    # Add stats for admin users
+    # Add stats for admin users (tính lười, bỏ qua khi fragment đã cache)
     if user and user.is_admin():
-        try:
-            context['total_users'] = User.objects.count()
-            context['active_sessions'] = UserSession.objects.count()
-        except Exception:
-            context['total_users'] = 0
-            context['active_sessions'] = 0
+        stats = DashboardStats(request)
+        context['total_users'] = stats.total_users
+        context['active_sessions'] = stats.active_sessions
     
     return render(request, 'accounts/home.html', context)
 
@@ -96,6 +61,9 @@ def register_view(request):
         try:
             if form.is_valid():
                 user = form.save()
+                if current_user and current_user.is_admin():
+                    audit.record(current_user.username, 'user_create', user.username, {'role': (None, user.role)}, request)
+                    routing.note_write(request)
                 messages.success(request, f'Đăng ký thành công! Chào mừng {user.first_name} với vai trò {user.get_role_display()}! Bạn có thể đăng nhập ngay bây giờ.')
                 return redirect('login')
         except Exception as e:
@@ -166,19 +134,12 @@ def dashboard_view(request):
         messages.error(request, f'Lỗi: Vai trò "{user.role}" không hợp lệ. Vui lòng liên hệ quản trị viên.')
         return redirect('login')
     
-    try:
-        # Get user statistics with error handling
-        total_users = User.objects.count()
-        active_sessions = UserSession.objects.count()
-    except Exception as e:
-        messages.error(request, f'Lỗi kết nối cơ sở dữ liệu: {str(e)}')
-        total_users = 0
-        active_sessions = 0
-    
+    # Số liệu chỉ hiển thị cho admin; tính lười nên user thường không tốn truy vấn
+    stats = DashboardStats(request)
     context = {
         'user': user,
-        'total_users': total_users,
-        'active_sessions': active_sessions,
+        'total_users': stats.total_users,
+        'active_sessions': stats.active_sessions,
         'dashboard_type': 'user'
     }
     return render(request, 'accounts/dashboard.html', context)
@@ -189,30 +150,14 @@ def admin_dashboard_view(request):
     """Dashboard dành cho Admin"""
     user = get_current_user(request)
     
-    try:
-        # Get comprehensive statistics
-        total_users = User.objects.count()
-        active_sessions = UserSession.objects.count()
-        
-        # Role statistics - simplified for only admin and user
-        role_stats = {}
-        for role_key, role_name in User.ROLES:
-            role_stats[role_name] = User.objects(role=role_key).count()
-        
-        # Recent users
-        recent_users = User.objects.order_by('-date_joined')[:5]
-        
-    except Exception:
-        total_users = active_sessions = 0
-        role_stats = {}
-        recent_users = []
-    
+    # Thống kê, số user theo vai trò và user mới: chỉ truy vấn khi fragment hết cache
+    stats = DashboardStats(request)
     context = {
         'user': user,
-        'total_users': total_users,
-        'active_sessions': active_sessions,
-        'role_stats': role_stats,
-        'recent_users': recent_users,
+        'total_users': stats.total_users,
+        'active_sessions': stats.active_sessions,
+        'role_stats': stats.role_stats,
+        'recent_users': stats.recent_users,
         'dashboard_type': 'admin'
     }
     
@@ -225,8 +170,8 @@ def users_management_view(request):
     user = get_current_user(request)
     
     try:
-        # Get all users for management
-        users = User.objects.order_by('-date_joined')
+        # Get all users for management (secondary, trừ khi admin vừa ghi - accounts/routing.py)
+        users = routing.analytics(User.objects, request).order_by('-date_joined')
     except Exception:
         users = []
     
@@ -256,7 +201,13 @@ def edit_user_view(request, username):
         form = UserUpdateForm(instance=target_user, current_user=current_user, data=request.POST)
         try:
             if form.is_valid():
+                before = audit_snapshot(target_user)
                 form.save()
+                after = audit_snapshot(target_user)
+                diff = {field: (before[field], after[field]) for field in before if before[field] != after[field]}
+                if diff:
+                    audit.record(current_user.username, 'user_update', target_user.username, diff, request)
+                    routing.note_write(request)
                 messages.success(request, f'Cập nhật thông tin người dùng {target_user.username} thành công!')
                 return redirect('users_management')
         except Exception as e:
@@ -318,8 +269,9 @@ def api_change_user_role(request):
         user.save()
         new_role_display = user.get_role_display()
         
-        # Log the role change (you could save this to a log model)
-        print(f"[ROLE CHANGE] Admin {current_user.username} changed {username} from {old_role} to {new_role_display}")
+        # Ghi nhật ký thay đổi vai trò (audit log, ghi nền theo lô)
+        audit.record(current_user.username, 'role_change', username, {'role': (old_role_key, user.role)}, request, source='api')
+        routing.note_write(request)
         
         return JsonResponse({
             'success': True,
@@ -383,8 +335,9 @@ def api_toggle_user_status(request):
         new_status = "Hoạt động" if user.is_active else "Không hoạt động"
         action = "kích hoạt" if user.is_active else "vô hiệu hóa"
         
-        # Log the status change
-        print(f"[STATUS CHANGE] Admin {current_user.username} {action} user {username} - từ {old_status} thành {new_status}")
+        # Ghi nhật ký thay đổi trạng thái (audit log, ghi nền theo lô)
+        audit.record(current_user.username, 'status_change', username, {'is_active': (old_active, user.is_active)}, request, source='api')
+        routing.note_write(request)
         
         return JsonResponse({
             'success': True,
@@ -438,11 +391,11 @@ def api_profile_update(request):
     if request.method != 'PATCH':
         return JsonResponse({'error': 'Phương thức không được hỗ trợ'}, status=405)
     
-    logger.info(f"PATCH /api/profile/ - User: {request.session.get('username', 'Unknown')}")
+    logger.info("PATCH /api/profile/ - User: %s", request.session.get('username', 'Unknown'))
     
     try:
         data = json.loads(request.body)
-        logger.info(f"PATCH Request Data: {data}")
+        logger.debug("PATCH Request Data: %s", data)
 
         user = get_current_user(request)
         if not user:
@@ -485,8 +438,13 @@ def api_profile_update(request):
         if not updated_fields:
             logger.warning("PATCH Request: No fields to update")
             return JsonResponse({'message': 'Không có thông tin nào được thay đổi'}, status=200)
-        user.save()
-        logger.info(f"PATCH Request Successful: Updated fields {updated_fields} for user {user.username}")
+        try:
+            user.save()
+        except ValidationError as e:
+            return JsonResponse(field_errors(e), status=400)
+        except NotUniqueError:
+            return JsonResponse({'email': ['Email này đã được sử dụng']}, status=400)
+        logger.info("PATCH Request Successful: Updated fields %s for user %s", updated_fields, user.username)
 
         return JsonResponse({
             'message': 'Cập nhật thông tin thành công!',
@@ -521,7 +479,10 @@ def api_user_list(request):
         if not user.is_admin():
             return JsonResponse({'error': 'Chỉ admin mới có thể truy cập danh sách người dùng'}, status=403)
         
-        users = User.objects.all()
+        # Secondary trong causal session: vẫn thấy thay đổi vừa ghi của chính admin này
+        with routing.causal_session(request) as session:
+            users = [User._from_son(son) for son in
+                     routing.analytics_collection(User, request, session).find({}, session=session)]
         
         user_list = []
         for u in users:
@@ -660,4 +621,128 @@ def api_change_password(request):
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
         logger.error(f"Error in api_change_password: {str(e)}")
-        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=500)
+
+
+@api_session_admin_required
+def api_system_status(request):
+    """API trạng thái hệ thống cho admin dashboard - chỉ đọc số liệu trong bộ nhớ"""
+    database = database_health.get()
+    if database['ok'] is None:
+        database_status = 'checking'
+    else:
+        database_status = 'connected' if database['ok'] else 'disconnected'
+
+    return JsonResponse({
+        'system_status': 'healthy' if database['ok'] else 'degraded',
+        'database_status': database_status,
+        'timestamp': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+        'statistics': {
+            'total_users': database_health.total_users,
+            'active_sessions': database_health.active_sessions,
+        },
+        'database': database,
+        'pool': pool_listener.stats.snapshot(),
+        'events': broadcaster.stats(),
+        'invalidation': invalidation_bus.stats(),
+        'sessions': session_cache.stats(),
+        'read_routing': routing.routing_stats.snapshot(),
+        'process': process_info(),
+        **metrics.snapshot(),
+    })
+
+
+@api_admin_required
+def api_user_changes(request):
+    """User thay đổi/bị xóa kể từ token ``since`` - đồng bộ tăng dần (accounts/changes.py)"""
+    try:
+        page = changes.changes_page(request.GET.get('since', ''), changes.page_limit(request.GET.get('limit')))
+    except changes.TokenError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except changes.ResyncRequired as e:
+        return JsonResponse({'error': str(e), 'resync': True}, status=410)
+    return JsonResponse(page)
+
+
+@api_admin_required
+def api_events(request):
+    """SSE cần ASGI (xem async_views.api_events); 204 để EventSource không kết nối lại"""
+    return HttpResponse(status=204)
+
+
+@api_session_admin_required
+def api_test_mongodb(request):
+    """API kiểm tra kết nối MongoDB ngay lập tức (chờ tối đa 5 giây)"""
+    database = database_health.get(wait=5.0, force=True)
+    if database['refreshing']:
+        return JsonResponse({
+            'database_accessible': False,
+            'error': 'MongoDB không phản hồi ping trong 5 giây',
+        })
+    return JsonResponse({
+        'database_accessible': bool(database['ok']),
+        'latency_ms': database['ping_ms'],
+        'error': database['error'],
+        'checked_at': database['checked_at'],
+    })
+
+
+@api_session_admin_required
+def metrics_view(request):
+    """Số liệu của tất cả worker theo định dạng text của Prometheus"""
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_admin_required
+def api_profile_list(request):
+    """Danh sách profile chậm nhất đã lưu - chỉ admin"""
+    return JsonResponse({'profiles': [profile.summary() for profile in profile_store.all()]})
+
+
+@api_admin_required
+def profile_detail_view(request, profile_id):
+    """Một profile dạng collapsed stack (mặc định) hoặc cây flame graph dạng text (?format=tree)"""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return JsonResponse({'error': 'Không tìm thấy profile'}, status=404)
+    if request.GET.get('format') == 'tree':
+        content = profile.flame_text()
+    else:
+        content = profile.collapsed()
+    return HttpResponse(content, content_type='text/plain; charset=utf-8')
+
+
+@admin_required
+def audit_log_view(request):
+    """Nhật ký thao tác quản trị - chỉ admin"""
+    user = get_current_user(request)
+    filters = {
+        'actor': request.GET.get('actor', '').strip(),
+        'target': request.GET.get('target', '').strip(),
+        'action': request.GET.get('action', '').strip(),
+    }
+    before = before_id = None
+    if request.GET.get('before'):
+        try:
+            before = datetime.fromisoformat(request.GET['before'])
+        except ValueError:
+            messages.error(request, 'Tham số thời gian không hợp lệ.')
+        if before and ObjectId.is_valid(request.GET.get('before_id', '')):
+            before_id = ObjectId(request.GET['before_id'])
+
+    page_size = 50
+    try:
+        entries = audit.query(before=before, before_id=before_id, limit=page_size, **filters)
+    except Exception as e:
+        messages.error(request, f'Lỗi kết nối cơ sở dữ liệu: {str(e)}')
+        entries = []
+
+    context = {
+        'user': user,
+        'entries': entries,
+        'filters': filters,
+        'actions': AuditLog.ACTIONS,
+        'next_before': entries[-1].created_at.isoformat() if len(entries) == page_size else None,
+        'next_before_id': str(entries[-1].id) if len(entries) == page_size else None,
+    }
+    return render(request, 'accounts/audit_log.html', context)
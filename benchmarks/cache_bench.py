@@ -0,0 +1,225 @@
+"""
+Benchmark cache backend: SharedMemoryCache (accounts/shmcache.py) so với
+LocMemCache và FileBasedCache của Django.
+
+Hai phần:
+
+- Một process: thời gian mỗi thao tác get (hit/miss), set, incr và
+  get+set của một session (~200 byte) trên từng backend.
+- Nhiều worker (fork): trong ``--duration`` giây mỗi worker ghi (10%) các key
+  thuộc phần của mình và đọc (90%) key bất kỳ - như session tạo ở worker này,
+  request sau rơi vào worker khác - rồi ``--incr`` lần incr cùng một key. Ghi
+  lại tổng thông lượng, tỷ lệ hit (LocMem: tối đa 1/số worker) và số lần incr
+  bị mất (incr không nguyên tử hoặc không dùng chung).
+
+    python benchmarks/cache_bench.py
+    python benchmarks/cache_bench.py --workers 8 --duration 5 -o cache.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+BACKENDS = ('locmem', 'filebased', 'shm')
+SESSION = {
+    '_auth_user_id': '65f0c0ffee0123456789abcd', 'username': 'bench_user_000042', 'role': 'user',
+    'session_key': 'x' * 43, 'is_authenticated': True,
+}
+
+
+def setup_django():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('MONGODB_TARGET', 'mock')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'REHEARTEN.settings_bench')
+    os.environ.setdefault('MONGO_SLOW_QUERY_ENABLED', 'False')
+    import django
+    django.setup()
+
+
+def make_cache(name, directory, max_entries):
+    from django.core.cache.backends.filebased import FileBasedCache
+    from django.core.cache.backends.locmem import LocMemCache
+    from accounts.shmcache import SharedMemoryCache
+
+    options = {'OPTIONS': {'MAX_ENTRIES': max_entries}, 'TIMEOUT': 3600}
+    if name == 'locmem':
+        return LocMemCache(f'bench-{os.getpid()}-{time.monotonic_ns()}', options)
+    if name == 'filebased':
+        return FileBasedCache(os.path.join(directory, 'filebased'), options)
+    return SharedMemoryCache(os.path.join(directory, 'shm'),
+                             {**options, 'OPTIONS': {'MAX_ENTRIES': max_entries, 'SLOT_SIZE': 1024}})
+
+
+# ---------------------------------------------------------------- một process
+
+def single_process_ops(cache):
+    keys = [f'key:{i}' for i in range(1000)]
+    for key in keys:
+        cache.set(key, SESSION)
+    cache.set('counter', 0)
+    cycle = iter(range(10 ** 12))
+
+    def get_hit():
+        cache.get(keys[next(cycle) % 1000])
+
+    def get_miss():
+        cache.get('missing')
+
+    def set_value():
+        cache.set(keys[next(cycle) % 1000], SESSION)
+
+    def incr():
+        cache.incr('counter')
+
+    def session_roundtrip():
+        key = keys[next(cycle) % 1000]
+        cache.set(key, cache.get(key))
+
+    return {'get_hit': get_hit, 'get_miss': get_miss, 'set': set_value, 'incr': incr, 'session': session_roundtrip}
+
+
+def measure(func, repeat, min_time):
+    """Trung vị µs mỗi lần gọi qua ``repeat`` lần đo, mỗi lần tối thiểu ``min_time`` giây"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - started >= min_time / 4:
+            break
+        loops *= 4
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter_ns() - started) / loops / 1000.0)
+    return round(statistics.median(samples), 3)
+
+
+# ---------------------------------------------------------------- nhiều worker
+
+def _worker(name, directory, max_entries, keyspace, duration, increments, worker, workers, start, results):
+    cache = make_cache(name, directory, max_entries)
+    rng = random.Random(os.getpid())
+    own = [f'mix:{i}' for i in range(worker, keyspace, workers)]
+    for key in own:
+        cache.set(key, SESSION)
+    start.wait()
+    hits = misses = sets = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if rng.random() < 0.1:
+            cache.set(rng.choice(own), SESSION)
+            sets += 1
+        elif cache.get(f'mix:{rng.randrange(keyspace)}') is None:
+            misses += 1
+        else:
+            hits += 1
+    cache.add('shared_counter', 0)
+    for _ in range(increments):
+        cache.incr('shared_counter')
+    results.put({'hits': hits, 'misses': misses, 'sets': sets, 'counter': cache.get('shared_counter')})
+
+
+def multi_process(name, args, directory):
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(name, directory, args.max_entries, args.keyspace,
+                                              args.duration, args.incr, worker, args.workers, start, results))
+        for worker in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    started = time.perf_counter()
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    hits = sum(outcome['hits'] for outcome in outcomes)
+    lookups = hits + sum(outcome['misses'] for outcome in outcomes)
+    operations = lookups + sum(outcome['sets'] for outcome in outcomes)
+    expected = args.workers * args.incr
+    counter = max(outcome['counter'] or 0 for outcome in outcomes)
+    return {
+        'ops_per_second': round(operations / elapsed),
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        'incr_expected': expected,
+        'incr_lost': expected - counter,
+    }
+
+
+# ---------------------------------------------------------------- runner
+
+def run(args):
+    setup_django()
+    results = {}
+    for name in args.backends:
+        directory = tempfile.mkdtemp(prefix='cache-bench-')
+        try:
+            cache = make_cache(name, directory, args.max_entries)
+            single = {op: measure(func, args.repeat, args.min_time) for op, func in single_process_ops(cache).items()}
+            cache.clear()
+            multi = multi_process(name, args, directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        results[name] = {'single_us': single, 'multi': multi}
+        print(f'  {name:<10} done', file=sys.stderr)
+    return {
+        'meta': {
+            'workers': args.workers,
+            'duration': args.duration,
+            'keyspace': args.keyspace,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'backends': results,
+    }
+
+
+def report(result):
+    backends = result['backends']
+    ops = next(iter(backends.values()))['single_us']
+    print(f"{'µs / thao tác':<16}" + ''.join(f'{name:>12}' for name in backends))
+    for op in ops:
+        print(f'{op:<16}' + ''.join(f"{backends[name]['single_us'][op]:>12.2f}" for name in backends))
+    print()
+    print(f"{result['meta']['workers']} worker" + ' ' * 7 + ''.join(f'{name:>12}' for name in backends))
+    for field in ('ops_per_second', 'hit_rate', 'incr_lost'):
+        print(f'{field:<16}' + ''.join(f"{backends[name]['multi'][field]:>12}" for name in backends))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SharedMemoryCache vs LocMem / FileBased')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=7, help='Số lần đo mỗi thao tác')
+    parser.add_argument('--min-time', type=float, default=0.1, help='Thời gian tối thiểu mỗi lần đo (giây)')
+    parser.add_argument('--workers', type=int, default=4, help='Số process cho phần nhiều worker')
+    parser.add_argument('--duration', type=float, default=3.0, help='Giây chạy hỗn hợp get/set mỗi worker')
+    parser.add_argument('--keyspace', type=int, default=2000, help='Số key khác nhau trong phần nhiều worker')
+    parser.add_argument('--incr', type=int, default=2000, help='Số lần incr mỗi worker')
+    parser.add_argument('--max-entries', type=int, default=16384)
+    parser.add_argument('-o', '--output', help='Ghi kết quả JSON')
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""
+Load test end-to-end: khởi động project với mongod trên máy (hoặc mongomock),
+seed user/session rồi bắn traffic đồng thời vào các endpoint chính.
+
+Kết quả (throughput, p50/p95/p99 theo endpoint) ghi ra JSON để so sánh giữa các commit:
+
+    # mongod trên máy (MONGODB_LOCAL_URI, mặc định mongodb://localhost:27017)
+    python benchmarks/load_test.py --users 5000 --concurrency 16 --duration 60 -o before.json
+
+    # không cần server MongoDB (pip install mongomock)
+    MONGODB_TARGET=mock python benchmarks/load_test.py -o after.json
+
+    # so sánh hai lần chạy
+    python benchmarks/load_test.py --compare before.json after.json
+
+Mặc định server Django chạy trong một process con (ThreadedWSGIServer) để
+thread của load generator không tranh GIL với server. ``--url`` bắn vào một
+server đang chạy sẵn (vd. gunicorn với REHEARTEN.settings_bench) - khi đó
+dữ liệu được seed từ process này nên phải dùng MONGODB_TARGET=local.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+BENCH_PASSWORD = 'Bench@Password2024'
+ADMIN_USERNAME = 'bench_admin'
+USERNAME_FORMAT = 'bench_user_{:06d}'
+
+# Tỷ trọng của từng loại request trong traffic của một virtual user
+DEFAULT_MIX = {
+    'dashboard': 50,
+    'api_user_list': 10,
+    'profile_patch': 20,
+    'role_change': 10,
+    'login': 10,
+}
+
+FIRST_NAMES = ['An', 'Bình', 'Châu', 'Dũng', 'Giang', 'Hà', 'Hải', 'Hương', 'Khoa', 'Lan',
+               'Linh', 'Minh', 'Nam', 'Ngọc', 'Phúc', 'Quân', 'Sơn', 'Thảo', 'Trang', 'Vy']
+LAST_NAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng',
+              'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương', 'Lý']
+
+
+def setup_django():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'REHEARTEN.settings_bench')
+    import django
+    django.setup()
+
+
+# ---------------------------------------------------------------- seeding
+
+def seed(users, sessions, rng_seed=0, batch_size=1000):
+    """Xóa dữ liệu bench cũ rồi tạo ``users`` user thường, 1 admin và ``sessions`` UserSession"""
+    from django.contrib.auth.hashers import make_password
+    from accounts.models import User, UserSession
+
+    rng = random.Random(rng_seed)
+    User.ensure_indexes()
+    UserSession.ensure_indexes()
+    User.objects(username__startswith='bench_').delete()
+    UserSession.objects(user__startswith='bench_').delete()
+
+    # Hash một lần cho tất cả user - seed 10k user không tốn 10k lần PBKDF2
+    password = make_password(BENCH_PASSWORD)
+    now = datetime.now()
+
+    def build_user(username, role):
+        return User(
+            username=username,
+            email=f'{username}@bench.rehearten.local',
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password=password,
+            role=role,
+            is_active=True,
+            date_joined=now - timedelta(days=rng.randint(0, 365)),
+        ).to_mongo()
+
+    collection = User._get_collection()
+    collection.insert_one(build_user(ADMIN_USERNAME, 'admin'))
+    for start in range(0, users, batch_size):
+        batch = [build_user(USERNAME_FORMAT.format(i), 'user') for i in range(start, min(users, start + batch_size))]
+        collection.insert_many(batch, ordered=False)
+
+    collection = UserSession._get_collection()
+    for start in range(0, sessions, batch_size):
+        batch = []
+        for _ in range(start, min(sessions, start + batch_size)):
+            last_activity = now - timedelta(minutes=rng.randint(0, 24 * 60))
+            batch.append(UserSession(
+                user=USERNAME_FORMAT.format(rng.randrange(users)),
+                session_key=f'bench-{rng.getrandbits(128):032x}',
+                created_at=last_activity - timedelta(minutes=rng.randint(0, 60)),
+                last_activity=last_activity,
+                ip_address='127.0.0.1',
+                user_agent='rehearten-load-test',
+            ).to_mongo())
+        collection.insert_many(batch, ordered=False)
+
+    return {'users': users + 1, 'sessions': sessions}
+
+
+# ---------------------------------------------------------------- server
+
+def serve(args):
+    """Process con: seed dữ liệu, chạy WSGI server rồi in ``READY <port>``"""
+    setup_django()
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    seeded = seed(args.users, args.sessions, args.seed)
+    server = ThreadedWSGIServer(('127.0.0.1', args.port), QuietRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    print(f'READY {server.server_address[1]} {json.dumps(seeded)}', flush=True)
+    server.serve_forever()
+
+
+def start_server(args):
+    command = [
+        sys.executable, __file__, '--serve',
+        '--users', str(args.users), '--sessions', str(args.sessions),
+        '--seed', str(args.seed), '--port', '0',
+    ]
+    server_log = open(args.server_log, 'w')
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=server_log, text=True, cwd=BASE_DIR)
+    for line in process.stdout:
+        if line.startswith('READY '):
+            _, port, seeded = line.split(' ', 2)
+            return process, f'http://127.0.0.1:{port}', json.loads(seeded)
+    process.wait()
+    raise SystemExit(f'Server exited with code {process.returncode} - see {args.server_log}')
+
+
+# ---------------------------------------------------------------- traffic
+
+class VirtualUser:
+    """Một user thường và một phiên admin dùng chung một thread"""
+
+    def __init__(self, base_url, index, role_targets, rng):
+        import requests
+
+        self.requests = requests
+        self.base_url = base_url
+        self.username = USERNAME_FORMAT.format(index)
+        self.role_targets = {username: 'user' for username in role_targets}
+        self.rng = rng
+        self.session = requests.Session()
+        self.admin = requests.Session()
+
+    def _login(self, session, username):
+        session.get(f'{self.base_url}/login/')
+        response = session.post(f'{self.base_url}/login/', data={
+            'username': username,
+            'password': BENCH_PASSWORD,
+            'csrfmiddlewaretoken': session.cookies.get('csrftoken', ''),
+        }, allow_redirects=False)
+        # Đăng nhập thành công -> redirect tới dashboard; sai -> render lại form (200)
+        return response.status_code if response.status_code == 302 else 599
+
+    def prepare(self):
+        if self._login(self.session, self.username) != 302 or self._login(self.admin, ADMIN_USERNAME) != 302:
+            raise RuntimeError(f'Login failed for {self.username}')
+
+    def login(self):
+        self.session = self.requests.Session()
+        return self._login(self.session, self.username)
+
+    def dashboard(self):
+        return self.session.get(f'{self.base_url}/dashboard/', allow_redirects=False).status_code
+
+    def api_user_list(self):
+        return self.admin.get(f'{self.base_url}/api/users/', allow_redirects=False).status_code
+
+    def profile_patch(self):
+        body = {'first_name': self.rng.choice(FIRST_NAMES), 'last_name': self.rng.choice(LAST_NAMES)}
+        return self.session.patch(f'{self.base_url}/api/profile/', json=body, allow_redirects=False).status_code
+
+    def role_change(self):
+        if not self.role_targets:
+            return 599
+        username = self.rng.choice(list(self.role_targets))
+        new_role = 'admin' if self.role_targets[username] == 'user' else 'user'
+        response = self.admin.post(
+            f'{self.base_url}/api/change-user-role/',
+            json={'username': username, 'role': new_role},
+            allow_redirects=False,
+        )
+        if response.status_code == 200:
+            self.role_targets[username] = new_role
+        return response.status_code
+
+
+def run_worker(user, mix, warmup_until, stop_at, results):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    while True:
+        name = user.rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = getattr(user, name)()
+        except Exception:
+            status = 0
+        finished = time.perf_counter()
+        if finished >= stop_at:
+            break
+        if finished < warmup_until:
+            continue
+        samples[name].append((finished - started) * 1000)
+        if not 200 <= status < 400:
+            errors[name] += 1
+    results.append((samples, errors))
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = max(0, math.ceil(percent / 100.0 * len(values)) - 1)
+    return round(values[min(rank, len(values) - 1)], 3)
+
+
+def summarize(samples, errors, elapsed):
+    values = sorted(samples)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(values) / len(values), 3) if values else None,
+        'p50_ms': percentile(values, 50),
+        'p95_ms': percentile(values, 95),
+        'p99_ms': percentile(values, 99),
+        'max_ms': round(values[-1], 3) if values else None,
+    }
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BASE_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except Exception:
+        return None
+
+
+def run_load(args, base_url, seeded):
+    mix = dict(DEFAULT_MIX)
+    for item in args.mix or []:
+        name, _, weight = item.partition('=')
+        if name not in mix:
+            raise SystemExit(f'Unknown endpoint in --mix: {name} (choose from {", ".join(DEFAULT_MIX)})')
+        mix[name] = float(weight)
+    mix = {name: weight for name, weight in mix.items() if weight > 0}
+
+    # User 0..concurrency-1 đăng nhập, phần còn lại là đối tượng đổi vai trò (chia đều cho các thread)
+    role_pool = [USERNAME_FORMAT.format(i) for i in range(args.concurrency, args.users)]
+    users = []
+    for index in range(args.concurrency):
+        users.append(VirtualUser(base_url, index, role_pool[index::args.concurrency], random.Random(args.seed + index)))
+    for user in users:
+        user.prepare()
+
+    results = []
+    started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    started = time.perf_counter()
+    warmup_until = started + args.warmup
+    stop_at = warmup_until + args.duration
+    threads = [
+        threading.Thread(target=run_worker, args=(user, mix, warmup_until, stop_at, results))
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    endpoints = {}
+    total_samples, total_errors = [], 0
+    for name in mix:
+        samples = [value for worker_samples, _ in results for value in worker_samples[name]]
+        errors = sum(worker_errors[name] for _, worker_errors in results)
+        endpoints[name] = summarize(samples, errors, args.duration)
+        total_samples.extend(samples)
+        total_errors += errors
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': started_at,
+            'target': os.getenv('MONGODB_TARGET', 'local'),
+            'base_url': base_url,
+            'seeded': seeded,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'mix': mix,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'endpoints': endpoints,
+        'total': summarize(total_samples, total_errors, args.duration),
+    }
+
+
+# ---------------------------------------------------------------- report
+
+def print_report(result, stream=sys.stderr):
+    header = f"{'endpoint':<16}{'req':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header, file=stream)
+    print('-' * len(header), file=stream)
+    rows = list(result['endpoints'].items()) + [('TOTAL', result['total'])]
+    for name, row in rows:
+        print(f"{name:<16}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>10.1f}"
+              f"{row['p50_ms'] or 0:>10.1f}{row['p95_ms'] or 0:>10.1f}{row['p99_ms'] or 0:>10.1f}", file=stream)
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('revision')} -> {after['meta'].get('revision')}")
+    print(f"{'endpoint':<16}{'metric':<16}{'before':>12}{'after':>12}{'change':>10}")
+    rows = [(name, before['endpoints'].get(name), row) for name, row in after['endpoints'].items()]
+    rows.append(('TOTAL', before['total'], after['total']))
+    for name, old, new in rows:
+        if not old:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            a, b = old.get(metric), new.get(metric)
+            change = f'{(b - a) / a * 100:+.1f}%' if a and b is not None else '-'
+            print(f'{name:<16}{metric:<16}{a if a is not None else "-":>12}{b if b is not None else "-":>12}{change:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ReHearten end-to-end load test')
+    parser.add_argument('--users', type=int, default=2000, help='Số user seed (mặc định 2000)')
+    parser.add_argument('--sessions', type=int, default=5000, help='Số UserSession seed (mặc định 5000)')
+    parser.add_argument('--concurrency', '-c', type=int, default=8, help='Số virtual user đồng thời')
+    parser.add_argument('--duration', '-d', type=float, default=30, help='Thời gian đo (giây)')
+    parser.add_argument('--warmup', type=float, default=5, help='Thời gian chạy trước khi đo (giây)')
+    parser.add_argument('--mix', nargs='*', metavar='ENDPOINT=WEIGHT', help='Ghi đè tỷ trọng, vd. dashboard=80 login=0')
+    parser.add_argument('--seed', type=int, default=0, help='Seed ngẫu nhiên cho dữ liệu và traffic')
+    parser.add_argument('--url', help='Bắn vào server đang chạy thay vì tự khởi động')
+    parser.add_argument('--server-log', default=os.devnull, help='File nhận stderr của server con')
+    parser.add_argument('--output', '-o', help='Ghi kết quả JSON ra file (mặc định stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='So sánh hai file kết quả')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.serve:
+        serve(args)
+        return
+    if args.users < args.concurrency * 2:
+        parser.error('--users must be at least twice --concurrency (login users + role-change targets)')
+
+    process = None
+    if args.url:
+        setup_django()
+        seeded = seed(args.users, args.sessions, args.seed)
+        base_url = args.url.rstrip('/')
+    else:
+        process, base_url, seeded = start_server(args)
+    try:
+        result = run_load(args, base_url, seeded)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_report(result)
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,458 @@
+"""
+Microbenchmark cho các hot path xác thực / validate: get_current_user, các
+decorator trong accounts/decorators.py, User.authenticate, User.create_user,
+validate form, tuần tự hóa JSON của api_user_list / api_get_profile và render
+home / dashboard / admin dashboard (``render.*``: có cache, không có fragment
+cache, không có cached template loader).
+
+Mỗi benchmark: chạy warmup, hiệu chỉnh số vòng lặp cho mỗi lần đo, lặp lại
+``--repeat`` lần rồi so sánh với baseline bằng kiểm định Mann-Whitney U.
+Benchmark chậm hơn baseline quá ``--threshold`` và có ý nghĩa thống kê
+làm lệnh thoát với mã 1.
+
+    # tạo baseline (trên cùng máy sẽ dùng để so sánh)
+    python benchmarks/microbench.py --save-baseline
+
+    # so sánh với baseline, lỗi nếu chậm hơn 10%
+    python benchmarks/microbench.py --threshold 10
+
+Mặc định dùng mongomock (MONGODB_TARGET=mock) để kết quả chỉ phản ánh code
+Python; MONGODB_TARGET=local đo cả round trip tới mongod trên máy.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = BASE_DIR / 'benchmarks' / 'results' / 'microbench_baseline.json'
+
+BENCH_PASSWORD = 'Bench@Password2024'
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Đăng ký hàm setup; hàm trả về callable không tham số cần đo"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def setup_django():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('MONGODB_TARGET', 'mock')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'REHEARTEN.settings_bench')
+    os.environ.setdefault('MONGO_SLOW_QUERY_ENABLED', 'False')
+    import django
+    django.setup()
+
+
+# ---------------------------------------------------------------- fixtures
+
+class Fixtures:
+    """Dữ liệu dùng chung: một admin, một user thường và ``users`` user để liệt kê"""
+
+    def __init__(self, users=200):
+        from django.contrib.auth.hashers import make_password
+        from accounts.models import User, UserSession
+
+        User.objects(username__startswith='mb_').delete()
+        UserSession.objects(user__startswith='mb_').delete()
+        password = make_password(BENCH_PASSWORD)
+        User._get_collection().insert_many([
+            User(username=f'mb_user_{i:05d}', email=f'mb_user_{i:05d}@bench.rehearten.local',
+                 first_name='Minh', last_name='Nguyễn', password=password, role='user').to_mongo()
+            for i in range(users)
+        ])
+        self.admin = User(username='mb_admin', email='mb_admin@bench.rehearten.local',
+                          first_name='Lan', last_name='Trần', password=password, role='admin',
+                          permissions=['manage_users'])
+        self.admin.save()
+        self.user = User.objects.get(username='mb_user_00000')
+        self.sessions = {}
+        for user in (self.admin, self.user):
+            session = UserSession(user=user.username, session_key=f'mb-session-{user.username}')
+            session.save()
+            self.sessions[user.username] = session.session_key
+        self.created = 0
+
+    def request(self, user=None, method='get', path='/', data=None, **extra):
+        from django.conf import settings
+        from django.test import RequestFactory
+        from importlib import import_module
+
+        request = getattr(RequestFactory(), method)(path, data or {}, **extra)
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        if user is not None:
+            request.session.update({
+                'user_id': str(user.id),
+                'username': user.username,
+                'role': user.role,
+                'session_key': self.sessions[user.username],
+                'is_authenticated': True,
+            })
+        return request
+
+
+def _ok_view(request, *args, **kwargs):
+    return None
+
+
+# ---------------------------------------------------------------- benchmarks
+
+@benchmark('get_current_user')
+def bench_get_current_user(fixtures):
+    from accounts.utils import get_current_user
+
+    request = fixtures.request(fixtures.user)
+    return lambda: get_current_user(request)
+
+
+@benchmark('get_current_user.anonymous')
+def bench_get_current_user_anonymous(fixtures):
+    from accounts.utils import get_current_user
+
+    request = fixtures.request()
+    return lambda: get_current_user(request)
+
+
+def _decorated(decorator, fixtures):
+    view = decorator(_ok_view)
+    request = fixtures.request(fixtures.admin)
+    return lambda: view(request)
+
+
+@benchmark('decorators.login_required')
+def bench_login_required(fixtures):
+    from accounts.decorators import login_required
+    return _decorated(login_required, fixtures)
+
+
+@benchmark('decorators.role_required')
+def bench_role_required(fixtures):
+    from accounts.decorators import role_required
+    return _decorated(role_required('admin', 'user'), fixtures)
+
+
+@benchmark('decorators.admin_required')
+def bench_admin_required(fixtures):
+    from accounts.decorators import admin_required
+    return _decorated(admin_required, fixtures)
+
+
+@benchmark('decorators.user_required')
+def bench_user_required(fixtures):
+    from accounts.decorators import user_required
+    return _decorated(user_required, fixtures)
+
+
+@benchmark('decorators.permission_required')
+def bench_permission_required(fixtures):
+    from accounts.decorators import permission_required
+    return _decorated(permission_required('manage_users'), fixtures)
+
+
+@benchmark('decorators.api_login_required')
+def bench_api_login_required(fixtures):
+    from accounts.decorators import api_login_required
+    return _decorated(api_login_required, fixtures)
+
+
+@benchmark('decorators.api_admin_required')
+def bench_api_admin_required(fixtures):
+    from accounts.decorators import api_admin_required
+    return _decorated(api_admin_required, fixtures)
+
+
+@benchmark('decorators.api_role_required')
+def bench_api_role_required(fixtures):
+    from accounts.decorators import api_role_required
+    return _decorated(api_role_required('admin'), fixtures)
+
+
+@benchmark('decorators.api_session_admin_required')
+def bench_api_session_admin_required(fixtures):
+    from accounts.decorators import api_session_admin_required
+    return _decorated(api_session_admin_required, fixtures)
+
+
+@benchmark('User.authenticate')
+def bench_authenticate(fixtures):
+    from accounts.models import User
+    return lambda: User.authenticate(fixtures.user.username, BENCH_PASSWORD)
+
+
+@benchmark('User.create_user')
+def bench_create_user(fixtures):
+    from accounts.models import User
+
+    def create():
+        fixtures.created += 1
+        username = f'mb_new_{os.getpid()}_{fixtures.created}'
+        return User.create_user(username, f'{username}@bench.rehearten.local', 'Hải', 'Phạm', BENCH_PASSWORD)
+    return create
+
+
+@benchmark('forms.LoginForm')
+def bench_login_form(fixtures):
+    from accounts.forms import LoginForm
+
+    data = {'username': fixtures.user.username, 'password': BENCH_PASSWORD}
+    return lambda: LoginForm(data).is_valid()
+
+
+@benchmark('forms.CustomUserCreationForm')
+def bench_user_creation_form(fixtures):
+    from accounts.forms import CustomUserCreationForm
+
+    data = {
+        'username': 'mb_candidate', 'email': 'mb_candidate@bench.rehearten.local',
+        'first_name': 'Thảo', 'last_name': 'Lê', 'role': 'user',
+        'password1': BENCH_PASSWORD, 'password2': BENCH_PASSWORD,
+    }
+    return lambda: CustomUserCreationForm(fixtures.admin, data).is_valid()
+
+
+@benchmark('forms.PasswordChangeForm')
+def bench_password_change_form(fixtures):
+    from accounts.forms import PasswordChangeForm
+
+    data = {'current_password': BENCH_PASSWORD, 'new_password1': 'NewBench2025', 'new_password2': 'NewBench2025'}
+    return lambda: PasswordChangeForm(fixtures.user, data).is_valid()
+
+
+@benchmark('views.api_user_list')
+def bench_api_user_list(fixtures):
+    from accounts import views
+
+    request = fixtures.request(fixtures.admin, path='/api/users/')
+    return lambda: views.api_user_list(request)
+
+
+@benchmark('views.api_get_profile')
+def bench_api_get_profile(fixtures):
+    from accounts import views
+
+    request = fixtures.request(fixtures.user, path='/api/get-profile/')
+    return lambda: views.api_get_profile(request)
+
+
+def _render(fixtures, view_name, user, path, warm=True):
+    """Render view HTML; warm=False xóa fragment cache / template cache trước mỗi lần gọi"""
+    from django.core.cache import caches
+    from django.template import engines
+    from accounts import views
+
+    view = getattr(views, view_name)
+    request = fixtures.request(user, path=path)
+    fragments = caches['fragments']
+    loaders = engines['django'].engine.template_loaders
+
+    def render():
+        if warm == 'no_template_cache':
+            for loader in loaders:
+                loader.reset()
+        if warm is not True:
+            fragments.clear()
+        return view(request)
+    return render
+
+
+@benchmark('render.home.admin')
+def bench_render_home(fixtures):
+    return _render(fixtures, 'home_view', fixtures.admin, '/')
+
+
+@benchmark('render.home.admin.no_fragment_cache')
+def bench_render_home_cold(fixtures):
+    return _render(fixtures, 'home_view', fixtures.admin, '/', warm=False)
+
+
+@benchmark('render.dashboard.user')
+def bench_render_dashboard(fixtures):
+    return _render(fixtures, 'dashboard_view', fixtures.user, '/dashboard/')
+
+
+@benchmark('render.admin_dashboard')
+def bench_render_admin_dashboard(fixtures):
+    return _render(fixtures, 'admin_dashboard_view', fixtures.admin, '/admin-dashboard/')
+
+
+@benchmark('render.admin_dashboard.no_fragment_cache')
+def bench_render_admin_dashboard_cold(fixtures):
+    return _render(fixtures, 'admin_dashboard_view', fixtures.admin, '/admin-dashboard/', warm=False)
+
+
+@benchmark('render.admin_dashboard.no_template_cache')
+def bench_render_admin_dashboard_uncached(fixtures):
+    return _render(fixtures, 'admin_dashboard_view', fixtures.admin, '/admin-dashboard/', warm='no_template_cache')
+
+
+# ---------------------------------------------------------------- runner
+
+def measure(func, repeat, warmup, min_time):
+    """Trả về (loops, danh sách thời gian mỗi lần gọi tính bằng µs)"""
+    started = time.perf_counter()
+    func()
+    estimate = max(time.perf_counter() - started, 1e-7)
+    loops = max(1, int(min_time / estimate))
+
+    for _ in range(warmup):
+        for _ in range(loops):
+            func()
+
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            for _ in range(loops):
+                func()
+            samples.append((time.perf_counter_ns() - started) / loops / 1000.0)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return loops, samples
+
+
+def mann_whitney_p(a, b):
+    """Two-sided p-value of the Mann-Whitney U test (normal approximation, tie-corrected)"""
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return 1.0
+    ranked = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(ranked)
+    tie_term = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        i = j + 1
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0)
+    u = rank_sum - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2.0) - 0.5) / math.sqrt(variance)
+    return math.erfc(max(z, 0.0) / math.sqrt(2))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    setup_django()
+    from accounts import monitoring
+
+    fixtures = Fixtures(users=args.users)
+    results = {}
+    with monitoring.suppress():
+        for name, setup in BENCHMARKS.items():
+            if args.filter and not any(pattern in name for pattern in args.filter):
+                continue
+            loops, samples = measure(setup(fixtures), args.repeat, args.warmup, args.min_time)
+            results[name] = {
+                'loops': loops,
+                'median_us': round(statistics.median(samples), 3),
+                'mean_us': round(statistics.fmean(samples), 3),
+                'stdev_us': round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+                'min_us': round(min(samples), 3),
+                'samples_us': [round(value, 3) for value in samples],
+            }
+            print(f'  {name:<42}{results[name]["median_us"]:>14.1f} µs', file=sys.stderr)
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'target': os.getenv('MONGODB_TARGET'),
+            'users': args.users,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(current, baseline, threshold, alpha):
+    """In bảng so sánh; trả về danh sách benchmark bị chậm đi"""
+    regressions = []
+    print(f"{'benchmark':<42}{'baseline µs':>14}{'current µs':>14}{'change':>10}{'p':>9}  status")
+    for name, result in current['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if not old:
+            print(f"{name:<42}{'-':>14}{result['median_us']:>14.1f}{'-':>10}{'-':>9}  new")
+            continue
+        change = (result['median_us'] - old['median_us']) / old['median_us'] * 100
+        p_value = mann_whitney_p(old['samples_us'], result['samples_us'])
+        status = 'ok'
+        if p_value < alpha and change > threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif p_value < alpha and change < -threshold:
+            status = 'faster'
+        print(f"{name:<42}{old['median_us']:>14.1f}{result['median_us']:>14.1f}{change:>+9.1f}%{p_value:>9.4f}  {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ReHearten auth/validation microbenchmarks')
+    parser.add_argument('--repeat', type=int, default=15, help='Số lần đo mỗi benchmark')
+    parser.add_argument('--warmup', type=int, default=2, help='Số lần chạy bỏ qua trước khi đo')
+    parser.add_argument('--min-time', type=float, default=0.1, help='Thời gian tối thiểu cho mỗi lần đo (giây)')
+    parser.add_argument('--users', type=int, default=200, help='Số user có sẵn cho api_user_list')
+    parser.add_argument('--filter', '-k', nargs='*', help='Chỉ chạy benchmark có tên chứa chuỗi này')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='File baseline JSON')
+    parser.add_argument('--save-baseline', action='store_true', help='Ghi kết quả lần chạy này làm baseline')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Ngưỡng chậm đi (%%) bị coi là regression')
+    parser.add_argument('--alpha', type=float, default=0.01, help='Mức ý nghĩa của kiểm định')
+    parser.add_argument('--output', '-o', help='Ghi kết quả JSON ra file')
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f'Baseline saved to {baseline_path}')
+        return 0
+    if not baseline_path.exists():
+        print(f'No baseline at {baseline_path} - run with --save-baseline first')
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold, args.alpha)
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) over {args.threshold:g}%: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())